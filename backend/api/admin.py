@@ -0,0 +1,155 @@
+"""
+Business: Админские маршруты: выгрузка пользователей и видео, удаление (фоновыми задачами purge), статистика пула и маршрутов
+Args: Request из router с queryStringParameters
+Returns: HTTP response dict
+"""
+
+import io
+import os
+import time
+from typing import Dict, Any, Optional
+
+from cache import streams_cache, trending_cache
+from counters import counters
+from db import pool_stats
+from jsonstream import RowEncoder, open_server_cursor
+import purge
+from router import HttpError, Request, response
+import session
+from views import views
+
+PURGE_INLINE_SECONDS = float(os.environ.get('PURGE_INLINE_SECONDS', '2'))
+ADMIN_PAGE_DEFAULT = 1000
+ADMIN_PAGE_MAX = 10000
+
+ADMIN_USERS = RowEncoder(('id', 'username', 'display_name', 'email', 'subscriber_count', 'is_verified'))
+ADMIN_VIDEOS = RowEncoder(('stream_id', 'title', 'user_id', 'view_count', 'like_count'))
+
+def start_purge(request: Request, kind: str, target_id: Optional[int] = None) -> Dict[str, Any]:
+    # Небольшой пользователь удаляется прямо в запросе за PURGE_INLINE_SECONDS; остальное доделывает
+    # `python purge.py` пачками, не держа блокировки на всю таблицу
+    conn = request.db()
+    job_id = purge.enqueue(conn, kind, target_id)
+    worker_id = f'request:{os.getpid()}:{job_id}'
+    job = purge.claim(conn, worker_id, job_id)
+    state = purge.run(conn, job, worker_id, deadline=time.monotonic() + PURGE_INLINE_SECONDS) if job else 'running'
+    streams_cache.clear()
+    trending_cache.clear()
+
+    deleted = purge.status(conn, job_id)['deleted']
+    return response(200 if state == 'done' else 202, {
+        'success': True,
+        'job_id': job_id,
+        'status': state,
+        'deleted': deleted,
+        'deleted_count': deleted.get('streams' if kind == 'videos' else 'users', 0),
+    })
+
+def admin_listing(request: Request, key: str, query: str, encoder: RowEncoder) -> Dict[str, Any]:
+    ndjson = request.query.get('format') == 'ndjson'
+    try:
+        after_id = int(request.query.get('after_id') or 0)
+        limit = min(max(int(request.query.get('limit') or ADMIN_PAGE_DEFAULT), 1), ADMIN_PAGE_MAX)
+    except ValueError:
+        raise HttpError(400, 'after_id and limit must be integers')
+
+    # Облачная функция отдаёт тело одной строкой, поэтому здесь выгрузка идёт страницами не больше ADMIN_PAGE_MAX:
+    # клиент продолжает с after_id из X-Next-After-Id, пока заголовок есть. Потоковая выгрузка всей таблицы
+    # без страниц - GET /admin/export в backend/realtime
+    last = [after_id, 0]
+
+    def track(rows):
+        for row in rows:
+            last[0] = row[0]
+            last[1] += 1
+            yield row
+
+    body = io.StringIO()
+    cur = open_server_cursor(request.db(), f'admin_{key}', query + " LIMIT %s", (after_id, limit))
+    for chunk in encoder.encode_chunks(track(cur), key=None if ndjson else key, ndjson=ndjson):
+        body.write(chunk)
+    cur.close()
+
+    headers = {'Access-Control-Expose-Headers': 'X-Next-After-Id'}
+    if ndjson:
+        headers['Content-Type'] = 'application/x-ndjson'
+    if last[1] == limit:
+        headers['X-Next-After-Id'] = str(last[0])
+    return response(200, headers=headers, body=body.getvalue())
+
+# GET /?action=get_users[&after_id=N&limit=M&format=ndjson] - admin: страница пользователей, следующая - по X-Next-After-Id
+def get_users(request: Request) -> Dict[str, Any]:
+    return admin_listing(request, 'users', """
+        SELECT id, username, display_name, email, subscriber_count, is_verified
+        FROM users WHERE id > %s ORDER BY id ASC
+    """, ADMIN_USERS)
+
+# GET /?action=get_videos[&after_id=N&limit=M&format=ndjson] - admin: страница видео, следующая - по X-Next-After-Id
+def get_videos(request: Request) -> Dict[str, Any]:
+    return admin_listing(request, 'videos', """
+        SELECT id, title, user_id, view_count, like_count
+        FROM streams WHERE id > %s ORDER BY id ASC
+    """, ADMIN_VIDEOS)
+
+# DELETE /?action=delete_user&user_id=X - admin: удалить пользователя со всеми данными (фоновая задача)
+def delete_user(request: Request) -> Dict[str, Any]:
+    try:
+        user_id = int(request.query.get('user_id') or 0)
+    except ValueError:
+        user_id = 0
+
+    if not user_id:
+        raise HttpError(400, 'user_id required')
+
+    return start_purge(request, 'user', user_id)
+
+# DELETE /?action=delete_video&video_id=X - admin: удалить видео
+def delete_video(request: Request) -> Dict[str, Any]:
+    video_id = request.query.get('video_id')
+
+    if not video_id:
+        raise HttpError(400, 'video_id required')
+
+    conn = request.db()
+    cur = conn.cursor()
+
+    cur.execute("DELETE FROM like_keys WHERE stream_id = %s", (video_id,))
+    cur.execute("DELETE FROM likes WHERE stream_id = %s", (video_id,))
+    cur.execute("DELETE FROM streams WHERE id = %s", (video_id,))
+
+    conn.commit()
+    streams_cache.clear()
+    trending_cache.clear()
+    cur.close()
+
+    return response(200, {'success': True})
+
+# DELETE /?action=clear_users - admin: удалить всех пользователей (фоновая задача)
+def clear_users(request: Request) -> Dict[str, Any]:
+    return start_purge(request, 'users')
+
+# DELETE /?action=clear_videos - admin: удалить все видео (фоновая задача)
+def clear_videos(request: Request) -> Dict[str, Any]:
+    return start_purge(request, 'videos')
+
+# GET /?action=purge_status&job_id=X - admin: прогресс задачи удаления
+def purge_status(request: Request) -> Dict[str, Any]:
+    try:
+        job_id = int(request.query.get('job_id') or 0)
+    except ValueError:
+        job_id = 0
+
+    if not job_id:
+        raise HttpError(400, 'job_id required')
+
+    job = purge.status(request.db(), job_id)
+    if job is None:
+        raise HttpError(404, 'Job not found')
+    return response(200, job)
+
+# GET /?action=pool_stats - admin: статистика пула соединений, буферов и маршрутов
+def get_pool_stats(request: Request) -> Dict[str, Any]:
+    return response(200, {
+        **pool_stats(), 'counters': counters.stats(), 'views': views.stats(),
+        'sessions': session.revocations.stats(), **request.router.stats(),
+    })
@@ -0,0 +1,81 @@
+"""
+Business: Приём событий просмотра и аналитика канала из почасовых агрегатов
+Args: Request из router; токен сессии (Authorization: Bearer) для просмотров авторизованных зрителей
+Returns: HTTP response dict
+"""
+
+import json
+from typing import Dict, Any
+
+from cache import channel_stats_cache
+from router import HttpError, Request, response
+import tracing
+from views import EVENTS_MAX, views
+
+CHANNEL_STATS_MAX_AGE = 60
+
+# range -> (глубина периода, шаг по умолчанию)
+CHANNEL_STATS_RANGES = {
+    '24h': ('24 hours', 'hour'),
+    '7d': ('7 days', 'day'),
+    '30d': ('30 days', 'day'),
+    '90d': ('90 days', 'day'),
+}
+CHANNEL_STATS_BUCKETS = ('hour', 'day')
+
+# POST /?action=view - пачка событий просмотра [{stream_id, type: view|heartbeat, session_id, watch_seconds, position}]
+def ingest_views(request: Request) -> Dict[str, Any]:
+    try:
+        parsed = views.parse(request.body.get('events', request.body), request.user_id)
+    except (AttributeError, KeyError, TypeError, ValueError):
+        raise HttpError(400, f'events must be a list of 1..{EVENTS_MAX} events with stream_id and session_id')
+
+    conn = request.db()
+    counted = views.ingest(conn, parsed)
+    # Стейджинг переносится в view_count и почасовую аналитику пачкой раз в VIEW_ROLLUP_INTERVAL
+    views.maybe_rollup(conn)
+
+    return response(202, {'success': True, 'accepted': len(parsed), 'counted': counted})
+
+# GET /?action=channel_stats&user_id=X&range=24h|7d|30d|90d&bucket=hour|day - аналитика канала из почасовых агрегатов
+def channel_stats(request: Request) -> Dict[str, Any]:
+    range_name = request.query.get('range') or '7d'
+    bucket = request.query.get('bucket')
+    try:
+        user_id = int(request.query.get('user_id') or 0)
+    except ValueError:
+        user_id = 0
+    if not user_id or range_name not in CHANNEL_STATS_RANGES or (bucket and bucket not in CHANNEL_STATS_BUCKETS):
+        raise HttpError(400, f'user_id required, range one of {", ".join(CHANNEL_STATS_RANGES)}, bucket one of {", ".join(CHANNEL_STATS_BUCKETS)}')
+
+    period, default_bucket = CHANNEL_STATS_RANGES[range_name]
+    bucket = bucket or default_bucket
+    cache_key = (user_id, range_name, bucket)
+    body = channel_stats_cache.get(cache_key)
+    if body is None:
+        cur = request.db().cursor()
+        # Не больше 24 * 90 строк из PK (channel_id, hour), сколько бы ни было лайков и просмотров
+        cur.execute("""
+            SELECT date_trunc(%s, hour) AS bucket, sum(views), sum(likes), sum(new_subscribers), sum(watch_seconds)
+            FROM channel_stats_hourly
+            WHERE channel_id = %s AND hour >= date_trunc('hour', NOW()) - %s::interval
+            GROUP BY 1
+            ORDER BY 1
+        """, (bucket, user_id, period))
+        rows = cur.fetchall()
+        cur.close()
+        buckets = [
+            {'at': at.isoformat(), 'views': viewed, 'likes': likes, 'new_subscribers': subscribers,
+             'watch_seconds': round(watch_seconds or 0, 1)}
+            for at, viewed, likes, subscribers, watch_seconds in rows
+        ]
+        totals = {
+            key: sum(b[key] for b in buckets)
+            for key in ('views', 'likes', 'new_subscribers', 'watch_seconds')
+        }
+        with tracing.span('serialize'):
+            body = json.dumps({'user_id': user_id, 'range': range_name, 'bucket': bucket,
+                               'buckets': buckets, 'totals': totals})
+        channel_stats_cache.set(cache_key, body)
+
+    return response(200, headers={'Cache-Control': f'public, max-age={CHANNEL_STATS_MAX_AGE}'}, body=body)
@@ -0,0 +1,127 @@
+"""
+Business: Регистрация, вход и выход пользователей
+Args: Request из router с телом {username, email, password, display_name}
+Returns: HTTP response dict с данными пользователя и токеном сессии
+"""
+
+from typing import Dict, Any
+from psycopg2 import errors
+from psycopg2.extras import RealDictCursor
+
+import session
+from passwords import hash_password, needs_rehash, verify_password
+from router import HttpError, Request, response
+
+# Имя ограничения UNIQUE из V0001 -> сообщение для поля формы
+UNIQUE_ERRORS = {
+    'users_email_key': 'Email уже используется',
+    'users_username_key': 'Имя пользователя уже занято',
+}
+
+def _issue_token(conn, user_id: int) -> Dict[str, Any]:
+    # Токен выдаётся до коммита: без SESSION_SECRET регистрация откатывается целиком, а не
+    # оставляет пользователя, повторная регистрация которого упрётся в «Email уже используется»
+    try:
+        return session.issue(user_id)
+    except session.SessionError:
+        conn.rollback()
+        raise HttpError(503, 'Вход временно недоступен')
+
+# POST /?action=register - регистрация нового пользователя
+def register(request: Request) -> Dict[str, Any]:
+    body_data = request.body
+    username = body_data.get('username', '').strip()
+    email = body_data.get('email', '').strip()
+    password = body_data.get('password', '').strip()
+    display_name = body_data.get('display_name', '').strip()
+
+    if not all([username, email, password, display_name]):
+        raise HttpError(400, 'Заполните все поля')
+
+    if len(username) < 3:
+        raise HttpError(400, 'Имя пользователя должно быть не менее 3 символов')
+
+    # login различает email и имя по '@', поэтому в имени он запрещён
+    if '@' in username:
+        raise HttpError(400, 'Имя пользователя не может содержать @')
+
+    if len(password) < 6:
+        raise HttpError(400, 'Пароль должен быть не менее 6 символов')
+
+    avatar_url = f"https://api.dicebear.com/7.x/avataaars/svg?seed={username}"
+    password_hash = hash_password(password)
+
+    # Один INSERT без предварительных SELECT: уникальность проверяет сама БД, и две одновременные
+    # регистрации с одним email не проскочат между проверкой и вставкой
+    conn = request.db()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cur.execute("""
+            INSERT INTO users (username, email, password, display_name, avatar_url, bio, subscriber_count, is_verified)
+            VALUES (%s, %s, %s, %s, %s, %s, 0, false)
+            RETURNING id, username, email, display_name, avatar_url, is_verified, subscriber_count
+        """, (username, email, password_hash, display_name, avatar_url, 'Новый стример'))
+    except errors.UniqueViolation as e:
+        conn.rollback()
+        cur.close()
+        raise HttpError(400, UNIQUE_ERRORS.get(e.diag.constraint_name, 'Пользователь уже существует'))
+
+    user = cur.fetchone()
+    token = _issue_token(conn, user['id'])
+    conn.commit()
+    cur.close()
+
+    return response(201, {**user, 'token': token['token'], 'expires_at': token['expires_at']})
+
+# POST /?action=login - вход пользователя
+def login(request: Request) -> Dict[str, Any]:
+    username = request.body.get('username', '').strip()
+    password = request.body.get('password', '').strip()
+
+    if not all([username, password]):
+        raise HttpError(400, 'Заполните все поля')
+
+    # Один индексный поиск вместо OR по двум колонкам; пароль сверяется в пуле KDF, не в SQL
+    column = 'email' if '@' in username else 'username'
+    query = f"""
+        SELECT id, username, email, display_name, avatar_url, is_verified, subscriber_count, password
+        FROM users
+        WHERE {column} = %s
+    """
+    cur = request.db().cursor(cursor_factory=RealDictCursor)
+    cur.execute(query, (username,))
+    user = cur.fetchone()
+    cur.close()
+
+    # Только что зарегистрированного пользователя реплика может ещё не знать
+    if user is None and request.on_replica:
+        cur = request.primary().cursor(cursor_factory=RealDictCursor)
+        cur.execute(query, (username,))
+        user = cur.fetchone()
+        cur.close()
+
+    stored = user.pop('password') if user else None
+
+    if not verify_password(password, stored):
+        raise HttpError(401, 'Неверные данные для входа')
+
+    token = _issue_token(request.db(), user['id'])
+
+    # Открытые пароли и хеши со старыми параметрами обновляются при входе
+    if needs_rehash(stored):
+        conn = request.primary()
+        cur = conn.cursor()
+        cur.execute("UPDATE users SET password = %s WHERE id = %s", (hash_password(password), user['id']))
+        conn.commit()
+        cur.close()
+
+    return response(200, {**user, 'token': token['token'], 'expires_at': token['expires_at']})
+
+# POST /?action=logout - отзыв текущего токена
+def logout(request: Request) -> Dict[str, Any]:
+    claims = request.claims
+    if claims is None:
+        raise HttpError(401, 'Требуется авторизация')
+
+    session.revocations.revoke(request.db(), claims)
+    return response(200, {'success': True})
@@ -0,0 +1,71 @@
+"""
+Business: In-memory TTL+LRU кэш готовых ответов, живущий между тёплыми вызовами функции
+Args: STREAMS_CACHE_TTL, STREAMS_CACHE_SIZE из окружения
+Returns: экземпляры TTLCache для горячих эндпоинтов
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class TTLCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] <= now:
+                if item is not None:
+                    del self._data[key]
+                self._stats['misses'] += 1
+                return None
+            self._data.move_to_end(key)
+            self._stats['hits'] += 1
+            return item[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._stats['invalidations'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, 'size': len(self._data), 'max_size': self.max_size, 'ttl': self.ttl}
+
+
+# Лента стримов: ключ (category, is_live, cursor, limit) -> (body, next_cursor).
+# Записи из функций upload-video и streaming живут в других инстансах и сюда
+# не дотягиваются, поэтому TTL держим коротким - он ограничивает их задержку в ленте.
+streams_cache = TTLCache(
+    max_size=int(os.environ.get('STREAMS_CACHE_SIZE', '256')),
+    ttl=float(os.environ.get('STREAMS_CACHE_TTL', '5')),
+)
+
+# Топ трендов: ключ (category, limit) -> body. Счётчики и так доезжают пачками раз в flush
+trending_cache = TTLCache(
+    max_size=int(os.environ.get('TRENDING_CACHE_SIZE', '64')),
+    ttl=float(os.environ.get('TRENDING_CACHE_TTL', '15')),
+)
+
+# Аналитика канала: ключ (user_id, range, bucket) -> body. Агрегаты почасовые, минутный TTL ничего не теряет
+channel_stats_cache = TTLCache(
+    max_size=int(os.environ.get('CHANNEL_STATS_CACHE_SIZE', '256')),
+    ttl=float(os.environ.get('CHANNEL_STATS_CACHE_TTL', '60')),
+)
@@ -0,0 +1,308 @@
+"""
+Business: Каталог: лента стримов, тренды, лента подписок, поиск, автодополнение и создание стрима
+Args: Request из router с queryStringParameters и телом запроса
+Returns: HTTP response dict
+"""
+
+import base64
+from datetime import datetime
+from typing import Dict, Any, Tuple
+from psycopg2.extras import RealDictCursor
+
+from cache import streams_cache, trending_cache
+from counters import counters
+from jsonstream import RowEncoder, dumps
+from router import HttpError, Request, response
+import tracing
+
+STREAMS_PAGE_MAX = 100
+FEED_PAGE_MAX = 50
+TRENDING_MAX = 100
+SEARCH_PAGE_MAX = 50
+SUGGEST_MAX = 10
+
+# Только поля, которые нужны карточке видео и странице просмотра
+STREAM_CARD_COLUMNS = """
+    s.id, s.user_id, s.title, s.description, s.category, s.thumbnail_url, s.video_url,
+    s.duration, s.is_live, s.view_count, s.like_count, s.started_at, s.created_at,
+    u.username, u.display_name, u.avatar_url, u.is_verified, u.subscriber_count
+"""
+STREAM_CARD_FIELDS = tuple(column.strip().split('.')[-1] for column in STREAM_CARD_COLUMNS.split(','))
+CHANNEL_CARD_FIELDS = ('id', 'username', 'display_name', 'avatar_url', 'is_verified', 'subscriber_count')
+
+# Строки читаются обычным курсором как tuple и кодируются по раскладке, без RealDictCursor
+STREAM_CARD = RowEncoder(STREAM_CARD_FIELDS)
+TRENDING_CARD = RowEncoder(STREAM_CARD_FIELDS + ('hot_score',))
+SEARCH_STREAM_CARD = RowEncoder(STREAM_CARD_FIELDS + ('rank',))
+SEARCH_CHANNEL_CARD = RowEncoder(CHANNEL_CARD_FIELDS + ('rank',))
+CARD_ID = STREAM_CARD.positions['id']
+CARD_CREATED_AT = STREAM_CARD.positions['created_at']
+
+def encode_cursor(created_at: datetime, stream_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{stream_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, stream_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(stream_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError('invalid cursor') from e
+
+def page_headers(next_cursor: Any) -> Dict[str, str]:
+    headers = {'Access-Control-Expose-Headers': 'X-Next-Cursor'}
+    if next_cursor:
+        headers['X-Next-Cursor'] = next_cursor
+    return headers
+
+# GET /?action=streams&cursor=...&limit=N - лента стримов и видео с keyset-пагинацией
+def list_streams(request: Request) -> Dict[str, Any]:
+    query_params = request.query
+    category = query_params.get('category')
+    if category == 'Все':
+        category = None
+    is_live = query_params.get('is_live')
+    if is_live not in ('true', 'false'):
+        is_live = None
+    cursor = query_params.get('cursor') or None
+
+    try:
+        limit = min(max(int(query_params.get('limit') or STREAMS_PAGE_MAX), 1), STREAMS_PAGE_MAX)
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HttpError(400, 'invalid cursor or limit')
+
+    cache_key = (category, is_live, cursor, limit)
+    cached = streams_cache.get(cache_key)
+    if cached is None:
+        conditions = []
+        params: list = []
+        if category:
+            conditions.append("s.category = %s")
+            params.append(category)
+        if is_live:
+            conditions.append("s.is_live = %s")
+            params.append(is_live == 'true')
+        if after:
+            conditions.append("(s.created_at, s.id) < (%s, %s)")
+            params.extend(after)
+
+        query = f"""
+            SELECT {STREAM_CARD_COLUMNS}
+            FROM streams s
+            JOIN users u ON s.user_id = u.id
+            {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+            ORDER BY s.created_at DESC, s.id DESC
+            LIMIT %s
+        """
+        params.append(limit + 1)
+
+        # Буфер лайков сбрасывается в primary, сама выборка может идти с реплики
+        counters.maybe_flush(request.primary)
+        cur = request.db().cursor()
+        cur.execute(query, params)
+        streams = cur.fetchall()
+        cur.close()
+
+        next_cursor = None
+        if len(streams) > limit:
+            streams = streams[:limit]
+            next_cursor = encode_cursor(streams[-1][CARD_CREATED_AT], streams[-1][CARD_ID])
+
+        with tracing.span('serialize'):
+            cached = (STREAM_CARD.encode(streams), next_cursor)
+        streams_cache.set(cache_key, cached)
+
+    body, next_cursor = cached
+    return response(200, headers=page_headers(next_cursor), body=body)
+
+# GET /?action=trending&category=...&limit=N - топ по hot_score через индекс, без сортировки таблицы
+def trending(request: Request) -> Dict[str, Any]:
+    category = request.query.get('category')
+    if category == 'Все':
+        category = None
+    try:
+        limit = min(max(int(request.query.get('limit') or TRENDING_MAX), 1), TRENDING_MAX)
+    except ValueError:
+        limit = TRENDING_MAX
+
+    cache_key = (category, limit)
+    body = trending_cache.get(cache_key)
+    if body is None:
+        # Буфер лайков сбрасывается в primary, сама выборка может идти с реплики
+        counters.maybe_flush(request.primary)
+        cur = request.db().cursor()
+        cur.execute(f"""
+            SELECT {STREAM_CARD_COLUMNS}, s.hot_score
+            FROM streams s
+            JOIN users u ON s.user_id = u.id
+            {'WHERE s.category = %s' if category else ''}
+            ORDER BY s.hot_score DESC, s.id DESC
+            LIMIT %s
+        """, (category, limit) if category else (limit,))
+        streams = cur.fetchall()
+        cur.close()
+        with tracing.span('serialize'):
+            body = TRENDING_CARD.encode(streams)
+        trending_cache.set(cache_key, body)
+
+    return response(200, body=body)
+
+# GET /?action=feed&user_id=X&cursor=...&limit=N - лента каналов, на которые подписан пользователь
+def feed(request: Request) -> Dict[str, Any]:
+    query_params = request.query
+    try:
+        user_id = int(query_params.get('user_id') or 0)
+        limit = min(max(int(query_params.get('limit') or FEED_PAGE_MAX), 1), FEED_PAGE_MAX)
+        after = decode_cursor(query_params['cursor']) if query_params.get('cursor') else None
+    except ValueError:
+        user_id = 0
+
+    if not user_id:
+        raise HttpError(400, 'user_id required, cursor and limit must be valid')
+
+    # Мелкие каналы уже разложены в feed_items, крупные читаются по индексу (user_id, created_at)
+    keyset = "AND (created_at, stream_id) < (%s, %s)" if after else ""
+    big_keyset = "AND (created_at, id) < (%s, %s)" if after else ""
+    params = [user_id, *(after or ()), limit + 1, *(after or ()), limit + 1, user_id, limit + 1]
+
+    cur = request.db().cursor()
+    cur.execute(f"""
+        WITH items AS (
+            (SELECT stream_id, created_at
+             FROM feed_items
+             WHERE user_id = %s {keyset}
+             ORDER BY created_at DESC, stream_id DESC
+             LIMIT %s)
+            UNION
+            (SELECT big.id, big.created_at
+             FROM subscriptions sub
+             JOIN users c ON c.id = sub.channel_id AND c.subscriber_count >= feed_fanout_threshold()
+             CROSS JOIN LATERAL (
+                 SELECT id, created_at
+                 FROM streams
+                 WHERE user_id = sub.channel_id {big_keyset}
+                 ORDER BY created_at DESC, id DESC
+                 LIMIT %s
+             ) big
+             WHERE sub.subscriber_id = %s)
+        )
+        SELECT {STREAM_CARD_COLUMNS}
+        FROM items i
+        JOIN streams s ON s.id = i.stream_id
+        JOIN users u ON u.id = s.user_id
+        ORDER BY i.created_at DESC, i.stream_id DESC
+        LIMIT %s
+    """, params)
+    items = cur.fetchall()
+    cur.close()
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1][CARD_CREATED_AT], items[-1][CARD_ID])
+
+    with tracing.span('serialize'):
+        body = STREAM_CARD.encode(items)
+    return response(200, headers=page_headers(next_cursor), body=body)
+
+# GET /?action=search&q=...&page=N&limit=M - ранжированный полнотекстовый поиск по стримам и каналам
+def search(request: Request) -> Dict[str, Any]:
+    q = (request.query.get('q') or '').strip()
+    try:
+        limit = min(max(int(request.query.get('limit') or SEARCH_PAGE_MAX), 1), SEARCH_PAGE_MAX)
+        page = max(int(request.query.get('page') or 1), 1)
+    except ValueError:
+        q = ''
+
+    if not q:
+        raise HttpError(400, 'q required, page and limit must be integers')
+
+    offset = (page - 1) * limit
+    cur = request.db().cursor()
+    cur.execute(f"""
+        SELECT {STREAM_CARD_COLUMNS}, ts_rank_cd(s.search_tsv, q) AS rank
+        FROM streams s
+        JOIN users u ON s.user_id = u.id,
+             websearch_to_tsquery('russian', %s) q
+        WHERE s.search_tsv @@ q
+        ORDER BY rank DESC, s.id DESC
+        LIMIT %s OFFSET %s
+    """, (q, limit, offset))
+    streams = cur.fetchall()
+
+    cur.execute("""
+        SELECT u.id, u.username, u.display_name, u.avatar_url, u.is_verified, u.subscriber_count,
+               ts_rank_cd(u.search_tsv, q) AS rank
+        FROM users u,
+             websearch_to_tsquery('russian', %s) q
+        WHERE u.search_tsv @@ q
+        ORDER BY rank DESC, u.subscriber_count DESC
+        LIMIT %s OFFSET %s
+    """, (q, limit, offset))
+    channels = cur.fetchall()
+    cur.close()
+
+    with tracing.span('serialize'):
+        body = dumps({
+            'streams': SEARCH_STREAM_CARD.dicts(streams),
+            'channels': SEARCH_CHANNEL_CARD.dicts(channels),
+            'page': page,
+            'limit': limit
+        })
+    return response(200, body=body)
+
+# GET /?action=search_suggest&q=pre - префиксное автодополнение по названиям и каналам
+def search_suggest(request: Request) -> Dict[str, Any]:
+    q = (request.query.get('q') or '').strip().lower()
+    if len(q) < 2:
+        return response(200, {'suggestions': []})
+
+    prefix = q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    cur = request.db().cursor()
+    cur.execute("""
+        (SELECT 'stream' AS kind, id, title AS text, similarity(lower(title), %s) AS score
+         FROM streams WHERE lower(title) LIKE %s
+         ORDER BY score DESC LIMIT %s)
+        UNION ALL
+        (SELECT 'channel' AS kind, id, display_name AS text,
+                greatest(similarity(lower(username), %s), similarity(lower(display_name), %s)) AS score
+         FROM users WHERE lower(username) LIKE %s OR lower(display_name) LIKE %s
+         ORDER BY score DESC LIMIT %s)
+        ORDER BY score DESC
+        LIMIT %s
+    """, (q, prefix, SUGGEST_MAX, q, q, prefix, prefix, SUGGEST_MAX, SUGGEST_MAX))
+    rows = cur.fetchall()
+    cur.close()
+
+    return response(200, {'suggestions': [
+        {'kind': kind, 'id': row_id, 'text': text} for kind, row_id, text, _ in rows
+    ]})
+
+# POST /?action=create_stream - создать новый стрим
+def create_stream(request: Request) -> Dict[str, Any]:
+    user_id = request.require_user()
+    body_data = request.body
+    conn = request.db()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+
+    cur.execute("""
+        INSERT INTO streams (user_id, title, description, category, is_live, started_at)
+        VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+        RETURNING id, title, is_live
+    """, (
+        user_id,
+        body_data.get('title'),
+        body_data.get('description'),
+        body_data.get('category'),
+        body_data.get('is_live', True)
+    ))
+
+    stream = cur.fetchone()
+    conn.commit()
+    streams_cache.clear()
+    trending_cache.clear()
+    cur.close()
+
+    return response(201, dict(stream))
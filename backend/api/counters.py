@@ -0,0 +1,208 @@
+"""
+Business: Буфер счётчиков like_count, view_count и subscriber_count с пакетной записью в БД.
+          Дельты живут только в памяти экземпляра: если его заморозят или убьют до сброса, пропадёт то, что накоплено
+          с последнего удачного flush, - не больше COUNTER_FLUSH_SIZE строк, при живом трафике за COUNTER_FLUSH_INTERVAL
+          (плюс время, пока БД отвечала ошибкой, - см. flush_errors и строки counters: flush_failed в логе).
+          Сами лайки и подписки при этом записаны, поэтому like_count и subscriber_count восстанавливаются пересчётом
+Args: COUNTER_FLUSH_INTERVAL, COUNTER_FLUSH_SIZE из окружения; `python counters.py [--fix]` - сверка счётчиков с таблицами
+Returns: incr() для накопления дельт, maybe_flush()/flush() для записи одним UPDATE, recount() для сверки и исправления
+"""
+
+import argparse
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple
+from psycopg2.extras import execute_values
+
+from db import connection
+
+FLUSH_INTERVAL = float(os.environ.get('COUNTER_FLUSH_INTERVAL', '1'))
+FLUSH_SIZE = int(os.environ.get('COUNTER_FLUSH_SIZE', '500'))
+
+RECOUNT_BATCH = 10000
+
+# Разрешённые счётчики: (таблица, колонка). Имена подставляются в SQL, поэтому только из этого списка
+COUNTERS = {
+    ('streams', 'like_count'),
+    ('streams', 'view_count'),
+    ('users', 'subscriber_count'),
+}
+
+
+class CounterBuffer:
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL, flush_size: int = FLUSH_SIZE):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._deltas: Dict[Tuple[str, str], Dict[int, int]] = {}
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._stats = {'increments': 0, 'flushes': 0, 'rows_flushed': 0, 'flush_errors': 0}
+
+    def incr(self, table: str, column: str, row_id: int, delta: int = 1) -> None:
+        if (table, column) not in COUNTERS:
+            raise ValueError(f'Unknown counter {table}.{column}')
+        with self._lock:
+            bucket = self._deltas.setdefault((table, column), {})
+            if row_id not in bucket:
+                self._pending += 1
+            bucket[row_id] = bucket.get(row_id, 0) + delta
+            self._stats['increments'] += 1
+
+    def due(self) -> bool:
+        return self._pending >= self.flush_size or (
+            self._pending > 0 and time.monotonic() - self._last_flush >= self.flush_interval
+        )
+
+    def _take(self) -> Dict[Tuple[str, str], Dict[int, int]]:
+        with self._lock:
+            deltas, self._deltas = self._deltas, {}
+            self._pending = 0
+            self._last_flush = time.monotonic()
+            return deltas
+
+    def _restore(self, deltas: Dict[Tuple[str, str], Dict[int, int]]) -> None:
+        with self._lock:
+            for key, bucket in deltas.items():
+                target = self._deltas.setdefault(key, {})
+                for row_id, delta in bucket.items():
+                    if row_id not in target:
+                        self._pending += 1
+                    target[row_id] = target.get(row_id, 0) + delta
+
+    def flush(self, conn) -> int:
+        deltas = self._take()
+        rows: List[Tuple[str, str, List[Tuple[int, int]]]] = [
+            (table, column, [(row_id, delta) for row_id, delta in bucket.items() if delta])
+            for (table, column), bucket in deltas.items()
+        ]
+        rows = [r for r in rows if r[2]]
+        if not rows:
+            return 0
+        try:
+            cur = conn.cursor()
+            for table, column, values in rows:
+                # Одна строка на stream/channel: горячая строка блокируется один раз за flush
+                execute_values(cur, f"""
+                    UPDATE {table} AS t SET {column} = t.{column} + v.delta
+                    FROM (VALUES %s) AS v(id, delta)
+                    WHERE t.id = v.id
+                """, sorted(values), template='(%s::int, %s::int)', page_size=len(values))
+            conn.commit()
+            cur.close()
+        except Exception:
+            self._restore(deltas)
+            # На оборванном соединении rollback сам бросит исключение и спрячет исходную ошибку
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            raise
+        flushed = sum(len(values) for _, _, values in rows)
+        with self._lock:
+            self._stats['flushes'] += 1
+            self._stats['rows_flushed'] += flushed
+        return flushed
+
+    def maybe_flush(self, connect: Callable[[], Any]) -> int:
+        # Сброс по пути обработчика: лайк или подписка уже закоммичены, поэтому ошибка записи счётчиков
+        # (или соединения с primary) не превращает ответ в 500 - дельты остаются в буфере до следующего сброса
+        if not self.due():
+            return 0
+        try:
+            return self.flush(connect())
+        except Exception as e:
+            with self._lock:
+                self._stats['flush_errors'] += 1
+            _log('flush_failed', self._pending, e)
+            return 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, 'pending': self._pending}
+
+
+counters = CounterBuffer()
+
+# Счётчик -> запрос точного значения для пачки id. view_count сюда не входит: просмотры копятся в стейджинге
+# views.py, отдельного журнала, по которому их можно пересчитать, нет
+RECOUNTS = {
+    ('streams', 'like_count'): "SELECT count(*) FROM like_keys k WHERE k.stream_id = t.id",
+    ('users', 'subscriber_count'): "SELECT count(*) FROM subscriptions s WHERE s.channel_id = t.id",
+}
+
+
+def _log(event: str, pending: int, error: Exception) -> None:
+    sys.stdout.write(json.dumps({'counters': event, 'pending': pending, 'error': str(error)}, ensure_ascii=False) + '\n')
+    sys.stdout.flush()
+
+
+def recount(conn, counter: Tuple[str, str], fix: bool = False, batch: int = RECOUNT_BATCH) -> List[Tuple[int, int, int]]:
+    """Сверяет счётчик с таблицей пачками по id; возвращает (id, было, должно быть), при fix записывает точные значения."""
+    # Дельты, ещё не сброшенные живыми экземплярами, после fix добавятся сверху - исправлять лучше в тихое окно
+    table, column = counter
+    exact = RECOUNTS[counter]
+    drift: List[Tuple[int, int, int]] = []
+    after_id = 0
+    cur = conn.cursor()
+    while True:
+        cur.execute(f"SELECT id FROM {table} WHERE id > %s ORDER BY id LIMIT %s", (after_id, batch))
+        ids = [row[0] for row in cur.fetchall()]
+        if not ids:
+            break
+        after_id = ids[-1]
+        cur.execute(f"""
+            SELECT id, {column}, n FROM (
+                SELECT t.id, t.{column}, ({exact}) AS n FROM {table} t WHERE t.id = ANY(%s)
+            ) c WHERE {column} <> n
+        """, (ids,))
+        rows = cur.fetchall()
+        if fix and rows:
+            execute_values(cur, f"""
+                UPDATE {table} AS t SET {column} = v.n
+                FROM (VALUES %s) AS v(id, n)
+                WHERE t.id = v.id
+            """, [(row_id, n) for row_id, _, n in rows], template='(%s::int, %s::int)', page_size=len(rows))
+        conn.commit()
+        drift.extend(rows)
+    cur.close()
+    return drift
+
+
+def _flush_on_exit() -> None:
+    pending = counters.stats()['pending']
+    if pending:
+        try:
+            with connection() as conn:
+                counters.flush(conn)
+        except Exception as e:
+            # Последний шанс сбросить дельты упущен: в логе остаётся, сколько строк не дошло до БД
+            _log('lost_on_exit', pending, e)
+
+
+atexit.register(_flush_on_exit)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Compare like_count and subscriber_count with like_keys and subscriptions')
+    parser.add_argument('--fix', action='store_true', help='write the exact values for rows that drifted')
+    args = parser.parse_args()
+
+    with connection() as conn:
+        report = {}
+        for table, column in RECOUNTS:
+            drift = recount(conn, (table, column), fix=args.fix)
+            report[f'{table}.{column}'] = {
+                'drifted_rows': len(drift),
+                'net_drift': sum(was - n for _, was, n in drift),
+                'sample': [{'id': row_id, 'was': was, 'exact': n} for row_id, was, n in drift[:20]],
+            }
+    print(json.dumps({'fixed': args.fix, **report}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
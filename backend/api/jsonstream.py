@@ -0,0 +1,76 @@
+"""
+Business: JSON-сериализация строк БД с заранее известной раскладкой колонок, в том числе больших выборок по частям
+Args: tuple-строки (обычного или серверного named cursor) и имена колонок; orjson, если установлен
+Returns: RowEncoder.encode - JSON-массив одной строкой, RowEncoder.encode_chunks - генератор кусков JSON-массива или NDJSON
+"""
+
+import json
+from datetime import date, datetime, time
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+try:
+    import orjson
+except ImportError:  # без orjson - stdlib json, формат ответа тот же
+    orjson = None
+
+ITERSIZE = 2000
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return str(value)
+
+
+if orjson is not None:
+    def dumps(value: Any) -> str:
+        # orjson сам пишет datetime в ISO 8601; Decimal и прочее уходит в _default
+        return orjson.dumps(value, default=_default).decode()
+else:
+    _encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=_default).encode
+
+    def dumps(value: Any) -> str:
+        return _encode(value)
+
+
+class RowEncoder:
+    # Раскладка колонок фиксирована: имена и позиции вычисляются один раз, строка - обычный tuple,
+    # без копии RealDictRow; даты пишутся в ISO 8601 (orjson - нативно, stdlib - через _default)
+    def __init__(self, columns: Sequence[str]):
+        self.columns = tuple(columns)
+        self.positions = {name: i for i, name in enumerate(self.columns)}
+
+    def dicts(self, rows: Iterable[Sequence[Any]]) -> List[Dict[str, Any]]:
+        columns = self.columns
+        return [dict(zip(columns, row)) for row in rows]
+
+    def encode(self, rows: Iterable[Sequence[Any]]) -> str:
+        return dumps(self.dicts(rows))
+
+    def encode_chunks(self, rows: Iterable[Sequence[Any]], key: Optional[str] = None,
+                      ndjson: bool = False, chunk_rows: int = ITERSIZE) -> Iterator[str]:
+        # Кодируем пачками по chunk_rows: один вызов dumps на пачку вместо вызова на строку
+        rows = iter(rows)
+        if not ndjson:
+            yield '{' + dumps(key) + ':[' if key else '['
+        first = True
+        while True:
+            batch = self.dicts(islice(rows, chunk_rows))
+            if not batch:
+                break
+            if ndjson:
+                yield '\n'.join(map(dumps, batch)) + '\n'
+                continue
+            yield dumps(batch)[1:-1] if first else ',' + dumps(batch)[1:-1]
+            first = False
+        if not ndjson:
+            yield ']}' if key else ']'
+
+
+def open_server_cursor(conn, name: str, query: str, params: Sequence[Any] = (), itersize: int = ITERSIZE):
+    # Серверный курсор тянет строки пачками по itersize, а не весь результат в память клиента
+    cur = conn.cursor(name=name)
+    cur.itersize = itersize
+    cur.execute(query, params)
+    return cur
@@ -0,0 +1,174 @@
+"""
+Business: Обслуживание секций журнала likes: месяцы вперёд создаются заранее, старые отсоединяются и уходят в сжатые файлы
+Args: `python likes_archive.py [--keep-months N] [--dir PATH] [--ahead N]`, `--restore FILE`; LIKES_ARCHIVE_DIR, LIKES_KEEP_MONTHS из окружения
+Returns: печатает по JSON-строке на созданные секции и на каждый выгруженный месяц: файл, строки, sha256
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+from datetime import date
+from typing import Any, Dict, List, Tuple
+
+from db import connection
+
+ARCHIVE_DIR = os.environ.get('LIKES_ARCHIVE_DIR', '/var/lib/likes-archive')
+KEEP_MONTHS = int(os.environ.get('LIKES_KEEP_MONTHS', '12'))
+AHEAD_MONTHS = 3
+LOCK_TIMEOUT = '5s'
+PARTITION_NAME = re.compile(r'^likes_(\d{4})_(\d{2})$')
+
+
+class HashingFile:
+    def __init__(self, path: str):
+        self.raw = open(path, 'wb')
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data: bytes) -> int:
+        self.sha256.update(data)
+        return self.raw.write(data)
+
+    def flush(self) -> None:
+        self.raw.flush()
+
+
+class ArchiveWriter:
+    # Приёмник COPY TO: сжимает поток, считает строки и sha256 сжатого файла по дороге
+    def __init__(self, path: str):
+        self.file = HashingFile(path)
+        self.gzip = gzip.GzipFile(fileobj=self.file, mode='wb', mtime=0)
+        self.rows = 0
+
+    def write(self, data) -> int:
+        if isinstance(data, str):
+            data = data.encode()
+        self.rows += data.count(b'\n')
+        return self.gzip.write(data)
+
+    def close(self) -> None:
+        self.gzip.close()
+        self.file.raw.flush()
+        os.fsync(self.file.raw.fileno())
+        self.file.raw.close()
+
+
+def month_of(name: str) -> date:
+    year, month = PARTITION_NAME.match(name).groups()
+    return date(int(year), int(month), 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def ensure_partitions(conn, ahead: int = AHEAD_MONTHS) -> int:
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT ensure_likes_partitions(CURRENT_DATE, (CURRENT_DATE + make_interval(months => %s))::date)",
+        (ahead,)
+    )
+    created = cur.fetchone()[0]
+    conn.commit()
+    cur.close()
+    return created
+
+
+def partitions(conn) -> List[Tuple[str, bool]]:
+    # Месячные секции журнала: (имя, подключена ли к likes). Отсоединённая, но не выгруженная
+    # секция остаётся после падения посреди архивации и подбирается следующим запуском
+    cur = conn.cursor()
+    cur.execute(r"""
+        SELECT c.relname, EXISTS (SELECT 1 FROM pg_inherits i WHERE i.inhrelid = c.oid AND i.inhparent = 'likes'::regclass)
+        FROM pg_class c
+        WHERE c.relnamespace = (SELECT relnamespace FROM pg_class WHERE oid = 'likes'::regclass)
+          AND c.relkind = 'p' AND c.relname ~ '^likes_\d{4}_\d{2}$'
+        ORDER BY c.relname
+    """)
+    rows = cur.fetchall()
+    cur.close()
+    return rows
+
+
+def archive_partition(conn, name: str, attached: bool, directory: str) -> Dict[str, Any]:
+    cur = conn.cursor()
+    if attached:
+        # DETACH берёт блокировку на likes; не ждём дольше LOCK_TIMEOUT за долгими запросами
+        cur.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+        cur.execute(f'ALTER TABLE likes DETACH PARTITION "{name}"')
+        conn.commit()
+
+    path = os.path.join(directory, f'{name}.csv.gz')
+    writer = ArchiveWriter(path + '.tmp')
+    try:
+        cur.copy_expert(f'COPY (SELECT stream_id, user_id, created_at FROM "{name}") TO STDOUT WITH (FORMAT csv)', writer)
+    finally:
+        writer.close()
+    rows = writer.rows
+    cur.execute(f'SELECT count(*) FROM "{name}"')
+    if cur.fetchone()[0] != rows:
+        raise RuntimeError(f'{name}: archived {rows} rows, table has a different count')
+    os.replace(path + '.tmp', path)
+
+    # Запись об архиве и удаление таблицы - одной транзакцией: либо месяц в файле и учтён, либо ещё в БД
+    cur.execute("""
+        INSERT INTO likes_archives (partition_name, month, path, row_count, sha256)
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (partition_name) DO UPDATE SET
+            path = EXCLUDED.path, row_count = EXCLUDED.row_count, sha256 = EXCLUDED.sha256, archived_at = NOW()
+    """, (name, month_of(name), path, rows, writer.file.sha256.hexdigest()))
+    cur.execute(f'DROP TABLE "{name}"')
+    conn.commit()
+    cur.close()
+    return {'partition': name, 'path': path, 'rows': rows, 'sha256': writer.file.sha256.hexdigest()}
+
+
+def archive(conn, keep_months: int = KEEP_MONTHS, directory: str = ARCHIVE_DIR) -> List[Dict[str, Any]]:
+    os.makedirs(directory, exist_ok=True)
+    cutoff = add_months(date.today().replace(day=1), -keep_months)
+    return [
+        archive_partition(conn, name, attached, directory)
+        for name, attached in partitions(conn)
+        if month_of(name) < cutoff
+    ]
+
+
+def restore(conn, path: str) -> Dict[str, Any]:
+    # Возвращает выгруженный месяц в журнал: секция создаётся заново, like_keys архивация не трогала.
+    # COPY идёт прямо в секцию месяца, а не в likes: statement-триггер аналитики канала висит на likes,
+    # и лайки месяца, которые channel_stats_hourly уже учёл, не прибавились бы к ней второй раз
+    name = os.path.basename(path).split('.')[0]
+    month = month_of(name)
+    cur = conn.cursor()
+    cur.execute("SELECT ensure_likes_partitions(%s, %s)", (month, month))
+    with gzip.open(path, 'rb') as source:
+        cur.copy_expert(f'COPY "{name}" (stream_id, user_id, created_at) FROM STDIN WITH (FORMAT csv)', source)
+    rows = cur.rowcount
+    cur.execute("DELETE FROM likes_archives WHERE partition_name = %s", (name,))
+    conn.commit()
+    cur.close()
+    return {'partition': name, 'restored': rows}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Create upcoming likes partitions and archive old months')
+    parser.add_argument('--keep-months', type=int, default=KEEP_MONTHS)
+    parser.add_argument('--dir', default=ARCHIVE_DIR)
+    parser.add_argument('--ahead', type=int, default=AHEAD_MONTHS)
+    parser.add_argument('--restore', metavar='FILE')
+    args = parser.parse_args()
+
+    with connection() as conn:
+        if args.restore:
+            print(json.dumps(restore(conn, args.restore)))
+            return
+        print(json.dumps({'created_partitions': ensure_partitions(conn, args.ahead)}))
+        for archived in archive(conn, args.keep_months, args.dir):
+            print(json.dumps(archived))
+
+
+if __name__ == '__main__':
+    main()
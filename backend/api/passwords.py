@@ -0,0 +1,67 @@
+"""
+Business: Хеширование паролей через scrypt с настраиваемой стоимостью в отдельном пуле потоков
+Args: PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P, PASSWORD_HASH_WORKERS из окружения
+Returns: hash_password() для регистрации, verify_password() и needs_rehash() для входа, hash_many() для импорта
+"""
+
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+SCRYPT_N = int(os.environ.get('PASSWORD_SCRYPT_N', str(2 ** 14)))
+SCRYPT_R = int(os.environ.get('PASSWORD_SCRYPT_R', '8'))
+SCRYPT_P = int(os.environ.get('PASSWORD_SCRYPT_P', '1'))
+# scrypt отпускает GIL, пул ограничивает число одновременных KDF (и их память: 128 * N * r байт на хеш)
+HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+SALT_BYTES = 16
+KEY_BYTES = 32
+PREFIX = 'scrypt'
+
+_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='kdf')
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r * p, dklen=KEY_BYTES)
+
+
+def _hash(password: str) -> str:
+    salt = os.urandom(SALT_BYTES)
+    key = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f'{PREFIX}${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${key.hex()}'
+
+
+def _verify(password: str, stored: Optional[str]) -> bool:
+    if not stored or not is_hash(stored):
+        # Старые строки хранят пароль открытым текстом; после успешного входа auth перехеширует
+        return stored is not None and hmac.compare_digest(password.encode(), stored.encode())
+    _, n, r, p, salt, key = stored.split('$')
+    return hmac.compare_digest(_scrypt(password, bytes.fromhex(salt), int(n), int(r), int(p)), bytes.fromhex(key))
+
+
+# Запись с текущими параметрами на случай, когда пользователь не найден: проверка стоит столько же,
+# и по времени нельзя понять, существует ли логин. Ключ случайный - считать KDF при импорте модуля незачем
+_DUMMY_HASH = f'{PREFIX}${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${os.urandom(SALT_BYTES).hex()}${os.urandom(KEY_BYTES).hex()}'
+
+
+def hash_password(password: str) -> str:
+    return _pool.submit(_hash, password).result()
+
+
+def hash_many(passwords: List[str]) -> List[str]:
+    # Для импорта: все воркеры пула сразу, порядок сохраняется
+    return list(_pool.map(_hash, passwords))
+
+
+def is_hash(stored: str) -> bool:
+    return stored.startswith(PREFIX + '$')
+
+
+def verify_password(password: str, stored: Optional[str]) -> bool:
+    return _pool.submit(_verify, password, stored if stored is not None else _DUMMY_HASH).result() and stored is not None
+
+
+def needs_rehash(stored: str) -> bool:
+    return not stored.startswith(f'{PREFIX}${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$')
@@ -0,0 +1,324 @@
+"""
+Business: Фоновое каскадное удаление пользователя, всех пользователей или всех видео пачками с коммитом после каждой
+Args: `python purge.py --workers N` - воркеры; PURGE_BATCH, PURGE_PAUSE_SECONDS, PURGE_LEASE_SECONDS из окружения
+Returns: enqueue()/run() для админских маршрутов, прогресс и счётчики удалённых строк в purge_jobs
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from psycopg2 import errors
+from psycopg2.extras import execute_values
+
+from db import connection
+
+BATCH = int(os.environ.get('PURGE_BATCH', '1000'))
+PAUSE_SECONDS = float(os.environ.get('PURGE_PAUSE_SECONDS', '0.02'))
+LEASE_SECONDS = int(os.environ.get('PURGE_LEASE_SECONDS', '60'))
+IDLE_SLEEP_SECONDS = 2
+RETRY_BACKOFF_SECONDS = 30
+MAX_RESTARTS = 3
+
+# Шаг: (имя, DELETE одной пачки с RETURNING, счётчик оставшихся строк, который надо уменьшить).
+# {op} - '=' для одного пользователя и '<=' для очистки до id, снятого при постановке задачи.
+# Порядок выбран так, чтобы к моменту удаления строки на неё уже не ссылался ни один FK.
+# Лайк удаляется из like_keys и журнала likes одним запросом; месяцы, уже выгруженные в архив, не трогаются
+USER_STEPS: Tuple[Tuple[str, str, Optional[Tuple[str, str]]], ...] = (
+    ('likes', """
+        WITH keys AS (
+            DELETE FROM like_keys WHERE (stream_id, user_id) IN (
+                SELECT stream_id, user_id FROM like_keys WHERE user_id {op} %s LIMIT %s)
+            RETURNING stream_id, user_id
+        ), events AS (
+            DELETE FROM likes l USING keys k WHERE l.user_id = k.user_id AND l.stream_id = k.stream_id
+        )
+        SELECT stream_id FROM keys
+    """, ('streams', 'like_count')),
+    ('subscriptions', """
+        DELETE FROM subscriptions WHERE id IN (SELECT id FROM subscriptions WHERE subscriber_id {op} %s LIMIT %s)
+        RETURNING channel_id
+    """, ('users', 'subscriber_count')),
+    ('subscribers', """
+        DELETE FROM subscriptions WHERE id IN (SELECT id FROM subscriptions WHERE channel_id {op} %s LIMIT %s)
+        RETURNING channel_id
+    """, None),
+    ('stream_likes', """
+        WITH keys AS (
+            DELETE FROM like_keys WHERE (stream_id, user_id) IN (
+                SELECT k.stream_id, k.user_id FROM streams s JOIN like_keys k ON k.stream_id = s.id
+                WHERE s.user_id {op} %s LIMIT %s)
+            RETURNING stream_id, user_id
+        ), events AS (
+            DELETE FROM likes l USING keys k WHERE l.user_id = k.user_id AND l.stream_id = k.stream_id
+        )
+        SELECT stream_id FROM keys
+    """, None),
+    ('stream_views', """
+        DELETE FROM stream_views_hourly WHERE (stream_id, hour) IN (
+            SELECT v.stream_id, v.hour FROM streams s JOIN stream_views_hourly v ON v.stream_id = s.id
+            WHERE s.user_id {op} %s LIMIT %s)
+        RETURNING stream_id
+    """, None),
+    ('stream_feed_items', """
+        DELETE FROM feed_items WHERE (user_id, created_at, stream_id) IN (
+            SELECT f.user_id, f.created_at, f.stream_id FROM streams s JOIN feed_items f ON f.stream_id = s.id
+            WHERE s.user_id {op} %s LIMIT %s)
+        RETURNING stream_id
+    """, None),
+    ('feed_items', """
+        DELETE FROM feed_items WHERE (user_id, created_at, stream_id) IN (
+            SELECT user_id, created_at, stream_id FROM feed_items WHERE user_id {op} %s LIMIT %s)
+        RETURNING user_id
+    """, None),
+    ('uploads', """
+        DELETE FROM uploads WHERE id IN (SELECT id FROM uploads WHERE user_id {op} %s LIMIT %s)
+        RETURNING user_id
+    """, None),
+    ('streams', """
+        DELETE FROM streams WHERE id IN (SELECT id FROM streams WHERE user_id {op} %s LIMIT %s)
+        RETURNING id
+    """, None),
+    ('channel_stats', """
+        DELETE FROM channel_stats_hourly WHERE (channel_id, hour) IN (
+            SELECT channel_id, hour FROM channel_stats_hourly WHERE channel_id {op} %s LIMIT %s)
+        RETURNING channel_id
+    """, None),
+    ('users', """
+        DELETE FROM users WHERE id IN (SELECT id FROM users WHERE id {op} %s LIMIT %s)
+        RETURNING id
+    """, None),
+)
+
+VIDEO_STEPS: Tuple[Tuple[str, str, Optional[Tuple[str, str]]], ...] = (
+    ('stream_likes', """
+        WITH keys AS (
+            DELETE FROM like_keys WHERE (stream_id, user_id) IN (
+                SELECT stream_id, user_id FROM like_keys WHERE stream_id {op} %s LIMIT %s)
+            RETURNING stream_id, user_id
+        ), events AS (
+            DELETE FROM likes l USING keys k WHERE l.user_id = k.user_id AND l.stream_id = k.stream_id
+        )
+        SELECT stream_id FROM keys
+    """, None),
+    ('stream_views', """
+        DELETE FROM stream_views_hourly WHERE (stream_id, hour) IN (
+            SELECT stream_id, hour FROM stream_views_hourly WHERE stream_id {op} %s LIMIT %s)
+        RETURNING stream_id
+    """, None),
+    ('stream_feed_items', """
+        DELETE FROM feed_items WHERE (user_id, created_at, stream_id) IN (
+            SELECT user_id, created_at, stream_id FROM feed_items WHERE stream_id {op} %s LIMIT %s)
+        RETURNING stream_id
+    """, None),
+    ('streams', """
+        DELETE FROM streams WHERE id IN (SELECT id FROM streams WHERE id {op} %s LIMIT %s)
+        RETURNING id
+    """, None),
+)
+
+# kind -> (шаги, оператор сравнения с target_id, таблица, чей max(id) становится target_id очистки)
+PLANS = {
+    'user': (USER_STEPS, '=', None),
+    'users': (USER_STEPS, '<=', 'users'),
+    'videos': (VIDEO_STEPS, '<=', 'streams'),
+}
+
+Job = Tuple[int, str, int, int, int, int]
+
+
+def enqueue(conn, kind: str, target_id: Optional[int] = None) -> int:
+    watermark_table = PLANS[kind][2]
+    cur = conn.cursor()
+    if watermark_table:
+        # Очистка касается только строк, существовавших на момент запроса; новые регистрации не трогаем
+        cur.execute(f"SELECT coalesce(max(id), 0) FROM {watermark_table}")
+        target_id = cur.fetchone()[0]
+    cur.execute("""
+        INSERT INTO purge_jobs (kind, target_id) VALUES (%s, %s)
+        ON CONFLICT (kind, target_id) WHERE status IN ('queued', 'running') DO NOTHING
+        RETURNING id
+    """, (kind, target_id))
+    row = cur.fetchone()
+    if row is None:
+        cur.execute(
+            "SELECT id FROM purge_jobs WHERE kind = %s AND target_id = %s AND status IN ('queued', 'running')",
+            (kind, target_id)
+        )
+        row = cur.fetchone()
+    conn.commit()
+    cur.close()
+    return row[0]
+
+
+def claim(conn, worker_id: str, job_id: Optional[int] = None) -> Optional[Job]:
+    cur = conn.cursor()
+    # Задача упавшего воркера (истёкшая аренда) забирается и продолжается с сохранённого шага
+    cur.execute(f"""
+        UPDATE purge_jobs
+        SET status = 'running', attempts = attempts + 1, locked_by = %s,
+            locked_until = NOW() + make_interval(secs => %s), updated_at = NOW()
+        WHERE id = (
+            SELECT id FROM purge_jobs
+            WHERE ((status = 'queued' AND run_after <= NOW()) OR (status = 'running' AND locked_until < NOW()))
+              {'AND id = %s' if job_id else ''}
+            ORDER BY id
+            FOR UPDATE SKIP LOCKED
+            LIMIT 1
+        )
+        RETURNING id, kind, target_id, step, attempts, max_attempts
+    """, (worker_id, LEASE_SECONDS, job_id) if job_id else (worker_id, LEASE_SECONDS))
+    job = cur.fetchone()
+    conn.commit()
+    cur.close()
+    return job
+
+
+def reconcile(cur, counter: Tuple[str, str], ids: List[int]) -> None:
+    # Лайки и подписки удаляемых пользователей уменьшают счётчики оставшихся стримов и каналов
+    # в той же транзакции, что и DELETE: после падения воркера счётчик не разойдётся с таблицей
+    table, column = counter
+    execute_values(cur, f"""
+        UPDATE {table} t SET {column} = greatest(t.{column} - d.delta, 0)
+        FROM (VALUES %s) AS d(id, delta)
+        WHERE t.id = d.id
+    """, sorted(Counter(ids).items()))
+
+
+def run(conn, job: Job, worker_id: str, deadline: Optional[float] = None, batch: int = BATCH) -> str:
+    """Выполняет шаги задачи пачками до конца или до deadline (time.monotonic); возвращает статус задачи."""
+    job_id, kind, target_id, step, attempts, max_attempts = job
+    steps, op, _ = PLANS[kind]
+    cur = conn.cursor()
+    restarts = 0
+    try:
+        while step < len(steps):
+            if deadline is not None and time.monotonic() >= deadline:
+                # Остаток доделает воркер: отпускаем аренду, задача снова в очереди
+                cur.execute(
+                    "UPDATE purge_jobs SET status = 'queued', attempts = attempts - 1, locked_by = NULL, "
+                    "locked_until = NULL, updated_at = NOW() WHERE id = %s AND locked_by = %s",
+                    (job_id, worker_id)
+                )
+                conn.commit()
+                return 'queued'
+
+            name, query, counter = steps[step]
+            try:
+                cur.execute(query.format(op=op), (target_id, batch))
+                ids = [row[0] for row in cur.fetchall()]
+                if counter and ids:
+                    reconcile(cur, counter, ids)
+            except errors.ForeignKeyViolation:
+                # Пока шла очистка, живой трафик добавил ссылку на удаляемую строку - проходим шаги заново
+                conn.rollback()
+                restarts += 1
+                if restarts > MAX_RESTARTS:
+                    raise
+                step = 0
+                continue
+
+            next_step = step if len(ids) == batch else step + 1
+            cur.execute("""
+                UPDATE purge_jobs
+                SET step = %s,
+                    deleted = jsonb_set(deleted, ARRAY[%s], to_jsonb(coalesce((deleted->>%s)::bigint, 0) + %s)),
+                    locked_until = NOW() + make_interval(secs => %s), updated_at = NOW()
+                WHERE id = %s AND locked_by = %s
+                RETURNING id
+            """, (next_step, name, name, len(ids), LEASE_SECONDS, job_id, worker_id))
+            if cur.fetchone() is None:
+                # Аренду перехватил другой воркер - эта пачка не наша
+                conn.rollback()
+                return 'running'
+            conn.commit()
+            step = next_step
+            if ids and PAUSE_SECONDS:
+                time.sleep(PAUSE_SECONDS)
+
+        cur.execute(
+            "UPDATE purge_jobs SET status = 'done', locked_by = NULL, locked_until = NULL, "
+            "finished_at = NOW(), updated_at = NOW() WHERE id = %s AND locked_by = %s",
+            (job_id, worker_id)
+        )
+        conn.commit()
+        return 'done'
+    except Exception as e:
+        conn.rollback()
+        fail(conn, job_id, attempts, max_attempts, str(e))
+        raise
+    finally:
+        cur.close()
+
+
+def fail(conn, job_id: int, attempts: int, max_attempts: int, error: str) -> None:
+    cur = conn.cursor()
+    if attempts >= max_attempts:
+        cur.execute(
+            "UPDATE purge_jobs SET status = 'failed', error = %s, locked_by = NULL, locked_until = NULL, "
+            "updated_at = NOW() WHERE id = %s",
+            (error[-2000:], job_id)
+        )
+    else:
+        cur.execute(
+            "UPDATE purge_jobs SET status = 'queued', error = %s, locked_by = NULL, locked_until = NULL, "
+            "run_after = NOW() + make_interval(secs => %s), updated_at = NOW() WHERE id = %s",
+            (error[-2000:], RETRY_BACKOFF_SECONDS * attempts, job_id)
+        )
+    conn.commit()
+    cur.close()
+
+
+def status(conn, job_id: int) -> Optional[Dict[str, Any]]:
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT id, kind, target_id, status, step, deleted, attempts, error, created_at, updated_at, finished_at "
+        "FROM purge_jobs WHERE id = %s",
+        (job_id,)
+    )
+    row = cur.fetchone()
+    cur.close()
+    if row is None:
+        return None
+    job = dict(zip(('id', 'kind', 'target_id', 'status', 'step', 'deleted', 'attempts', 'error',
+                    'created_at', 'updated_at', 'finished_at'), row))
+    steps = PLANS[job['kind']][0]
+    job['steps'] = len(steps)
+    job['current_step'] = steps[job['step']][0] if job['step'] < len(steps) else None
+    return job
+
+
+def work(worker_index: int) -> None:
+    worker_id = f'{socket.gethostname()}:{os.getpid()}:{worker_index}'
+    while True:
+        with connection() as conn:
+            job = claim(conn, worker_id)
+            if job:
+                try:
+                    print(json.dumps({'job': job[0], 'kind': job[1], 'status': run(conn, job, worker_id)}))
+                except Exception as e:
+                    print(json.dumps({'job': job[0], 'kind': job[1], 'error': str(e)}))
+        if not job:
+            time.sleep(IDLE_SLEEP_SECONDS)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Run purge job workers')
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context('spawn')
+    workers = [ctx.Process(target=work, args=(i,), daemon=True) for i in range(args.workers)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+
+
+if __name__ == '__main__':
+    main()
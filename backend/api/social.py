@@ -0,0 +1,216 @@
+"""
+Business: Пользователи, подписки и лайки, включая пакетные варианты
+Args: Request из router с телом запроса
+Returns: HTTP response dict
+"""
+
+from typing import Dict, Any, List, Tuple
+from psycopg2 import errors
+from psycopg2.extras import execute_values
+
+from counters import counters
+from jsonstream import RowEncoder
+from router import HttpError, Request, response
+
+BATCH_MAX_ITEMS = 1000
+
+# Публичная карточка пользователя: без email и пароля
+USER_CARD = RowEncoder(('id', 'username', 'display_name', 'avatar_url', 'bio', 'subscriber_count', 'is_verified', 'created_at'))
+
+def parse_pairs(items: Any, user_id: int, first: str, second: str) -> List[Tuple[int, int]]:
+    # Пачка - действия самого вызывающего: элемент - id цели или {second: id}; first, если передан, обязан совпасть с токеном
+    if not isinstance(items, list) or not items or len(items) > BATCH_MAX_ITEMS:
+        raise ValueError(f'expected 1..{BATCH_MAX_ITEMS} items')
+    pairs = []
+    for item in items:
+        if isinstance(item, dict):
+            if first in item and int(item[first]) != user_id:
+                raise HttpError(403, f'{first} must be the authenticated user')
+            target = int(item[second])
+        else:
+            target = int(item)
+        pairs.append((user_id, target))
+    # Повторы внутри пачки схлопываем, порядок сохраняем
+    return list(dict.fromkeys(pairs))
+
+def _insert_batch(conn, cur, sql: str, pairs: List[Tuple[int, int]]) -> List[Tuple[int, int, bool]]:
+    # Пользователь или стрим могут исчезнуть между JOIN и вставкой (удаление аккаунта) - это ошибка клиента, а не 500
+    try:
+        rows = execute_values(cur, sql, pairs, page_size=len(pairs), fetch=True)
+    except errors.ForeignKeyViolation:
+        conn.rollback()
+        cur.close()
+        raise HttpError(409, 'Batch references a deleted user or stream, retry it')
+    conn.commit()
+    cur.close()
+    return rows
+
+def _missing(e: errors.ForeignKeyViolation, column: str, if_column: str, otherwise: str) -> str:
+    # Чей внешний ключ не сошёлся - видно по имени ограничения (<таблица>_<колонка>_fkey)
+    return if_column if column in (e.diag.constraint_name or '') else otherwise
+
+# GET /?action=users - получить всех пользователей
+def list_users(request: Request) -> Dict[str, Any]:
+    cur = request.db().cursor()
+    cur.execute(f"SELECT {', '.join(USER_CARD.columns)} FROM users ORDER BY subscriber_count DESC LIMIT 100")
+    users = cur.fetchall()
+    cur.close()
+
+    return response(200, body=USER_CARD.encode(users))
+
+# POST /?action=subscribe - подписаться на канал
+def subscribe(request: Request) -> Dict[str, Any]:
+    subscriber_id = request.require_user()
+    channel_id = request.body.get('channel_id')
+
+    if not channel_id:
+        raise HttpError(400, 'channel_id required')
+
+    conn = request.db()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            INSERT INTO subscriptions (subscriber_id, channel_id)
+            VALUES (%s, %s)
+            ON CONFLICT (subscriber_id, channel_id) DO NOTHING
+            RETURNING id
+        """, (subscriber_id, channel_id))
+    except errors.ForeignKeyViolation as e:
+        # Как и в subscribe_batch: несуществующий канал - ошибка клиента, а не 500
+        conn.rollback()
+        cur.close()
+        raise HttpError(404, _missing(e, 'subscriber_id', 'Subscriber not found', 'Channel not found'))
+    inserted = cur.fetchone() is not None
+
+    conn.commit()
+    cur.close()
+
+    # Счётчик двигается только если подписка действительно добавилась
+    if inserted:
+        counters.incr('users', 'subscriber_count', int(channel_id))
+    counters.maybe_flush(request.db)
+
+    return response(200, {'success': True, 'subscribed': inserted})
+
+# POST /?action=like - поставить лайк
+def like(request: Request) -> Dict[str, Any]:
+    user_id = request.require_user()
+    stream_id = request.body.get('stream_id')
+
+    if not stream_id:
+        raise HttpError(400, 'stream_id required')
+
+    conn = request.db()
+    cur = conn.cursor()
+    # Уникальность держит like_keys (V0019); в журнал likes попадает только новый лайк.
+    # Обе вставки идут в одну HASH-секцию по stream_id, журнал - в секцию текущего месяца
+    try:
+        cur.execute("""
+            WITH liked AS (
+                INSERT INTO like_keys (stream_id, user_id)
+                VALUES (%s, %s)
+                ON CONFLICT (stream_id, user_id) DO NOTHING
+                RETURNING stream_id, user_id
+            )
+            INSERT INTO likes (stream_id, user_id)
+            SELECT stream_id, user_id FROM liked
+            RETURNING stream_id
+        """, (stream_id, user_id))
+    except errors.ForeignKeyViolation as e:
+        conn.rollback()
+        cur.close()
+        raise HttpError(404, _missing(e, 'user_id', 'User not found', 'Stream not found'))
+    inserted = cur.fetchone() is not None
+
+    conn.commit()
+    cur.close()
+
+    # Лайк копится в буфере и уходит в streams одним UPDATE на flush
+    if inserted:
+        counters.incr('streams', 'like_count', int(stream_id))
+    counters.maybe_flush(request.db)
+
+    return response(200, {'success': True, 'liked': inserted})
+
+# POST /?action=like_batch - пачка лайков вызывающего [stream_id | {stream_id}] одним INSERT
+def like_batch(request: Request) -> Dict[str, Any]:
+    user_id = request.require_user()
+    try:
+        pairs = parse_pairs(request.body.get('likes'), user_id, 'user_id', 'stream_id')
+    except (KeyError, TypeError, ValueError):
+        raise HttpError(400, f'likes must be a list of 1..{BATCH_MAX_ITEMS} stream ids')
+
+    conn = request.db()
+    cur = conn.cursor()
+    # Пары с несуществующим пользователем или стримом отсекаются JOIN-ом и возвращаются в rejected,
+    # иначе одна такая пара роняла бы всю пачку на внешнем ключе
+    rows = _insert_batch(conn, cur, """
+        WITH batch (user_id, stream_id) AS (VALUES %s),
+        valid AS (
+            SELECT b.user_id, b.stream_id FROM batch b
+            JOIN users u ON u.id = b.user_id
+            JOIN streams s ON s.id = b.stream_id
+        ),
+        liked AS (
+            INSERT INTO like_keys (user_id, stream_id)
+            SELECT user_id, stream_id FROM valid
+            ON CONFLICT (stream_id, user_id) DO NOTHING
+            RETURNING user_id, stream_id
+        ),
+        logged AS (
+            INSERT INTO likes (user_id, stream_id)
+            SELECT user_id, stream_id FROM liked
+            RETURNING user_id, stream_id
+        )
+        SELECT user_id, stream_id, TRUE FROM logged
+        UNION ALL
+        SELECT user_id, stream_id, FALSE FROM batch
+        WHERE (user_id, stream_id) NOT IN (SELECT user_id, stream_id FROM valid)
+    """, pairs)
+    inserted = [(a, b) for a, b, ok in rows if ok]
+    rejected = [[a, b] for a, b, ok in rows if not ok]
+
+    for _, stream_id in inserted:
+        counters.incr('streams', 'like_count', stream_id)
+    counters.maybe_flush(request.db)
+
+    return response(200, {'success': True, 'received': len(pairs), 'inserted': [list(p) for p in inserted],
+                          'rejected': rejected})
+
+# POST /?action=subscribe_batch - пачка подписок вызывающего [channel_id | {channel_id}] одним INSERT
+def subscribe_batch(request: Request) -> Dict[str, Any]:
+    subscriber_id = request.require_user()
+    try:
+        pairs = parse_pairs(request.body.get('subscriptions'), subscriber_id, 'subscriber_id', 'channel_id')
+    except (KeyError, TypeError, ValueError):
+        raise HttpError(400, f'subscriptions must be a list of 1..{BATCH_MAX_ITEMS} channel ids')
+
+    conn = request.db()
+    cur = conn.cursor()
+    rows = _insert_batch(conn, cur, """
+        WITH batch (subscriber_id, channel_id) AS (VALUES %s),
+        valid AS (
+            SELECT b.subscriber_id, b.channel_id FROM batch b
+            JOIN users s ON s.id = b.subscriber_id
+            JOIN users c ON c.id = b.channel_id
+        ),
+        subscribed AS (
+            INSERT INTO subscriptions (subscriber_id, channel_id)
+            SELECT subscriber_id, channel_id FROM valid
+            ON CONFLICT (subscriber_id, channel_id) DO NOTHING
+            RETURNING subscriber_id, channel_id
+        )
+        SELECT subscriber_id, channel_id, TRUE FROM subscribed
+        UNION ALL
+        SELECT subscriber_id, channel_id, FALSE FROM batch
+        WHERE (subscriber_id, channel_id) NOT IN (SELECT subscriber_id, channel_id FROM valid)
+    """, pairs)
+    inserted = [(a, b) for a, b, ok in rows if ok]
+    rejected = [[a, b] for a, b, ok in rows if not ok]
+
+    for _, channel_id in inserted:
+        counters.incr('users', 'subscriber_count', channel_id)
+    counters.maybe_flush(request.db)
+
+    return response(200, {'success': True, 'received': len(pairs), 'inserted': [list(p) for p in inserted],
+                          'rejected': rejected})
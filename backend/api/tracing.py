@@ -0,0 +1,236 @@
+"""
+Business: Трассировка запросов по выборке: время обработчика, получения соединения, каждого SQL и сериализации
+Args: TRACE_SAMPLE_RATE (0 - выключено, 1 - каждый запрос) из окружения; `python tracing.py [лог ...]` - сводка p50/p95/p99
+Returns: заголовок Server-Timing и JSON-строка лога на каждый попавший в выборку запрос
+"""
+
+import json
+import os
+import random
+import sys
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, List, Optional
+
+SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0'))
+ENABLED = SAMPLE_RATE > 0
+SQL_PREVIEW = 160
+SERVER_TIMING_QUERIES = 10
+
+_current: ContextVar[Optional['Trace']] = ContextVar('trace', default=None)
+
+
+class Trace:
+    __slots__ = ('name', 'started', 'spans', 'queries')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans: Dict[str, float] = {}
+        self.queries: List[Dict[str, Any]] = []
+
+    def add(self, name: str, seconds: float) -> None:
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def query(self, statement: Any, seconds: float, rows: int) -> None:
+        if isinstance(statement, bytes):
+            statement = statement.decode('utf-8', 'replace')
+        self.queries.append({
+            'ms': round(seconds * 1000, 3),
+            'rows': rows,
+            'sql': ' '.join(str(statement).split())[:SQL_PREVIEW],
+        })
+
+    def server_timing(self, total_ms: float) -> str:
+        parts = [f'handler;dur={total_ms:.2f}']
+        parts += [f'{name};dur={seconds * 1000:.2f}' for name, seconds in self.spans.items()]
+        if self.queries:
+            sql_ms = sum(q['ms'] for q in self.queries)
+            parts.append(f'sql;dur={sql_ms:.2f};desc="{len(self.queries)} queries"')
+            parts += [
+                f'sql{i};dur={q["ms"]:.2f};desc="{q["rows"]} rows"'
+                for i, q in enumerate(self.queries[:SERVER_TIMING_QUERIES], 1)
+            ]
+        return ', '.join(parts)
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *exc_info) -> bool:
+        return False
+
+
+class _Span:
+    __slots__ = ('trace', 'name', 'started')
+
+    def __init__(self, trace: Trace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> bool:
+        self.trace.add(self.name, time.perf_counter() - self.started)
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def start(name: str) -> Optional[Trace]:
+    if not ENABLED or random.random() >= SAMPLE_RATE:
+        return None
+    trace = Trace(name)
+    _current.set(trace)
+    return trace
+
+
+def current() -> Optional[Trace]:
+    return _current.get() if ENABLED else None
+
+
+def span(name: str):
+    # Без трассировки - общий пустой контекст, без аллокаций и замеров
+    trace = current()
+    return _Span(trace, name) if trace else _NO_SPAN
+
+
+def finish(trace: Trace, result: Dict[str, Any], error: Optional[str] = None) -> None:
+    _current.set(None)
+    total_ms = (time.perf_counter() - trace.started) * 1000
+    result['headers'] = {
+        **result.get('headers', {}),
+        'Server-Timing': trace.server_timing(total_ms),
+        'Timing-Allow-Origin': '*',
+    }
+    line = {
+        'trace': trace.name,
+        'ts': round(time.time(), 3),
+        'status': result.get('statusCode'),
+        'total_ms': round(total_ms, 3),
+        **{f'{name}_ms': round(seconds * 1000, 3) for name, seconds in trace.spans.items()},
+        'sql_ms': round(sum(q['ms'] for q in trace.queries), 3),
+        'queries': trace.queries,
+    }
+    if error:
+        line['error'] = error
+    sys.stdout.write(json.dumps(line, ensure_ascii=False) + '\n')
+    sys.stdout.flush()
+
+
+class TracedCursor:
+    # Обёртка над любым курсором (RealDictCursor, именованным): замеряет выполнение, остальное отдаёт как есть
+    def __init__(self, cursor, trace: Trace):
+        object.__setattr__(self, '_cursor', cursor)
+        object.__setattr__(self, '_trace', trace)
+
+    def _timed(self, method: str, statement: Any, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return getattr(self._cursor, method)(statement, *args, **kwargs)
+        finally:
+            self._trace.query(statement, time.perf_counter() - started, self._cursor.rowcount)
+
+    def execute(self, query, vars=None):
+        return self._timed('execute', query, vars)
+
+    def executemany(self, query, vars_list):
+        return self._timed('executemany', query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        return self._timed('copy_expert', sql, file, size)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._cursor.__exit__(*exc_info)
+
+    def __getattr__(self, name: str):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._cursor, name, value)
+
+
+class TracedConnection:
+    def __init__(self, conn, trace: Trace):
+        object.__setattr__(self, '_conn', conn)
+        object.__setattr__(self, '_trace', trace)
+
+    def cursor(self, *args, **kwargs) -> TracedCursor:
+        return TracedCursor(self._conn.cursor(*args, **kwargs), self._trace)
+
+    def commit(self) -> None:
+        started = time.perf_counter()
+        self._conn.commit()
+        self._trace.add('commit', time.perf_counter() - started)
+
+    def __getattr__(self, name: str):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._conn, name, value)
+
+
+def percentile(values: List[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def aggregate(lines: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    by_action: Dict[str, Dict[str, List[float]]] = {}
+    for line in lines:
+        line = line.strip()
+        if not line.startswith('{'):
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if 'trace' not in record:
+            continue
+        metrics = by_action.setdefault(record['trace'], {'total_ms': [], 'sql_ms': [], 'db_connect_ms': [], 'serialize_ms': []})
+        for key, values in metrics.items():
+            values.append(record.get(key, 0.0))
+    return {
+        action: {
+            'count': len(metrics['total_ms']),
+            **{
+                key: {p: round(percentile(values, q), 2) for p, q in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))}
+                for key, values in metrics.items()
+            },
+        }
+        for action, metrics in sorted(by_action.items())
+    }
+
+
+def main() -> None:
+    # python tracing.py function.log [...] или лог на stdin: сводка по действиям
+    paths = sys.argv[1:]
+    if paths:
+        lines: List[str] = []
+        for path in paths:
+            with open(path, encoding='utf-8') as f:
+                lines.extend(f)
+    else:
+        lines = list(sys.stdin)
+    metrics = ('total_ms', 'sql_ms', 'db_connect_ms', 'serialize_ms')
+    print(f'{"action":<28}{"count":>7}' + ''.join(f'{m[:-3] + " p50/p95/p99":>28}' for m in metrics))
+    for action, summary in aggregate(lines).items():
+        print(f'{action:<28}{summary["count"]:>7}' + ''.join(
+            f'{"{p50}/{p95}/{p99}".format(**summary[m]):>28}' for m in metrics
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Business: Массовый импорт пользователей из CSV или NDJSON через COPY для миграций и наполнения БД
+Args: `python users_import.py FILE [--format csv|ndjson]`, FILE '-' - stdin; DATABASE_URL из окружения
+Returns: import_users() и печать числа прочитанных, добавленных, пропущенных и отклонённых строк
+"""
+
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+from typing import Any, Dict, Iterator, TextIO
+
+from psycopg2.extras import execute_values
+
+from db import connection
+from passwords import hash_many
+
+COLUMNS = ('username', 'email', 'display_name', 'password', 'avatar_url', 'bio', 'subscriber_count', 'is_verified')
+REQUIRED = ('username', 'email', 'display_name')
+HASH_PAGE = 1000
+# Строки без обязательных полей или с '@' в имени (login различает по нему email) не импортируются
+VALID = "COALESCE(username, '') <> '' AND COALESCE(email, '') <> '' AND COALESCE(display_name, '') <> '' " \
+        "AND strpos(username, '@') = 0"
+
+
+class LineReader:
+    # Файлоподобная обёртка над генератором строк для copy_expert: NDJSON перекодируется
+    # в CSV по мере чтения, весь файл в памяти не собирается
+    def __init__(self, lines: Iterator[str]):
+        self._lines = lines
+        self._buf = ''
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._buf) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buf += line
+        if size < 0:
+            size = len(self._buf)
+        chunk, self._buf = self._buf[:size], self._buf[size:]
+        return chunk
+
+
+def ndjson_as_csv(source: TextIO) -> Iterator[str]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for line in source:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        # None и отсутствующие поля пишутся пустыми без кавычек - в COPY это NULL
+        writer.writerow([record.get(column) for column in COLUMNS])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+
+def _hash_plaintext(cur) -> int:
+    # Открытые пароли хешируются в пуле KDF: это единственная медленная часть импорта,
+    # поэтому для миллионов строк пароли стоит выгружать уже хешами scrypt$...
+    cur.execute("SELECT line, password FROM users_import WHERE password IS NOT NULL AND password NOT LIKE 'scrypt$%'")
+    rows = cur.fetchall()
+    for start in range(0, len(rows), HASH_PAGE):
+        page = rows[start:start + HASH_PAGE]
+        hashed = hash_many([password for _, password in page])
+        execute_values(cur, """
+            UPDATE users_import i SET password = v.password FROM (VALUES %s) AS v (line, password)
+            WHERE i.line = v.line
+        """, [(line, password) for (line, _), password in zip(page, hashed)], page_size=HASH_PAGE)
+    return len(rows)
+
+
+def import_users(conn, source: TextIO, fmt: str = 'csv') -> Dict[str, Any]:
+    if fmt == 'csv':
+        columns = next(csv.reader([source.readline()]))
+        unknown = set(columns) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f'Unknown columns: {", ".join(sorted(unknown))}')
+        reader = source
+    else:
+        columns = list(COLUMNS)
+        reader = LineReader(ndjson_as_csv(source))
+    missing = set(REQUIRED) - set(columns)
+    if missing:
+        raise ValueError(f'Missing columns: {", ".join(sorted(missing))}')
+
+    started = time.perf_counter()
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TEMP TABLE users_import (
+            line BIGSERIAL, username TEXT, email TEXT, display_name TEXT, password TEXT,
+            avatar_url TEXT, bio TEXT, subscriber_count INTEGER, is_verified BOOLEAN
+        ) ON COMMIT DROP
+    """)
+    cur.copy_expert(f"COPY users_import ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", reader)
+    read = cur.rowcount
+    copied_at = time.perf_counter()
+
+    hashed = _hash_plaintext(cur) if 'password' in columns else 0
+    hashed_at = time.perf_counter()
+
+    # Одна вставка на весь файл; занятые username/email (в БД или выше по файлу) пропускает ON CONFLICT
+    cur.execute(f"""
+        INSERT INTO users (username, email, display_name, password, avatar_url, bio, subscriber_count, is_verified)
+        SELECT username, email, display_name, password,
+               COALESCE(avatar_url, 'https://api.dicebear.com/7.x/avataaars/svg?seed=' || username),
+               COALESCE(bio, ''), COALESCE(subscriber_count, 0), COALESCE(is_verified, false)
+        FROM users_import
+        WHERE {VALID}
+        ORDER BY line
+        ON CONFLICT DO NOTHING
+    """)
+    inserted = cur.rowcount
+    cur.execute(f"SELECT count(*) FROM users_import WHERE NOT ({VALID})")
+    rejected = cur.fetchone()[0]
+    conn.commit()
+    cur.close()
+
+    return {
+        'read': read,
+        'inserted': inserted,
+        'skipped': read - inserted - rejected,
+        'rejected': rejected,
+        'hashed': hashed,
+        'copy_ms': round((copied_at - started) * 1000, 1),
+        'hash_ms': round((hashed_at - copied_at) * 1000, 1),
+        'insert_ms': round((time.perf_counter() - hashed_at) * 1000, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Bulk import users from CSV (with header) or NDJSON')
+    parser.add_argument('file')
+    parser.add_argument('--format', choices=('csv', 'ndjson'))
+    args = parser.parse_args()
+
+    fmt = args.format or ('ndjson' if args.file.endswith(('.ndjson', '.jsonl')) else 'csv')
+    source = sys.stdin if args.file == '-' else open(args.file, newline='', encoding='utf-8')
+    try:
+        with connection() as conn:
+            print(json.dumps(import_users(conn, source, fmt)))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+Business: Приём событий просмотра: дедупликация фильтром Блума, запись пачкой через COPY в UNLOGGED-стейджинг, периодический rollup
+Args: VIEW_DEDUP_WINDOW, VIEW_BLOOM_BITS, VIEW_ROLLUP_INTERVAL, VIEW_ROLLUP_BATCH из окружения
+Returns: views.ingest() для пачки событий и views.maybe_rollup() для переноса в view_count и stream_views_hourly
+"""
+
+import hashlib
+import io
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+DEDUP_WINDOW = int(os.environ.get('VIEW_DEDUP_WINDOW', '1800'))
+BLOOM_BITS = int(os.environ.get('VIEW_BLOOM_BITS', str(1 << 23)))
+BLOOM_HASHES = 7
+ROLLUP_INTERVAL = float(os.environ.get('VIEW_ROLLUP_INTERVAL', '5'))
+ROLLUP_BATCH = int(os.environ.get('VIEW_ROLLUP_BATCH', '50000'))
+EVENTS_MAX = 5000
+HEARTBEAT_MAX_SECONDS = 300
+EVENT_TYPES = ('view', 'heartbeat')
+
+
+class BloomFilter:
+    def __init__(self, bits: int, hashes: int):
+        self.bits = bits
+        self.hashes = hashes
+        self._array = bytearray((bits + 7) // 8)
+        self.added = 0
+
+    def add(self, key: bytes) -> bool:
+        # True, если ключа (вероятно) ещё не было; ложные срабатывания только занижают счёт
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        array = self._array
+        new = False
+        for i in range(self.hashes):
+            bit = (h1 + i * h2) % self.bits
+            byte, mask = bit >> 3, 1 << (bit & 7)
+            if not array[byte] & mask:
+                array[byte] |= mask
+                new = True
+        if new:
+            self.added += 1
+        return new
+
+
+class ViewIngest:
+    def __init__(self, window: int = DEDUP_WINDOW, bloom_bits: int = BLOOM_BITS):
+        self.window = window
+        self.bloom_bits = bloom_bits
+        self._window_id = -1
+        self._seen = BloomFilter(bloom_bits, BLOOM_HASHES)
+        self._last_rollup = time.monotonic()
+        self._lock = threading.Lock()
+        self._stats = {'events': 0, 'views_counted': 0, 'views_duplicate': 0, 'rollups': 0, 'rows_rolled_up': 0}
+
+    def _first_in_window(self, viewer: str, stream_id: int) -> bool:
+        # Окно считается по часам сервера: клиентским меткам времени не доверяем
+        window_id = int(time.time()) // self.window
+        if window_id != self._window_id:
+            self._window_id = window_id
+            self._seen = BloomFilter(self.bloom_bits, BLOOM_HASHES)
+        return self._seen.add(f'{viewer}|{stream_id}'.encode())
+
+    def parse(self, events: Any, user_id: Optional[int]) -> List[Tuple[int, str, float, float]]:
+        if isinstance(events, dict):
+            events = [events]
+        if not isinstance(events, list) or not events or len(events) > EVENTS_MAX:
+            raise ValueError(f'expected 1..{EVENTS_MAX} events')
+        parsed = []
+        for event in events:
+            kind = event.get('type', 'view')
+            if kind not in EVENT_TYPES:
+                raise ValueError(f'type must be one of {", ".join(EVENT_TYPES)}')
+            session_id = str(event.get('session_id') or '')[:64]
+            if not user_id and not session_id:
+                raise ValueError('session_id required for anonymous viewers')
+            viewer = f'u{user_id}' if user_id else f's{session_id}'
+            watch_seconds = min(max(float(event.get('watch_seconds') or 0), 0), HEARTBEAT_MAX_SECONDS)
+            position = max(float(event.get('position') or 0), 0)
+            parsed.append((int(event['stream_id']), viewer if kind == 'view' else '', watch_seconds, position))
+        return parsed
+
+    def ingest(self, conn, events: List[Tuple[int, str, float, float]]) -> int:
+        # Одна строка TSV на событие и один COPY на запрос: десятки тысяч событий в секунду на ядро
+        buf = io.StringIO()
+        counted = 0
+        with self._lock:
+            for stream_id, viewer, watch_seconds, position in events:
+                is_view = bool(viewer) and self._first_in_window(viewer, stream_id)
+                counted += is_view
+                buf.write(f"{stream_id}\t{'t' if is_view else 'f'}\t{watch_seconds}\t{position}\n")
+        buf.seek(0)
+        cur = conn.cursor()
+        cur.copy_expert(
+            "COPY view_events_staging (stream_id, is_view, watch_seconds, position) FROM STDIN", buf
+        )
+        conn.commit()
+        cur.close()
+        views = sum(1 for event in events if event[1])
+        with self._lock:
+            self._stats['events'] += len(events)
+            self._stats['views_counted'] += counted
+            self._stats['views_duplicate'] += views - counted
+        return counted
+
+    def rollup(self, conn, batch: int = ROLLUP_BATCH) -> int:
+        cur = conn.cursor()
+        try:
+            # Один rollup на всю базу: остальные экземпляры функции просто пропускают ход
+            cur.execute("SELECT pg_try_advisory_xact_lock(hashtext('view_events_rollup'))")
+            if not cur.fetchone()[0]:
+                conn.rollback()
+                return 0
+            # Перенос, почасовая агрегация и счётчик одним оператором: либо всё, либо ничего
+            cur.execute("""
+                WITH moved AS (
+                    DELETE FROM view_events_staging
+                    WHERE id IN (SELECT id FROM view_events_staging ORDER BY id LIMIT %s)
+                    RETURNING stream_id, date_trunc('hour', created_at) AS hour, is_view, watch_seconds
+                ), hourly AS (
+                    INSERT INTO stream_views_hourly AS h (stream_id, hour, views, heartbeats, watch_seconds)
+                    SELECT stream_id, hour, count(*) FILTER (WHERE is_view), count(*) FILTER (WHERE NOT is_view),
+                           sum(watch_seconds)
+                    FROM moved
+                    GROUP BY stream_id, hour
+                    ON CONFLICT (stream_id, hour) DO UPDATE SET
+                        views = h.views + EXCLUDED.views,
+                        heartbeats = h.heartbeats + EXCLUDED.heartbeats,
+                        watch_seconds = h.watch_seconds + EXCLUDED.watch_seconds
+                ), totals AS (
+                    UPDATE streams AS s SET view_count = s.view_count + t.views
+                    FROM (
+                        SELECT stream_id, count(*)::int AS views FROM moved WHERE is_view GROUP BY stream_id
+                    ) AS t
+                    WHERE s.id = t.stream_id
+                )
+                SELECT count(*) FROM moved
+            """, (batch,))
+            moved = cur.fetchone()[0]
+            conn.commit()
+            cur.close()
+        except Exception:
+            conn.rollback()
+            raise
+        with self._lock:
+            self._stats['rollups'] += 1
+            self._stats['rows_rolled_up'] += moved
+        return moved
+
+    def maybe_rollup(self, conn) -> int:
+        now = time.monotonic()
+        if now - self._last_rollup < ROLLUP_INTERVAL:
+            return 0
+        self._last_rollup = now
+        return self.rollup(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, 'window_seconds': self.window, 'bloom_keys': self._seen.added}
+
+
+views = ViewIngest()
@@ -0,0 +1,231 @@
+'''
+Business: Live chat for streams: per-stream ring buffer of recent messages, per-user rate limit, batched durable writes
+Args: CHAT_HISTORY_SIZE, CHAT_RATE_PER_SEC, CHAT_BURST, CHAT_FLUSH_SECONDS, CHAT_MAX_TRACKED, CHAT_MAX_UNSAVED env vars; DATABASE_URL for persistence
+Returns: ChatHub used by server.py for POST /chat/send and GET /chat/history
+'''
+
+import asyncio
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import date, datetime
+from typing import Any, Deque, Dict, List, Tuple
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+import session
+
+HISTORY_SIZE = int(os.environ.get('CHAT_HISTORY_SIZE', '200'))
+RATE_PER_SEC = float(os.environ.get('CHAT_RATE_PER_SEC', '1'))
+BURST = float(os.environ.get('CHAT_BURST', '5'))
+FLUSH_SECONDS = float(os.environ.get('CHAT_FLUSH_SECONDS', '0.5'))
+FLUSH_SIZE = 1000
+DELIVERY_TICK_SECONDS = 0.1
+LIVE_CACHE_SECONDS = 10
+MAX_MESSAGE_LENGTH = 500
+# Upper bound on rate-limit buckets and cached live flags; the least recently used entries are dropped
+MAX_TRACKED = int(os.environ.get('CHAT_MAX_TRACKED', '100000'))
+# Messages waiting for the database during an outage; past this the oldest are dropped and counted
+MAX_UNSAVED = int(os.environ.get('CHAT_MAX_UNSAVED', '100000'))
+
+Message = Dict[str, Any]
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self):
+        self.tokens = BURST
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        # Returns 0 when allowed, otherwise seconds until the next token
+        now = time.monotonic()
+        self.tokens = min(BURST, self.tokens + (now - self.updated) * RATE_PER_SEC)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / RATE_PER_SEC
+
+
+class ChatHub:
+    def __init__(self, hub, dsn: str):
+        self.hub = hub
+        self.dsn = dsn
+        self.history: Dict[int, Deque[Message]] = {}
+        self.buckets: 'OrderedDict[int, TokenBucket]' = OrderedDict()
+        self.outbox: Dict[int, List[Message]] = {}
+        self.unsaved: List[Message] = []
+        self.live: 'OrderedDict[int, Tuple[bool, float]]' = OrderedDict()
+        self._ids = itertools.count(int(time.time() * 1000) * 1000)
+        self._db = None
+        self._db_lock = threading.Lock()
+        self.stats = {'accepted': 0, 'rate_limited': 0, 'persisted': 0, 'flush_errors': 0, 'dropped': 0}
+
+    def _conn(self):
+        # Reconnects lazily after the server closed the connection
+        if self._db is None or self._db.closed:
+            self._db = psycopg2.connect(self.dsn)
+        return self._db
+
+    def _query(self, sql: str, params: Tuple) -> List[Tuple]:
+        with self._db_lock:
+            conn = self._conn()
+            try:
+                cur = conn.cursor()
+                cur.execute(sql, params)
+                rows = cur.fetchall() if cur.description else []
+                conn.commit()
+                cur.close()
+                return rows
+            except psycopg2.Error:
+                conn.rollback()
+                raise
+
+    def sync_revocations(self) -> None:
+        # Logouts from the HTTP functions reach this process through revoked_tokens; during an outage the
+        # cached list keeps answering and the next due sync catches up
+        with self._db_lock:
+            try:
+                conn = self._conn()
+            except psycopg2.Error:
+                return
+            try:
+                session.revocations.sync(conn)
+                conn.commit()
+            except psycopg2.Error:
+                if not conn.closed:
+                    conn.rollback()
+
+    async def _run(self, sql: str, params: Tuple) -> List[Tuple]:
+        # One persistence connection, used from one executor thread at a time
+        return await asyncio.get_running_loop().run_in_executor(None, self._query, sql, params)
+
+    async def is_live(self, stream_id: int) -> bool:
+        cached = self.live.get(stream_id)
+        if cached and time.monotonic() - cached[1] < LIVE_CACHE_SECONDS:
+            return cached[0]
+        rows = await self._run(
+            "SELECT is_live FROM t_p79487843_youtube_analog_devel.streams WHERE id = %s", (stream_id,)
+        )
+        live = bool(rows and rows[0][0])
+        self._remember(self.live, stream_id, (live, time.monotonic()))
+        return live
+
+    def on_status(self, stream_id: int, is_live: bool) -> None:
+        self._remember(self.live, stream_id, (is_live, time.monotonic()))
+
+    @staticmethod
+    def _remember(cache: OrderedDict, key: int, value: Any) -> None:
+        cache[key] = value
+        cache.move_to_end(key)
+        if len(cache) > MAX_TRACKED:
+            cache.popitem(last=False)
+
+    async def ring(self, stream_id: int) -> Deque[Message]:
+        ring = self.history.get(stream_id)
+        if ring is None:
+            # Cold ring (server restart or first reader): warm it once from durable storage
+            rows = await self._run(
+                "SELECT id, user_id, body, created_at FROM t_p79487843_youtube_analog_devel.chat_messages "
+                "WHERE stream_id = %s ORDER BY created_at DESC, id DESC LIMIT %s",
+                (stream_id, HISTORY_SIZE)
+            )
+            ring = self.history.setdefault(stream_id, deque(maxlen=HISTORY_SIZE))
+            if not ring:
+                ring.extend({'id': r[0], 'stream_id': stream_id, 'user_id': r[1], 'text': r[2],
+                             'at': r[3].timestamp()} for r in reversed(rows))
+        return ring
+
+    async def history_for(self, stream_id: int, limit: int) -> List[Message]:
+        return list(await self.ring(stream_id))[-limit:]
+
+    async def post(self, stream_id: int, user_id: int, text: str) -> Tuple[int, Dict[str, Any]]:
+        text = text.strip()
+        if not text or len(text) > MAX_MESSAGE_LENGTH:
+            return 400, {'error': f'text must be 1..{MAX_MESSAGE_LENGTH} characters'}
+        bucket = self.buckets.get(user_id) or TokenBucket()
+        self._remember(self.buckets, user_id, bucket)
+        retry_after = bucket.take()
+        if retry_after:
+            self.stats['rate_limited'] += 1
+            return 429, {'error': 'Too many messages', 'retry_after': round(retry_after, 2)}
+        if not await self.is_live(stream_id):
+            return 409, {'error': 'Stream is not live'}
+
+        message = {'id': next(self._ids), 'stream_id': stream_id, 'user_id': user_id, 'text': text,
+                   'at': time.time()}
+        (await self.ring(stream_id)).append(message)
+        self.outbox.setdefault(stream_id, []).append(message)
+        self.unsaved.append(message)
+        self._trim_unsaved()
+        self.stats['accepted'] += 1
+        return 200, message
+
+    async def deliver(self) -> None:
+        # Messages are batched per stream for a short tick so a 50k-viewer chat costs one write per viewer per tick
+        while True:
+            await asyncio.sleep(DELIVERY_TICK_SECONDS)
+            if not self.outbox:
+                continue
+            outbox, self.outbox = self.outbox, {}
+            for stream_id, messages in outbox.items():
+                for client in self.hub.watchers.get(stream_id, ()):
+                    client.push_chat(messages)
+
+    def _persist(self, batch: List[Message]) -> None:
+        with self._db_lock:
+            conn = self._conn()
+            try:
+                cur = conn.cursor()
+                execute_values(cur, """
+                    INSERT INTO t_p79487843_youtube_analog_devel.chat_messages (id, stream_id, user_id, body, created_at)
+                    VALUES %s ON CONFLICT DO NOTHING
+                """, [(m['id'], m['stream_id'], m['user_id'], m['text'], datetime.fromtimestamp(m['at'])) for m in batch],
+                    page_size=len(batch))
+                conn.commit()
+                cur.close()
+            except psycopg2.Error:
+                conn.rollback()
+                raise
+
+    async def persist(self) -> None:
+        while True:
+            await asyncio.sleep(FLUSH_SECONDS)
+            while self.unsaved:
+                batch, self.unsaved = self.unsaved[:FLUSH_SIZE], self.unsaved[FLUSH_SIZE:]
+                try:
+                    await asyncio.get_running_loop().run_in_executor(None, self._persist, batch)
+                    self.stats['persisted'] += len(batch)
+                except psycopg2.Error:
+                    self.stats['flush_errors'] += 1
+                    self.unsaved[:0] = batch
+                    self._trim_unsaved()
+                    break
+
+    def _trim_unsaved(self) -> None:
+        # Recent messages are still in the ring buffers; only their durable copy is lost
+        overflow = len(self.unsaved) - MAX_UNSAVED
+        if overflow > 0:
+            del self.unsaved[:overflow]
+            self.stats['dropped'] += overflow
+
+    def ensure_partitions(self, months_ahead: int = 2) -> None:
+        today = date.today()
+        for i in range(months_ahead + 1):
+            year, month = divmod(today.month - 1 + i, 12)
+            start = date(today.year + year, month + 1, 1)
+            year, month = divmod(start.month, 12)
+            end = date(start.year + year, month + 1, 1)
+            self._query(
+                f"CREATE TABLE IF NOT EXISTS t_p79487843_youtube_analog_devel.chat_messages_{start:%Y%m} "
+                "PARTITION OF t_p79487843_youtube_analog_devel.chat_messages FOR VALUES FROM (%s) TO (%s)",
+                (start, end)
+            )
+
+    def stats_snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, 'streams': len(self.history), 'unsaved': len(self.unsaved), 'users': len(self.buckets)}
@@ -0,0 +1,83 @@
+'''
+Business: Admin listings (users, videos) streamed from a server-side cursor as NDJSON, chunk by chunk
+Args: an open psycopg2 connection and a table name from EXPORTS; ADMIN_EXPORT_QUEUE_CHUNKS env var
+Returns: export_chunks() async generator of encoded NDJSON chunks used by server.py for GET /admin/export
+'''
+
+import asyncio
+import os
+import queue
+import threading
+from typing import AsyncIterator, Dict, Tuple
+
+from jsonstream import RowEncoder, open_server_cursor
+
+# Chunks encoded ahead of the socket; a slow reader stalls the cursor instead of growing memory
+QUEUE_CHUNKS = int(os.environ.get('ADMIN_EXPORT_QUEUE_CHUNKS', '4'))
+PUT_POLL_SECONDS = 1
+
+# Same columns as the paged api listings (admin.ADMIN_USERS / ADMIN_VIDEOS)
+EXPORTS: Dict[str, Tuple[RowEncoder, str]] = {
+    'users': (RowEncoder(('id', 'username', 'display_name', 'email', 'subscriber_count', 'is_verified')),
+              "SELECT id, username, display_name, email, subscriber_count, is_verified "
+              "FROM t_p79487843_youtube_analog_devel.users ORDER BY id"),
+    'videos': (RowEncoder(('stream_id', 'title', 'user_id', 'view_count', 'like_count')),
+               "SELECT id, title, user_id, view_count, like_count "
+               "FROM t_p79487843_youtube_analog_devel.streams ORDER BY id"),
+}
+
+_DONE = object()
+
+
+def _put(chunks: queue.Queue, item, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            chunks.put(item, timeout=PUT_POLL_SECONDS)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(chunks: queue.Queue, stop: threading.Event):
+    # Polls too, so a cancelled request never leaves an executor thread parked on the queue
+    while not stop.is_set():
+        try:
+            return chunks.get(timeout=PUT_POLL_SECONDS)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def _produce(conn, table: str, chunks: queue.Queue, stop: threading.Event) -> None:
+    # Runs in an executor thread: the named cursor and the encoding never block the event loop
+    encoder, query = EXPORTS[table]
+    try:
+        cur = open_server_cursor(conn, f'admin_export_{table}', query)
+        for chunk in encoder.encode_chunks(cur, ndjson=True):
+            if not _put(chunks, chunk.encode(), stop):
+                break
+        cur.close()
+        conn.rollback()
+        _put(chunks, _DONE, stop)
+    except Exception as e:
+        _put(chunks, e, stop)
+
+
+async def export_chunks(conn, table: str) -> AsyncIterator[bytes]:
+    # Raises the cursor's error to the caller; closing the generator early stops the producer thread
+    loop = asyncio.get_running_loop()
+    chunks: queue.Queue = queue.Queue(maxsize=QUEUE_CHUNKS)
+    stop = threading.Event()
+    producer = loop.run_in_executor(None, _produce, conn, table, chunks, stop)
+    try:
+        while True:
+            item = await loop.run_in_executor(None, _get, chunks, stop)
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        await producer
@@ -0,0 +1,411 @@
+'''
+Business: Push channel for live counters, stream status and chat (SSE and long-poll) fed by one shared Postgres LISTEN
+Args: run as `python server.py --port 8080`; DATABASE_URL, SESSION_SECRET, REALTIME_TICK_SECONDS env vars.
+      GET /events?streams=1,2,3 opens an SSE stream, GET /poll?streams=1,2,3&since=SEQ&wait=25 long-polls,
+      POST /chat/send?stream_id=X (Authorization: Bearer token, {"text": ...}) and GET /chat/history?stream_id=X&limit=N,
+      GET /admin/export?table=users|videos (Authorization: Bearer token) streams an admin listing as chunked NDJSON
+Returns: per-tick coalesced diffs {stream_id: {field: value}} and `chat` events for the streams a client watches
+'''
+
+import argparse
+import asyncio
+import json
+import os
+from collections import defaultdict, deque
+from contextlib import aclosing
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import psycopg2
+
+import session
+from chat import HISTORY_SIZE, ChatHub
+from export import EXPORTS, export_chunks
+
+TICK_SECONDS = float(os.environ.get('REALTIME_TICK_SECONDS', '1'))
+HISTORY_TICKS = 120
+MAX_STREAMS_PER_CLIENT = 200
+MAX_POLL_WAIT = 25
+MAX_BODY_BYTES = 4096
+SSE_KEEPALIVE_SECONDS = 15
+CHANNELS = ('stream_counters', 'stream_status')
+DB_UNAVAILABLE = ('503 Service Unavailable', {'error': 'Database unavailable'}, 'Retry-After: 1\r\n')
+
+Diff = Dict[int, Dict[str, Any]]
+
+
+class Client:
+    def __init__(self, streams: Set[int]):
+        self.streams = streams
+        self.diff: Diff = {}
+        self.chat: Deque[Dict[str, Any]] = deque(maxlen=HISTORY_SIZE)
+        self.seq = 0
+        self.ready = asyncio.Event()
+
+    def push(self, seq: int, diff: Diff) -> None:
+        # A slow client does not queue up ticks: unsent diffs are merged into the next write
+        for stream_id, fields in diff.items():
+            self.diff.setdefault(stream_id, {}).update(fields)
+        self.seq = seq
+        self.ready.set()
+
+    def push_chat(self, messages: List[Dict[str, Any]]) -> None:
+        # Chat is not coalesced, but a client that lags more than the ring size loses the oldest lines
+        self.chat.extend(messages)
+        self.ready.set()
+
+    def take(self) -> Tuple[int, Diff, List[Dict[str, Any]]]:
+        diff, self.diff = self.diff, {}
+        chat = list(self.chat)
+        self.chat.clear()
+        self.ready.clear()
+        return self.seq, diff, chat
+
+
+class Hub:
+    def __init__(self, tick: float = TICK_SECONDS):
+        self.tick = tick
+        self.watchers: Dict[int, Set[Client]] = defaultdict(set)
+        self.pending: Diff = {}
+        self.history: Deque[Tuple[int, Diff]] = deque(maxlen=HISTORY_TICKS)
+        self.seq = 0
+        self._tick_waiters: List[asyncio.Future] = []
+        self.stats = {'notifications': 0, 'ticks': 0, 'client_writes': 0}
+
+    def subscribe(self, client: Client) -> None:
+        for stream_id in client.streams:
+            self.watchers[stream_id].add(client)
+
+    def unsubscribe(self, client: Client) -> None:
+        for stream_id in client.streams:
+            watchers = self.watchers.get(stream_id)
+            if watchers:
+                watchers.discard(client)
+                if not watchers:
+                    del self.watchers[stream_id]
+
+    def publish(self, stream_id: int, fields: Dict[str, Any]) -> None:
+        self.stats['notifications'] += 1
+        self.pending.setdefault(stream_id, {}).update(fields)
+
+    def since(self, seq: int, streams: Set[int]) -> Optional[Tuple[int, Diff]]:
+        # None means the client fell behind the history window and must reload its state
+        if self.history and seq < self.history[0][0] - 1:
+            return None
+        merged: Diff = {}
+        for tick_seq, changed in self.history:
+            if tick_seq <= seq:
+                continue
+            for stream_id in streams & changed.keys():
+                merged.setdefault(stream_id, {}).update(changed[stream_id])
+        return self.seq, merged
+
+    async def next_tick(self, timeout: float) -> None:
+        future = asyncio.get_running_loop().create_future()
+        self._tick_waiters.append(future)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.tick)
+            if not self.pending:
+                continue
+            changed, self.pending = self.pending, {}
+            self.seq += 1
+            self.stats['ticks'] += 1
+            self.history.append((self.seq, changed))
+
+            per_client: Dict[Client, Diff] = {}
+            for stream_id, fields in changed.items():
+                for client in self.watchers.get(stream_id, ()):
+                    per_client.setdefault(client, {})[stream_id] = fields
+            for client, diff in per_client.items():
+                client.push(self.seq, diff)
+            self.stats['client_writes'] += len(per_client)
+
+            waiters, self._tick_waiters = self._tick_waiters, []
+            for future in waiters:
+                if not future.done():
+                    future.set_result(None)
+
+
+class NotifyListener:
+    def __init__(self, hub: Hub, chat: ChatHub, dsn: str):
+        self.hub = hub
+        self.chat = chat
+        self.dsn = dsn
+        self.conn = None
+        self.lost: Optional[asyncio.Event] = None
+
+    def _connect(self) -> None:
+        self.conn = psycopg2.connect(self.dsn)
+        self.conn.autocommit = True
+        cur = self.conn.cursor()
+        for channel in CHANNELS:
+            cur.execute(f'LISTEN {channel}')
+        cur.close()
+
+    def _on_readable(self) -> None:
+        try:
+            self.conn.poll()
+        except psycopg2.Error:
+            self.lost.set()
+            return
+        while self.conn.notifies:
+            notify = self.conn.notifies.pop(0)
+            try:
+                payload = json.loads(notify.payload)
+                stream_id = int(payload.pop('stream_id'))
+            except (ValueError, KeyError, TypeError):
+                continue
+            payload.pop('id', None)
+            if notify.channel == 'stream_status':
+                self.chat.on_status(stream_id, bool(payload.get('is_live')))
+            self.hub.publish(stream_id, payload)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self._connect)
+            except psycopg2.Error:
+                await asyncio.sleep(2)
+                continue
+            self.lost = asyncio.Event()
+            fd = self.conn.fileno()
+            loop.add_reader(fd, self._on_readable)
+            await self.lost.wait()
+            loop.remove_reader(fd)
+            try:
+                self.conn.close()
+            except psycopg2.Error:
+                pass
+
+
+def parse_streams(query: Dict[str, List[str]]) -> Set[int]:
+    raw = (query.get('streams') or [''])[0]
+    streams = {int(part) for part in raw.split(',') if part.strip()}
+    if not streams or len(streams) > MAX_STREAMS_PER_CLIENT:
+        raise ValueError(f'streams must list 1..{MAX_STREAMS_PER_CLIENT} ids')
+    return streams
+
+
+def http_head(status: str, content_type: str, extra: str = '') -> bytes:
+    return (
+        f'HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n'
+        f'Access-Control-Allow-Origin: *\r\nCache-Control: no-cache\r\n{extra}\r\n'
+    ).encode()
+
+
+async def write_json(writer: asyncio.StreamWriter, status: str, payload: Any, extra: str = '') -> None:
+    body = json.dumps(payload).encode()
+    writer.write(http_head(status, 'application/json', f'Content-Length: {len(body)}\r\nConnection: close\r\n{extra}') + body)
+    await writer.drain()
+
+
+async def serve_sse(hub: Hub, client: Client, writer: asyncio.StreamWriter) -> None:
+    writer.write(http_head('200 OK', 'text/event-stream', 'Connection: keep-alive\r\n'))
+    writer.write(f'retry: 3000\nid: {hub.seq}\n\n'.encode())
+    await writer.drain()
+    hub.subscribe(client)
+    try:
+        while True:
+            try:
+                await asyncio.wait_for(client.ready.wait(), SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                writer.write(b': keepalive\n\n')
+                await writer.drain()
+                continue
+            seq, diff, chat = client.take()
+            if diff:
+                writer.write(f'id: {seq}\ndata: {json.dumps(diff)}\n\n'.encode())
+            if chat:
+                writer.write(f'event: chat\ndata: {json.dumps(chat)}\n\n'.encode())
+            await writer.drain()
+    finally:
+        hub.unsubscribe(client)
+
+
+async def serve_poll(hub: Hub, streams: Set[int], since: int, wait: float, writer: asyncio.StreamWriter) -> None:
+    deadline = asyncio.get_running_loop().time() + wait
+    while True:
+        result = hub.since(since, streams)
+        if result is None:
+            await write_json(writer, '200 OK', {'seq': hub.seq, 'resync': True, 'diff': {}})
+            return
+        seq, diff = result
+        remaining = deadline - asyncio.get_running_loop().time()
+        if diff or remaining <= 0:
+            await write_json(writer, '200 OK', {'seq': seq, 'diff': diff})
+            return
+        await hub.next_tick(remaining)
+
+
+async def authenticate(chat: ChatHub, headers: Dict[str, str], writer: asyncio.StreamWriter) -> Optional[int]:
+    # Same signed session tokens as the HTTP functions; answers 401 itself and returns None on failure
+    scheme, _, token = headers.get('authorization', '').partition(' ')
+    if scheme.lower() != 'bearer':
+        await write_json(writer, '401 Unauthorized', {'error': 'Authorization: Bearer token required'})
+        return None
+    if session.revocations.due():
+        await asyncio.get_running_loop().run_in_executor(None, chat.sync_revocations)
+    try:
+        return int(session.verify(token.strip())['sub'])
+    except session.SessionError as e:
+        await write_json(writer, '401 Unauthorized', {'error': str(e)})
+        return None
+
+
+async def serve_export(chat: ChatHub, query: Dict[str, List[str]], headers: Dict[str, str],
+                       writer: asyncio.StreamWriter) -> None:
+    table = (query.get('table') or [''])[0]
+    if table not in EXPORTS:
+        await write_json(writer, '400 Bad Request', {'error': f'table must be one of {", ".join(EXPORTS)}'})
+        return
+    if await authenticate(chat, headers, writer) is None:
+        return
+    try:
+        conn = await asyncio.get_running_loop().run_in_executor(None, psycopg2.connect, chat.dsn)
+    except psycopg2.Error:
+        await write_json(writer, *DB_UNAVAILABLE)
+        return
+    try:
+        writer.write(http_head('200 OK', 'application/x-ndjson', 'Transfer-Encoding: chunked\r\n'))
+        async with aclosing(export_chunks(conn, table)) as chunks:
+            async for chunk in chunks:
+                writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                await writer.drain()
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+    except psycopg2.Error:
+        # Status and headers are already sent: a connection cut before the last chunk is what tells
+        # the client the listing is incomplete
+        writer.transport.abort()
+    finally:
+        conn.close()
+
+
+async def serve_chat(chat: ChatHub, path: str, query: Dict[str, List[str]], headers: Dict[str, str],
+                     body: bytes, writer: asyncio.StreamWriter) -> None:
+    try:
+        stream_id = int((query.get('stream_id') or [''])[0])
+    except ValueError:
+        await write_json(writer, '400 Bad Request', {'error': 'stream_id required'})
+        return
+    if path == '/chat/history':
+        try:
+            limit = min(max(int((query.get('limit') or [HISTORY_SIZE])[0]), 1), HISTORY_SIZE)
+        except ValueError:
+            limit = HISTORY_SIZE
+        try:
+            messages = await chat.history_for(stream_id, limit)
+        except psycopg2.Error:
+            await write_json(writer, *DB_UNAVAILABLE)
+            return
+        await write_json(writer, '200 OK', {'messages': messages})
+        return
+    # The sender is the token subject, never a header
+    user_id = await authenticate(chat, headers, writer)
+    if user_id is None:
+        return
+    try:
+        text = str(json.loads(body or b'{}').get('text') or '')
+    except (ValueError, AttributeError):
+        await write_json(writer, '400 Bad Request', {'error': 'JSON body with text required'})
+        return
+    try:
+        status, payload = await chat.post(stream_id, user_id, text)
+    except psycopg2.Error:
+        # Cold ring or live-flag lookup hit a database outage: answer instead of dropping the socket
+        await write_json(writer, *DB_UNAVAILABLE)
+        return
+    statuses = {200: '200 OK', 400: '400 Bad Request', 409: '409 Conflict', 429: '429 Too Many Requests'}
+    extra = f'Retry-After: {max(int(payload["retry_after"] + 0.999), 1)}\r\n' if status == 429 else ''
+    await write_json(writer, statuses[status], payload, extra)
+
+
+def make_handler(hub: Hub, chat: ChatHub):
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            headers: Dict[str, str] = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            if len(request_line) < 2:
+                return
+            method = request_line[0]
+            url = urlsplit(request_line[1])
+            query = parse_qs(url.query)
+            if method == 'OPTIONS':
+                writer.write(http_head('204 No Content', 'text/plain', (
+                    'Access-Control-Allow-Methods: GET, POST, OPTIONS\r\n'
+                    'Access-Control-Allow-Headers: Content-Type, Authorization\r\nContent-Length: 0\r\n'
+                )))
+                await writer.drain()
+                return
+            if method == 'POST' and url.path == '/chat/send':
+                length = min(int(headers.get('content-length') or 0), MAX_BODY_BYTES)
+                body = await reader.readexactly(length) if length else b''
+                await serve_chat(chat, url.path, query, headers, body, writer)
+                return
+            if method != 'GET':
+                await write_json(writer, '405 Method Not Allowed', {'error': 'Method not allowed'})
+                return
+            if url.path == '/stats':
+                await write_json(writer, '200 OK', {**hub.stats, 'seq': hub.seq, 'watched_streams': len(hub.watchers),
+                                                    'chat': chat.stats_snapshot()})
+                return
+            if url.path == '/chat/history':
+                await serve_chat(chat, url.path, query, headers, b'', writer)
+                return
+            if url.path == '/admin/export':
+                await serve_export(chat, query, headers, writer)
+                return
+            try:
+                streams = parse_streams(query)
+                since = int((query.get('since') or [hub.seq])[0])
+                wait = min(max(float((query.get('wait') or [MAX_POLL_WAIT])[0]), 0), MAX_POLL_WAIT)
+            except ValueError as e:
+                await write_json(writer, '400 Bad Request', {'error': str(e)})
+                return
+            if url.path == '/events':
+                await serve_sse(hub, Client(streams), writer)
+            elif url.path == '/poll':
+                await serve_poll(hub, streams, since, wait, writer)
+            else:
+                await write_json(writer, '404 Not Found', {'error': 'Not found'})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+    return handle
+
+
+async def main_async(host: str, port: int) -> None:
+    dsn = os.environ['DATABASE_URL']
+    hub = Hub()
+    chat = ChatHub(hub, dsn)
+    await asyncio.get_running_loop().run_in_executor(None, chat.ensure_partitions)
+    listener = NotifyListener(hub, chat, dsn)
+    server = await asyncio.start_server(make_handler(hub, chat), host, port, backlog=4096)
+    async with server:
+        await asyncio.gather(server.serve_forever(), hub.run(), listener.run(), chat.deliver(), chat.persist())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Realtime push server')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args()
+    asyncio.run(main_async(args.host, args.port))
+
+
+if __name__ == '__main__':
+    main()
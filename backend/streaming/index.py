@@ -1,124 +1,315 @@
 '''
 Business: Create and manage live streaming sessions
-Args: event with httpMethod, body with action (create_stream, start_stream, stop_stream), headers with X-User-Id
+Args: event with httpMethod, queryStringParameters.action (create_stream, start_stream, stop_stream, heartbeat, viewer_heartbeat, live, live_events), Authorization: Bearer token
 Returns: JSON with stream data including stream_key and status
 '''
 
 import json
 import os
+import select
+import sys
+import threading
+import time
 import uuid
-from typing import Dict, Any
+from typing import Dict, Any, List, Tuple
+
 import psycopg2
 
-def get_db_connection():
-    dsn = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(dsn)
+from db import connection
+from ratelimit import Limit
+from router import HttpError, Request, Router, response
 
-def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    method: str = event.get('httpMethod', 'GET')
-    
-    # Handle CORS
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
-    
-    headers = event.get('headers', {})
-    user_id = headers.get('X-User-Id') or headers.get('x-user-id')
-    
-    if not user_id:
-        return {
-            'statusCode': 401,
-            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'body': json.dumps({'error': 'User ID required'})
-        }
-    
-    params = event.get('queryStringParameters', {}) or {}
-    action = params.get('action', 'create_stream')
-    
-    conn = get_db_connection()
+LIVE_TTL_SECONDS = int(os.environ.get('LIVE_TTL_SECONDS', '30'))
+VIEWER_TTL_SECONDS = int(os.environ.get('VIEWER_TTL_SECONDS', '60'))
+SWEEP_INTERVAL_SECONDS = 10
+LIVE_EVENTS_MAX_WAIT = 25
+LISTENER_READY_TIMEOUT = 5
+LISTENER_RECONNECT_SECONDS = 1
+
+_last_sweep = 0.0
+
+def sweep_expired(cur) -> None:
+    # Broadcasters that stopped heartbeating (crash, lost network) are taken off air
+    global _last_sweep
+    now = time.monotonic()
+    if now - _last_sweep < SWEEP_INTERVAL_SECONDS:
+        return
+    _last_sweep = now
+    cur.execute(
+        "UPDATE t_p79487843_youtube_analog_devel.streams SET is_live = FALSE, ended_at = NOW() "
+        "WHERE is_live AND (last_heartbeat_at IS NULL OR last_heartbeat_at < NOW() - make_interval(secs => %s))",
+        (LIVE_TTL_SECONDS,)
+    )
+    cur.execute(
+        "DELETE FROM t_p79487843_youtube_analog_devel.live_viewers WHERE last_seen < NOW() - make_interval(secs => %s)",
+        (VIEWER_TTL_SECONDS,)
+    )
+
+def create_stream(request: Request) -> Dict[str, Any]:
+    user_id = request.require_user()
+    title = request.body.get('title', 'Untitled Stream')
+    description = request.body.get('description', '')
+
+    # Generate unique stream key
+    stream_key = str(uuid.uuid4())
+
+    conn = request.db()
     cur = conn.cursor()
-    
-    if action == 'create_stream':
-        body_data = json.loads(event.get('body', '{}'))
-        title = body_data.get('title', 'Untitled Stream')
-        description = body_data.get('description', '')
-        
-        # Generate unique stream key
-        stream_key = str(uuid.uuid4())
-        
-        cur.execute(
-            "INSERT INTO t_p79487843_youtube_analog_devel.streams (title, user_id, description, is_live, stream_key, created_at) VALUES (%s, %s, %s, FALSE, %s, NOW()) RETURNING id",
-            (title, int(user_id), description, stream_key)
-        )
-        stream_id = cur.fetchone()[0]
-        
-        conn.commit()
-        cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'isBase64Encoded': False,
-            'body': json.dumps({
-                'stream_id': stream_id,
-                'stream_key': stream_key,
-                'stream_url': f'rtmp://stream.example.com/live/{stream_key}',
-                'watch_url': f'/watch?v={stream_id}'
-            })
-        }
-    
-    elif action == 'start_stream':
-        stream_id = params.get('stream_id')
-        
+    cur.execute(
+        "INSERT INTO t_p79487843_youtube_analog_devel.streams (title, user_id, description, is_live, stream_key, created_at) VALUES (%s, %s, %s, FALSE, %s, NOW()) RETURNING id",
+        (title, user_id, description, stream_key)
+    )
+    stream_id = cur.fetchone()[0]
+
+    conn.commit()
+    cur.close()
+
+    return response(200, {
+        'stream_id': stream_id,
+        'stream_key': stream_key,
+        'stream_url': f'rtmp://stream.example.com/live/{stream_key}',
+        'watch_url': f'/watch?v={stream_id}'
+    })
+
+def start_stream(request: Request) -> Dict[str, Any]:
+    user_id = request.require_user()
+    stream_id = request.query.get('stream_id')
+
+    conn = request.db()
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE t_p79487843_youtube_analog_devel.streams SET is_live = TRUE, started_at = NOW(), ended_at = NULL, last_heartbeat_at = NOW() WHERE id = %s AND user_id = %s",
+        (int(stream_id), user_id)
+    )
+
+    conn.commit()
+    cur.close()
+
+    return response(200, {'message': 'Stream started', 'is_live': True, 'heartbeat_ttl': LIVE_TTL_SECONDS})
+
+def stop_stream(request: Request) -> Dict[str, Any]:
+    user_id = request.require_user()
+    stream_id = request.query.get('stream_id')
+
+    conn = request.db()
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE t_p79487843_youtube_analog_devel.streams SET is_live = FALSE, ended_at = NOW() WHERE id = %s AND user_id = %s AND is_live",
+        (int(stream_id), user_id)
+    )
+
+    conn.commit()
+    cur.close()
+
+    return response(200, {'message': 'Stream stopped', 'is_live': False})
+
+# Public: the broadcaster authenticates with its stream_key
+def broadcaster_heartbeat(request: Request) -> Dict[str, Any]:
+    stream_key = request.body.get('stream_key')
+    if not stream_key:
+        raise HttpError(400, 'stream_key required')
+
+    conn = request.db()
+    cur = conn.cursor()
+    # A heartbeat after expiry puts the stream back on air as a new session
+    cur.execute(
+        "UPDATE t_p79487843_youtube_analog_devel.streams SET last_heartbeat_at = NOW(), is_live = TRUE, "
+        "started_at = CASE WHEN is_live THEN started_at ELSE NOW() END, ended_at = NULL "
+        "WHERE stream_key = %s RETURNING id",
+        (stream_key,)
+    )
+    row = cur.fetchone()
+    sweep_expired(cur)
+    conn.commit()
+    cur.close()
+
+    if not row:
+        raise HttpError(404, 'Unknown stream_key')
+    return response(200, {'stream_id': row[0], 'is_live': True, 'heartbeat_ttl': LIVE_TTL_SECONDS})
+
+# Public: viewers are anonymous sessions
+def viewer_heartbeat(request: Request) -> Dict[str, Any]:
+    session_id = str(request.body.get('session_id') or '')[:64]
+    try:
+        stream_id = int(request.query.get('stream_id', ''))
+    except ValueError:
+        stream_id = 0
+    if not stream_id or not session_id:
+        raise HttpError(400, 'stream_id and session_id required')
+
+    conn = request.db()
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO t_p79487843_youtube_analog_devel.live_viewers (stream_id, session_id, last_seen) VALUES (%s, %s, NOW()) "
+        "ON CONFLICT (stream_id, session_id) DO UPDATE SET last_seen = EXCLUDED.last_seen",
+        (stream_id, session_id)
+    )
+    cur.execute(
+        "SELECT count(*) FROM t_p79487843_youtube_analog_devel.live_viewers WHERE stream_id = %s AND last_seen > NOW() - make_interval(secs => %s)",
+        (stream_id, VIEWER_TTL_SECONDS)
+    )
+    viewers = cur.fetchone()[0]
+    conn.commit()
+    cur.close()
+
+    return response(200, {'stream_id': stream_id, 'viewers': viewers, 'heartbeat_ttl': VIEWER_TTL_SECONDS})
+
+def live_now(request: Request) -> Dict[str, Any]:
+    conn = request.db()
+    cur = conn.cursor()
+    sweep_expired(cur)
+    conn.commit()
+    # Partial index idx_streams_live_now: cost is proportional to the number of live streams
+    cur.execute(
+        """
+        SELECT s.id, s.title, s.category, s.started_at, s.user_id, u.username, u.display_name, u.avatar_url,
+               (SELECT count(*) FROM t_p79487843_youtube_analog_devel.live_viewers v
+                WHERE v.stream_id = s.id AND v.last_seen > NOW() - make_interval(secs => %s)) AS viewers
+        FROM t_p79487843_youtube_analog_devel.streams s
+        JOIN t_p79487843_youtube_analog_devel.users u ON u.id = s.user_id
+        WHERE s.is_live AND s.last_heartbeat_at > NOW() - make_interval(secs => %s)
+        ORDER BY viewers DESC, s.id DESC
+        """,
+        (VIEWER_TTL_SECONDS, LIVE_TTL_SECONDS)
+    )
+    columns = [d[0] for d in cur.description]
+    streams = [dict(zip(columns, row)) for row in cur.fetchall()]
+    cur.execute("SELECT coalesce(max(id), 0) FROM t_p79487843_youtube_analog_devel.live_events")
+    last_event_id = cur.fetchone()[0]
+    cur.close()
+
+    return response(200, {'streams': streams, 'last_event_id': last_event_id})
+
+class StatusListener:
+    # One LISTEN stream_status connection per instance, outside the pool, shared by every long-poller.
+    # Waiters sleep on a condition instead of a pooled connection, so long-polls cannot starve heartbeats
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._generation = 0
+        self._ready = threading.Event()
+        self._thread = None
+
+    def generation(self) -> Tuple[int, bool]:
+        # Taken before the first read: a NOTIFY that lands between the read and the wait still wakes the waiter
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='stream-status-listener', daemon=True)
+                self._thread.start()
+        ready = self._ready.wait(LISTENER_READY_TIMEOUT)
+        with self._cond:
+            return self._generation, ready
+
+    def wait(self, generation: int, timeout: float) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: self._generation != generation, timeout)
+
+    def _bump(self) -> None:
+        with self._cond:
+            self._generation += 1
+            self._cond.notify_all()
+
+    def _log(self, event: str, error: Exception) -> None:
+        sys.stdout.write(json.dumps({'status_listener': event, 'error': f'{type(error).__name__}: {error}'},
+                                    ensure_ascii=False) + '\n')
+        sys.stdout.flush()
+
+    def _dispatch(self, notifies: List[Any]) -> None:
+        # The payload is not used: waiters re-read live_events, a NOTIFY only wakes them
+        if notifies:
+            self._bump()
+
+    def _run(self) -> None:
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(os.environ['DATABASE_URL'])
+                conn.autocommit = True
+                cur = conn.cursor()
+                cur.execute("LISTEN stream_status")
+                cur.close()
+                self._ready.set()
+                while True:
+                    if select.select([conn], [], [], LIVE_EVENTS_MAX_WAIT)[0]:
+                        conn.poll()
+                        try:
+                            self._dispatch(conn.notifies)
+                        except Exception as e:
+                            # One bad notification must not take the listener down with it
+                            self._log('bad_notify', e)
+                        finally:
+                            conn.notifies.clear()
+            except Exception as e:
+                # Any failure drops the connection: waiters fall back to immediate answers until LISTEN is back,
+                # and events may have been missed meanwhile, so everyone re-reads
+                self._ready.clear()
+                self._bump()
+                self._log('reconnect', e)
+                if conn is not None:
+                    conn.close()
+                time.sleep(LISTENER_RECONNECT_SECONDS)
+
+
+status_listener = StatusListener()
+
+def read_live_events(since: int) -> List[Tuple]:
+    # A pooled connection only for the read itself, never across the wait
+    with connection() as conn:
+        cur = conn.cursor()
         cur.execute(
-            "UPDATE t_p79487843_youtube_analog_devel.streams SET is_live = TRUE WHERE id = %s AND user_id = %s",
-            (int(stream_id), int(user_id))
+            "SELECT id, stream_id, is_live, created_at FROM t_p79487843_youtube_analog_devel.live_events "
+            "WHERE id > %s ORDER BY id LIMIT 500",
+            (since,)
         )
-        
-        conn.commit()
+        rows = cur.fetchall()
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'isBase64Encoded': False,
-            'body': json.dumps({'message': 'Stream started', 'is_live': True})
-        }
-    
-    elif action == 'stop_stream':
-        stream_id = params.get('stream_id')
-        
-        cur.execute(
-            "UPDATE t_p79487843_youtube_analog_devel.streams SET is_live = FALSE WHERE id = %s AND user_id = %s",
-            (int(stream_id), int(user_id))
-        )
-        
         conn.commit()
-        cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'isBase64Encoded': False,
-            'body': json.dumps({'message': 'Stream stopped', 'is_live': False})
-        }
-    
-    cur.close()
-    conn.close()
-    
-    return {
-        'statusCode': 400,
-        'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-        'body': json.dumps({'error': 'Invalid action'})
-    }
\ No newline at end of file
+    return rows
+
+def live_events(request: Request) -> Dict[str, Any]:
+    try:
+        since = int(request.query.get('since', '0'))
+        wait = min(max(float(request.query.get('wait', '0')), 0), LIVE_EVENTS_MAX_WAIT)
+    except ValueError:
+        raise HttpError(400, 'since and wait must be numbers')
+
+    generation, listening = status_listener.generation() if wait else (0, False)
+    rows = read_live_events(since)
+    deadline = time.monotonic() + wait
+    # Long-poll: sleep until the trigger's NOTIFY arrives or time runs out; without a listener answer at once
+    while not rows and listening:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not status_listener.wait(generation, remaining):
+            break
+        generation, listening = status_listener.generation()
+        rows = read_live_events(since)
+
+    events = [
+        {'id': event_id, 'stream_id': stream_id, 'is_live': is_live, 'at': created_at}
+        for event_id, stream_id, is_live, created_at in rows
+    ]
+    return response(200, {'events': events, 'last_event_id': events[-1]['id'] if events else since})
+
+# (method, action) -> token buckets: Limit(scope, tokens per second, burst); other routes are not limited
+LIMITS = {
+    ('POST', 'create_stream'): (Limit('user', 0.1, 5),),
+    ('POST', 'start_stream'): (Limit('user', 0.5, 5),),
+    ('POST', 'stop_stream'): (Limit('user', 0.5, 5),),
+    ('POST', 'heartbeat'): (Limit('ip', 2, 10),),
+    # Viewers behind one NAT share an IP, hence the larger burst
+    ('POST', 'viewer_heartbeat'): (Limit('ip', 10, 50),),
+}
+
+# Unknown actions keep answering 400 as before the router; no action means create_stream
+router = Router({
+    ('POST', 'create_stream'): create_stream,
+    ('POST', 'start_stream'): start_stream,
+    ('POST', 'stop_stream'): stop_stream,
+    ('POST', 'heartbeat'): broadcaster_heartbeat,
+    ('POST', 'viewer_heartbeat'): viewer_heartbeat,
+    ('GET', 'live'): live_now,
+    ('GET', 'live_events'): live_events,
+}, allow_methods='POST, GET, OPTIONS', default_action='create_stream', unknown_action=(400, 'Invalid action'),
+   limits=LIMITS)
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return router.dispatch(event, context)
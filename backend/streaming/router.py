@@ -0,0 +1,303 @@
+"""
+Business: Таблица маршрутов (method, action) -> обработчик и общий конвейер запроса: CORS, разбор тела, соединение с БД (реплика для маршрутов чтения), ошибки, тайминги, трассировка
+Args: словарь маршрутов; обработчик - функция или строка 'модуль:функция', модуль импортируется при первом вызове маршрута
+Returns: Router.dispatch(event, context) для handler облачной функции, Request и response() для обработчиков
+"""
+
+import importlib
+import json
+import threading
+import time
+from contextlib import ExitStack
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple, Union
+
+import ratelimit
+import session
+import tracing
+from db import READ_YOUR_WRITES_SECONDS, REPLICA_URLS, PoolExhausted, connection, replica_pool
+
+JSON_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*'
+}
+
+Handler = Callable[['Request'], Dict[str, Any]]
+
+MAX_WRITERS = 10000
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str, headers: Optional[Dict[str, str]] = None, **extra: Any):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+        self.extra = extra
+
+
+def response(status: int, payload: Any = None, headers: Optional[Dict[str, str]] = None,
+             body: Optional[str] = None) -> Dict[str, Any]:
+    # body - уже сериализованный ответ (из кэша или потокового кодировщика), иначе сериализуем payload
+    if body is None:
+        with tracing.span('serialize'):
+            body = json.dumps(payload, default=str)
+    return {
+        'statusCode': status,
+        'headers': {**JSON_HEADERS, **headers} if headers else JSON_HEADERS,
+        'body': body,
+        'isBase64Encoded': False
+    }
+
+
+class Request:
+    def __init__(self, event: Dict[str, Any], default_action: str = ''):
+        self.event = event
+        self.method: str = event.get('httpMethod', 'GET')
+        self.query: Dict[str, Any] = event.get('queryStringParameters') or {}
+        self.action: str = self.query.get('action', default_action)
+        self.headers: Dict[str, Any] = event.get('headers') or {}
+        self._body: Optional[Dict[str, Any]] = None
+        self._claims: Optional[Dict[str, Any]] = None
+        self._conn = None
+        self._primary = None
+        # read_only ставит Router для маршрутов чтения; on_replica - соединение db() действительно с реплики
+        self.read_only = False
+        self.on_replica = False
+        self._stack = ExitStack()
+        self.router: Optional['Router'] = None
+        self.trace: Optional[tracing.Trace] = None
+
+    def header(self, name: str) -> Optional[str]:
+        value = self.headers.get(name)
+        if value is None:
+            lowered = name.lower()
+            for key, item in self.headers.items():
+                if key.lower() == lowered:
+                    return item
+        return value
+
+    @property
+    def raw_body(self) -> str:
+        return self.event.get('body') or ''
+
+    @property
+    def body(self) -> Dict[str, Any]:
+        if self._body is None:
+            try:
+                self._body = json.loads(self.raw_body or '{}')
+            except ValueError:
+                raise HttpError(400, 'Invalid JSON body')
+            if not isinstance(self._body, dict):
+                raise HttpError(400, 'JSON body must be an object')
+        return self._body
+
+    @property
+    def claims(self) -> Optional[Dict[str, Any]]:
+        # Authorization: Bearer <токен из login>; проверка подписи без обращения к БД
+        if self._claims is None:
+            scheme, _, token = (self.header('Authorization') or '').partition(' ')
+            if scheme.lower() != 'bearer' or not token:
+                return None
+            try:
+                self._claims = session.verify(token.strip())
+            except session.SessionError as e:
+                raise HttpError(401, str(e))
+        return self._claims
+
+    @property
+    def user_id(self) -> Optional[int]:
+        claims = self.claims
+        if claims is not None:
+            return claims['sub']
+        value = self.header('X-User-Id') if session.TRUST_USER_HEADER else None
+        if not value:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise HttpError(400, 'X-User-Id must be an integer')
+
+    @property
+    def client_ip(self) -> str:
+        identity = (self.event.get('requestContext') or {}).get('identity') or {}
+        forwarded = (self.header('X-Forwarded-For') or '').split(',')[0].strip()
+        return identity.get('sourceIp') or forwarded or 'unknown'
+
+    @property
+    def subject(self) -> str:
+        # Чьи это запросы: пользователь из токена, без токена - IP
+        try:
+            user_id = self.user_id
+        except HttpError:
+            user_id = None
+        return f'u{user_id}' if user_id else f'ip{self.client_ip}'
+
+    def require_user(self) -> int:
+        user_id = self.user_id
+        if not user_id:
+            raise HttpError(401, 'User ID required')
+        return user_id
+
+    def db(self):
+        # Соединение берётся из пула при первом обращении и возвращается после ответа;
+        # маршрутам, которые отвечают из кэша, оно не нужно вовсе
+        if self._conn is None:
+            pool = replica_pool() if self.read_only else None
+            self._conn = self._open(pool)
+            self.on_replica = pool is not None
+            # Список отозванных токенов обновляется попутно, на уже взятом соединении
+            if session.revocations.due():
+                session.revocations.sync(self._conn)
+        return self._conn
+
+    def primary(self):
+        # Запись из маршрута чтения (перехеширование пароля, сброс буфера счётчиков) - только в primary
+        if not self.read_only or (self._conn is not None and not self.on_replica):
+            return self.db()
+        if self._primary is None:
+            self._primary = self._open(None)
+        return self._primary
+
+    def _open(self, pool):
+        if self.trace is None:
+            return self._stack.enter_context(connection(pool))
+        with tracing.span('db_connect'):
+            conn = self._stack.enter_context(connection(pool))
+        return tracing.TracedConnection(conn, self.trace)
+
+    def __enter__(self) -> 'Request':
+        return self
+
+    def __exit__(self, *exc_info) -> bool:
+        return self._stack.__exit__(*exc_info)
+
+
+class Router:
+    def __init__(self, routes: Dict[Tuple[str, str], Union[str, Handler]], allow_methods: str,
+                 allow_headers: str = 'Content-Type, Authorization, X-User-Id', default_action: str = '',
+                 unknown_action: Tuple[int, str] = (404, 'Not found'),
+                 limits: Optional[Dict[Tuple[str, str], Tuple[ratelimit.Limit, ...]]] = None,
+                 concurrency: Optional[Dict[Tuple[str, str], int]] = None,
+                 read_only: Iterable[Tuple[str, str]] = ()):
+        self.routes = routes
+        self.actions = {action for _, action in routes}
+        self.default_action = default_action
+        self.unknown_action = unknown_action
+        self.preflight = {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': allow_methods,
+                'Access-Control-Allow-Headers': allow_headers,
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+        self._handlers: Dict[Tuple[str, str], Handler] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._imports: Dict[str, float] = {}
+        self.limiter = ratelimit.Limiter(limits or {})
+        self.caps = ratelimit.ConcurrencyCap(concurrency or {})
+        # Маршруты, которые можно читать с реплики, и кто недавно писал: subject -> до какого времени читать с primary
+        self.read_routes = frozenset(read_only) if REPLICA_URLS else frozenset()
+        self._writers: Dict[str, float] = {}
+
+    def resolve(self, key: Tuple[str, str]) -> Optional[Handler]:
+        handler = self._handlers.get(key)
+        if handler is not None:
+            return handler
+        target = self.routes.get(key)
+        if target is None:
+            return None
+        if isinstance(target, str):
+            module_name, _, attr = target.partition(':')
+            started = time.perf_counter()
+            module = importlib.import_module(module_name)
+            with self._lock:
+                self._imports.setdefault(module_name, round((time.perf_counter() - started) * 1000, 3))
+            target = getattr(module, attr)
+        self._handlers[key] = target
+        return target
+
+    def dispatch(self, event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        if event.get('httpMethod') == 'OPTIONS':
+            return self.preflight
+
+        request = Request(event, self.default_action)
+        request.router = self
+        key = (request.method, request.action)
+        started = time.perf_counter()
+        # Без TRACE_SAMPLE_RATE это одна проверка флага на запрос
+        request.trace = tracing.start(f'{key[0]} {key[1]}') if tracing.ENABLED else None
+        error = None
+        try:
+            with request:
+                handler = self.resolve(key)
+                if handler is None:
+                    if request.action in self.actions:
+                        raise HttpError(405, 'Method not allowed')
+                    raise HttpError(*self.unknown_action)
+                if key in self.read_routes:
+                    request.read_only = not self._wrote_recently(request)
+                self._admit(request, key)
+                result = handler(request)
+                if self.read_routes and key not in self.read_routes and request._conn is not None \
+                        and result['statusCode'] < 400:
+                    self._remember_write(request)
+        except HttpError as e:
+            result = response(e.status, {'error': str(e), **e.extra}, e.headers)
+        except PoolExhausted as e:
+            result = response(503, {'error': str(e)}, {'Retry-After': '1'})
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+            result = response(500, {'error': str(e)})
+        self._record(key, result['statusCode'], time.perf_counter() - started)
+        if request.trace is not None:
+            tracing.finish(request.trace, result, error)
+        return result
+
+    def _admit(self, request: Request, key: Tuple[str, str]) -> None:
+        # Сначала потолок одновременных запросов: он отбрасывает лишнее без похода в пул соединений
+        if not self.caps.acquire(key):
+            raise HttpError(429, 'Too many concurrent requests', {'Retry-After': str(ratelimit.SHED_RETRY_AFTER)},
+                            retry_after=ratelimit.SHED_RETRY_AFTER)
+        request._stack.callback(self.caps.release, key)
+        retry_after = self.limiter.check(request, key)
+        if retry_after is not None:
+            raise HttpError(429, 'Rate limit exceeded', {'Retry-After': str(retry_after)}, retry_after=retry_after)
+
+    def _wrote_recently(self, request: Request) -> bool:
+        if not self._writers:
+            return False
+        return self._writers.get(request.subject, 0.0) > time.monotonic()
+
+    def _remember_write(self, request: Request) -> None:
+        # Свою запись пользователь должен увидеть сразу, даже если реплика ещё её не проиграла.
+        # Окно живёт в памяти инстанса: запрос, попавший в другой инстанс, может прочитать реплику
+        now = time.monotonic()
+        with self._lock:
+            self._writers[request.subject] = now + READ_YOUR_WRITES_SECONDS
+            if len(self._writers) > MAX_WRITERS:
+                self._writers = {k: until for k, until in self._writers.items() if until > now}
+
+    def _record(self, key: Tuple[str, str], status: int, elapsed: float) -> None:
+        name = f'{key[0]} {key[1]}' if key in self.routes else 'unmatched'
+        elapsed_ms = elapsed * 1000
+        with self._lock:
+            stats = self._stats.setdefault(name, {'calls': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            stats['calls'] += 1
+            stats['errors'] += status >= 500
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            routes = {
+                name: {**stats, 'total_ms': round(stats['total_ms'], 3), 'max_ms': round(stats['max_ms'], 3),
+                       'avg_ms': round(stats['total_ms'] / stats['calls'], 3)}
+                for name, stats in self._stats.items()
+            }
+            return {'routes': routes, 'imports_ms': dict(self._imports),
+                    'rate_limits': self.limiter.stats(), 'concurrency': self.caps.stats(),
+                    'read_your_writes': len(self._writers)}
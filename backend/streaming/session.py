@@ -0,0 +1,140 @@
+"""
+Business: Подписанные stateless-токены сессии (HMAC-SHA256) и кэш отозванных токенов в памяти
+Args: SESSION_SECRET, SESSION_TTL_SECONDS, REVOCATION_SYNC_SECONDS, AUTH_TRUST_USER_HEADER из окружения
+Returns: issue() при входе, verify() в router без обращения к БД, revocations для выхода из сессии
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+SECRET = os.environ.get('SESSION_SECRET', '').encode()
+TTL_SECONDS = int(os.environ.get('SESSION_TTL_SECONDS', str(7 * 24 * 3600)))
+REVOCATION_SYNC_SECONDS = float(os.environ.get('REVOCATION_SYNC_SECONDS', '5'))
+# Строка отзыва видна только после коммита, а revoked_at ставится до него: каждая синхронизация
+# перечитывает окно назад, дубли по jti безвредны
+REVOCATION_OVERLAP_SECONDS = float(os.environ.get('REVOCATION_OVERLAP_SECONDS', '60'))
+# Переходный режим: доверять голому X-User-Id, пока клиенты не перешли на токены
+TRUST_USER_HEADER = os.environ.get('AUTH_TRUST_USER_HEADER', '0') == '1'
+TOKEN_PREFIX = 'v1.'
+
+
+class SessionError(Exception):
+    pass
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(SECRET, payload.encode(), hashlib.sha256).digest())
+
+
+def issue(user_id: int, ttl: int = TTL_SECONDS) -> Dict[str, Any]:
+    if not SECRET:
+        raise SessionError('SESSION_SECRET is not configured')
+    now = int(time.time())
+    claims = {'sub': user_id, 'iat': now, 'exp': now + ttl, 'jti': uuid.uuid4().hex}
+    payload = TOKEN_PREFIX + _b64encode(json.dumps(claims, separators=(',', ':')).encode())
+    return {'token': f'{payload}.{_sign(payload)}', 'expires_at': claims['exp'], 'jti': claims['jti']}
+
+
+def verify(token: str) -> Dict[str, Any]:
+    # Только HMAC и разбор JSON: ни сети, ни БД; отзыв проверяется по кэшу revocations.
+    # Любой мусор в заголовке (не-ASCII, битый base64, не тот JSON) - SessionError, то есть 401, а не 500
+    if not SECRET or not token.startswith(TOKEN_PREFIX):
+        raise SessionError('Invalid session token')
+    payload, _, signature = token.rpartition('.')
+    try:
+        if not payload or not hmac.compare_digest(signature.encode(), _sign(payload).encode()):
+            raise SessionError('Invalid session token')
+        claims = json.loads(_b64decode(payload[len(TOKEN_PREFIX):]))
+        expires_at, jti = float(claims['exp']), str(claims['jti'])
+        int(claims['sub'])
+    except (KeyError, TypeError, ValueError):
+        raise SessionError('Invalid session token')
+    if expires_at <= time.time():
+        raise SessionError('Session expired')
+    if revocations.is_revoked(jti):
+        raise SessionError('Session revoked')
+    return claims
+
+
+class RevocationCache:
+    # jti -> exp отозванных токенов. Досинхронизируется из revoked_tokens не чаще раза в
+    # REVOCATION_SYNC_SECONDS на соединении, которое запрос и так взял из пула. Порядок id
+    # не годится как отметка: транзакция с меньшим id может закоммититься позже большего
+    def __init__(self, sync_interval: float = REVOCATION_SYNC_SECONDS, overlap: float = REVOCATION_OVERLAP_SECONDS):
+        self.sync_interval = sync_interval
+        self.overlap = timedelta(seconds=overlap)
+        self._revoked: Dict[str, float] = {}
+        self._last_sync = 0.0
+        self._synced_at: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    def is_revoked(self, jti: str) -> bool:
+        return jti in self._revoked
+
+    def add(self, jti: str, expires_at: float) -> None:
+        with self._lock:
+            self._revoked[jti] = expires_at
+
+    def due(self) -> bool:
+        return time.monotonic() - self._last_sync >= self.sync_interval
+
+    def sync(self, conn) -> None:
+        with self._lock:
+            if not self.due():
+                return
+            self._last_sync = time.monotonic()
+            since = self._synced_at - self.overlap if self._synced_at else datetime.min
+        cur = conn.cursor()
+        # Часы БД, а не инстанса: revoked_at тоже ставит БД
+        cur.execute("SELECT clock_timestamp()::timestamp")
+        synced_at = cur.fetchone()[0]
+        cur.execute(
+            "SELECT jti, extract(epoch FROM expires_at) FROM t_p79487843_youtube_analog_devel.revoked_tokens "
+            "WHERE revoked_at > %s AND expires_at > NOW()",
+            (since,)
+        )
+        rows = cur.fetchall()
+        cur.close()
+        now = time.time()
+        with self._lock:
+            for jti, expires_at in rows:
+                self._revoked[jti] = float(expires_at)
+            self._synced_at = synced_at
+            # Истёкшие токены и так не пройдут verify - держать их незачем
+            for jti in [jti for jti, expires_at in self._revoked.items() if expires_at <= now]:
+                del self._revoked[jti]
+
+    def revoke(self, conn, claims: Dict[str, Any]) -> None:
+        cur = conn.cursor()
+        cur.execute(
+            "INSERT INTO t_p79487843_youtube_analog_devel.revoked_tokens (jti, user_id, expires_at) "
+            "VALUES (%s, %s, to_timestamp(%s)) ON CONFLICT (jti) DO NOTHING",
+            (claims['jti'], claims['sub'], claims['exp'])
+        )
+        conn.commit()
+        cur.close()
+        self.add(claims['jti'], claims['exp'])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'revoked_cached': len(self._revoked),
+                    'synced_at': self._synced_at.isoformat() if self._synced_at else None}
+
+
+revocations = RevocationCache()
@@ -0,0 +1,319 @@
+"""
+Business: Пул соединений с Postgres, переживающий тёплые вызовы функции, и выбор реплики для чтения с учётом отставания
+Args: DATABASE_URL, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT, DB_POOL_HEALTH_CHECK_INTERVAL, DATABASE_REPLICA_URLS,
+      DB_REPLICA_MAX_LAG_SECONDS, DB_REPLICA_CHECK_INTERVAL, DB_REPLICA_CONNECT_TIMEOUT, DB_REPLICA_RECEIVER_TIMEOUT из окружения
+Returns: контекстный менеджер connection(), replica_pool() для маршрутов чтения и статистику pool_stats()
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import psycopg2
+from psycopg2 import extensions
+
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '5'))
+HEALTH_CHECK_INTERVAL = float(os.environ.get('DB_POOL_HEALTH_CHECK_INTERVAL', '30'))
+# Реплики через запятую; без них все запросы идут в DATABASE_URL, как раньше
+REPLICA_URLS = [dsn.strip() for dsn in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if dsn.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('DB_REPLICA_MAX_LAG_SECONDS', '5'))
+REPLICA_CHECK_INTERVAL = float(os.environ.get('DB_REPLICA_CHECK_INTERVAL', '5'))
+REPLICA_CONNECT_TIMEOUT = int(os.environ.get('DB_REPLICA_CONNECT_TIMEOUT', '2'))
+# Primary шлёт keepalive и без записи (раньше wal_sender_timeout, по умолчанию 60 с): дольше тишины - приёмник встал
+REPLICA_RECEIVER_TIMEOUT = float(os.environ.get('DB_REPLICA_RECEIVER_TIMEOUT', '60'))
+# Сколько после собственной записи читать с primary: реплика, отстающая не больше допустимого, к этому времени её догонит
+READ_YOUR_WRITES_SECONDS = float(os.environ.get('DB_READ_YOUR_WRITES_SECONDS', str(REPLICA_MAX_LAG_SECONDS)))
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, dsn: str, max_size: int = POOL_MAX_SIZE, timeout: float = POOL_TIMEOUT,
+                 health_check_interval: float = HEALTH_CHECK_INTERVAL, readonly: bool = False,
+                 connect_timeout: Optional[int] = None):
+        self.dsn = dsn
+        self.readonly = readonly
+        self.connect_timeout = connect_timeout
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._idle: List[Tuple[Any, float]] = []
+        self._size = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_ms': 0.0,
+            'connects': 0,
+            'reconnects': 0,
+            'discarded': 0,
+        }
+
+    def _connect(self):
+        if self.connect_timeout is None:
+            conn = psycopg2.connect(self.dsn)
+        else:
+            conn = psycopg2.connect(self.dsn, connect_timeout=self.connect_timeout)
+        if self.readonly:
+            # Запись, случайно попавшая на реплику, падает сразу, а не на уровне standby
+            conn.set_session(readonly=True)
+        with self._cond:
+            self._stats['connects'] += 1
+        return conn
+
+    def _is_healthy(self, conn, idle_since: float) -> bool:
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        # Соединение, пролежавшее дольше интервала, могли закрыть на стороне сервера
+        if time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        wait_started = 0.0
+        with self._cond:
+            while not self._idle and self._size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolExhausted(f'No free DB connection within {self.timeout}s (max_size={self.max_size})')
+                if not waited:
+                    waited = True
+                    wait_started = time.monotonic()
+                    self._stats['waits'] += 1
+                self._cond.wait(remaining)
+            if waited:
+                self._stats['wait_time_ms'] += (time.monotonic() - wait_started) * 1000
+            self._stats['checkouts'] += 1
+            if self._idle:
+                conn, idle_since = self._idle.pop()
+            else:
+                conn, idle_since = None, 0.0
+                self._size += 1
+
+        if conn is not None:
+            if self._is_healthy(conn, idle_since):
+                return conn
+            self._close_quietly(conn)
+            with self._cond:
+                self._stats['reconnects'] += 1
+
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def putconn(self, conn, discard: bool = False) -> None:
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        if discard or conn.closed:
+            self._close_quietly(conn)
+            with self._cond:
+                self._size -= 1
+                self._stats['discarded'] += 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        conn = self.getconn()
+        discard = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                **self._stats,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'max_size': self.max_size,
+            }
+
+    def close(self) -> None:
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    @staticmethod
+    def _close_quietly(conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+class Replica:
+    def __init__(self, pool: ConnectionPool):
+        self.pool = pool
+        # Отдельное соединение для проверки: занятый запросами пул не должен задерживать её на DB_POOL_TIMEOUT
+        self.check_conn = None
+        self.healthy = False
+        self.lag: Optional[float] = None
+        self.checked = 0.0
+        self.checking = False
+        self.error: Optional[str] = None
+
+
+class ReplicaSet:
+    # Реплика проверяется не чаще раза в check_interval прямо в запросе, который её выбрал:
+    # один поток делает SELECT, остальные до его окончания пользуются прошлым результатом
+    # replay == receive значит "проиграно всё полученное", а не "догнали primary": у вставшего WAL receiver
+    # оба LSN замирают, и отставание было бы 0. Поэтому отдельно смотрим сам приёмник: процесс, статус и
+    # время последнего сообщения от primary (статус и время видны роли с pg_read_all_stats, без неё - только процесс)
+    LAG_QUERY = """
+        SELECT pg_is_in_recovery(), r.pid IS NOT NULL, r.status,
+               extract(epoch FROM now() - r.last_msg_receipt_time),
+               CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                    ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+               END
+        FROM (SELECT 1) AS one LEFT JOIN pg_stat_wal_receiver r ON TRUE
+    """
+
+    def __init__(self, dsns: List[str], max_lag: float = REPLICA_MAX_LAG_SECONDS,
+                 check_interval: float = REPLICA_CHECK_INTERVAL, receiver_timeout: float = REPLICA_RECEIVER_TIMEOUT):
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.receiver_timeout = receiver_timeout
+        self.replicas = [
+            Replica(ConnectionPool(dsn, readonly=True, connect_timeout=REPLICA_CONNECT_TIMEOUT)) for dsn in dsns
+        ]
+        self._lock = threading.Lock()
+        self._next = 0
+        self._stats = {'replica_reads': 0, 'primary_fallbacks': 0}
+
+    def _check(self, replica: Replica) -> None:
+        try:
+            if replica.check_conn is None or replica.check_conn.closed:
+                replica.check_conn = replica.pool._connect()
+                replica.check_conn.autocommit = True
+            cur = replica.check_conn.cursor()
+            cur.execute(self.LAG_QUERY)
+            in_recovery, receiving, status, silence, lag = cur.fetchone()
+            cur.close()
+            replica.lag = float(lag or 0) if in_recovery else 0.0
+            replica.error = self._stall(receiving, status, silence) if in_recovery else None
+            if replica.error is None and replica.lag > self.max_lag:
+                replica.error = f'lag {replica.lag:.1f}s'
+            replica.healthy = replica.error is None
+        except psycopg2.Error as e:
+            if replica.check_conn is not None:
+                ConnectionPool._close_quietly(replica.check_conn)
+                replica.check_conn = None
+            replica.healthy = False
+            replica.error = str(e).strip()
+        finally:
+            replica.checked = time.monotonic()
+            replica.checking = False
+
+    def _stall(self, receiving: bool, status: Optional[str], silence: Optional[float]) -> Optional[str]:
+        # Вставший приёмник - то же, что бесконечное отставание: реплика выходит из ротации
+        if not receiving:
+            return 'wal receiver not running'
+        if status is not None and status != 'streaming':
+            return f'wal receiver {status}'
+        if silence is not None and float(silence) > self.receiver_timeout:
+            return f'wal receiver silent {float(silence):.0f}s'
+        return None
+
+    def choose(self) -> Optional[ConnectionPool]:
+        now = time.monotonic()
+        with self._lock:
+            due = [r for r in self.replicas if not r.checking and now - r.checked >= self.check_interval]
+            for replica in due:
+                replica.checking = True
+        for replica in due:
+            self._check(replica)
+        with self._lock:
+            # По кругу среди живых реплик, которые отстают не больше max_lag
+            for _ in range(len(self.replicas)):
+                replica = self.replicas[self._next % len(self.replicas)]
+                self._next += 1
+                if replica.healthy:
+                    self._stats['replica_reads'] += 1
+                    return replica.pool
+            self._stats['primary_fallbacks'] += 1
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                'max_lag_seconds': self.max_lag,
+                'replicas': [
+                    {'healthy': r.healthy, 'lag_seconds': r.lag, 'error': r.error, 'pool': r.pool.stats()}
+                    for r in self.replicas
+                ],
+            }
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+_replicas: Optional[ReplicaSet] = None
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(os.environ['DATABASE_URL'])
+    return _pool
+
+
+def get_replicas() -> Optional[ReplicaSet]:
+    global _replicas
+    if _replicas is None and REPLICA_URLS:
+        with _pool_lock:
+            if _replicas is None:
+                _replicas = ReplicaSet(REPLICA_URLS)
+    return _replicas
+
+
+def replica_pool() -> Optional[ConnectionPool]:
+    # Пул для маршрута чтения; None - реплик нет или ни одна не подходит, читать с primary
+    replicas = get_replicas()
+    return replicas.choose() if replicas else None
+
+
+def connection(pool: Optional[ConnectionPool] = None):
+    return (pool or get_pool()).connection()
+
+
+def pool_stats() -> Dict[str, Any]:
+    replicas = get_replicas()
+    if replicas is None:
+        return get_pool().stats()
+    return {**get_pool().stats(), 'read_replicas': replicas.stats()}
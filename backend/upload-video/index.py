@@ -1,80 +1,300 @@
 '''
 Business: Upload video files and create video records
-Args: event with httpMethod, body (multipart/form-data), headers with X-User-Id
+Args: event with httpMethod, queryStringParameters.action (init, chunk, complete, status, jobs or none for a hosted video_url), Authorization: Bearer token
 Returns: JSON with video_id and upload status
 '''
 
-import json
 import base64
+import binascii
+import hashlib
+import math
 import os
 import uuid
 from typing import Dict, Any
-import psycopg2
 
-def get_db_connection():
-    dsn = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(dsn)
+from ratelimit import Limit
+from router import HttpError, Request, Router, response
+from storage import store
+from transcode import enqueue
 
-def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    method: str = event.get('httpMethod', 'GET')
-    
-    # Handle CORS
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
-    
-    if method != 'POST':
-        return {
-            'statusCode': 405,
-            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
-    
-    headers = event.get('headers', {})
-    user_id = headers.get('X-User-Id') or headers.get('x-user-id')
-    
-    if not user_id:
-        return {
-            'statusCode': 401,
-            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'body': json.dumps({'error': 'User ID required'})
-        }
-    
-    body_data = json.loads(event.get('body', '{}'))
+MAX_CHUNK_SIZE = 8 * 1024 * 1024
+MIN_CHUNK_SIZE = 256 * 1024
+
+def create_video(request: Request) -> Dict[str, Any]:
+    # No action: register a video that is already hosted at video_url
+    user_id = request.require_user()
+    body_data = request.body
     title = body_data.get('title', 'Untitled Video')
     description = body_data.get('description', '')
     video_url = body_data.get('video_url', '')
     thumbnail_url = body_data.get('thumbnail_url', '')
     duration = body_data.get('duration', 0)
+    if video_url:
+        try:
+            store.source_for(video_url)
+        except ValueError as e:
+            raise HttpError(400, str(e))
     
-    conn = get_db_connection()
+    conn = request.db()
     cur = conn.cursor()
     
     # Create video record
     cur.execute(
         "INSERT INTO t_p79487843_youtube_analog_devel.streams (title, user_id, video_url, thumbnail_url, duration, description, is_live, created_at) VALUES (%s, %s, %s, %s, %s, %s, FALSE, NOW()) RETURNING id",
-        (title, int(user_id), video_url, thumbnail_url, int(duration), description)
+        (title, user_id, video_url, thumbnail_url, int(duration), description)
     )
     video_id = cur.fetchone()[0]
+    job_id = enqueue(cur, video_id, video_url) if video_url else None
+    
+    conn.commit()
+    cur.close()
+    
+    return response(200, {
+        'video_id': video_id,
+        'job_id': job_id,
+        'message': 'Video uploaded successfully'
+    })
+
+def init_upload(request: Request) -> Dict[str, Any]:
+    user_id = request.require_user()
+    body_data = request.body
+    filename = os.path.basename(body_data.get('filename') or '') or 'video.mp4'
+    try:
+        total_size = int(body_data.get('total_size', 0))
+        chunk_size = int(body_data.get('chunk_size', MAX_CHUNK_SIZE))
+    except (TypeError, ValueError):
+        raise HttpError(400, 'total_size and chunk_size must be integers')
+    
+    if total_size <= 0 or not MIN_CHUNK_SIZE <= chunk_size <= MAX_CHUNK_SIZE:
+        raise HttpError(400, f'total_size must be positive, chunk_size between {MIN_CHUNK_SIZE} and {MAX_CHUNK_SIZE}')
+    
+    upload_id = str(uuid.uuid4())
+    chunk_count = math.ceil(total_size / chunk_size)
+    
+    conn = request.db()
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO t_p79487843_youtube_analog_devel.uploads (id, user_id, title, description, filename, total_size, chunk_size, chunk_count, sha256) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+        (upload_id, user_id, body_data.get('title', 'Untitled Video'), body_data.get('description', ''),
+         filename, total_size, chunk_size, chunk_count, body_data.get('sha256'))
+    )
+    conn.commit()
+    cur.close()
+    
+    return response(200, {
+        'upload_id': upload_id,
+        'chunk_size': chunk_size,
+        'chunk_count': chunk_count
+    })
+
+def put_chunk(request: Request) -> Dict[str, Any]:
+    user_id = request.require_user()
+    params = request.query
+    upload_id = params.get('upload_id')
+    expected_sha = request.header('X-Chunk-Sha256')
+    try:
+        index = int(params.get('index', ''))
+        uuid.UUID(upload_id or '')
+    except ValueError:
+        raise HttpError(400, 'upload_id and integer index required')
+    if not expected_sha:
+        raise HttpError(400, 'X-Chunk-Sha256 header required')
+    
+    # The chunk body is base64 either way: encoded by the gateway or by the client
+    try:
+        data = base64.b64decode(request.raw_body, validate=True)
+    except binascii.Error:
+        raise HttpError(400, 'Chunk body must be base64')
+    if hashlib.sha256(data).hexdigest() != expected_sha.lower():
+        raise HttpError(422, 'Chunk checksum mismatch', index=index)
+    
+    conn = request.db()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT total_size, chunk_size, chunk_count, status FROM t_p79487843_youtube_analog_devel.uploads WHERE id = %s AND user_id = %s",
+        (upload_id, user_id)
+    )
+    upload = cur.fetchone()
+    if not upload:
+        cur.close()
+        raise HttpError(404, 'Upload not found')
+    
+    total_size, chunk_size, chunk_count, status = upload
+    if status != 'pending':
+        cur.close()
+        raise HttpError(409, f'Upload is {status}')
+    if not 0 <= index < chunk_count:
+        cur.close()
+        raise HttpError(400, f'index must be between 0 and {chunk_count - 1}')
+    expected_size = chunk_size if index < chunk_count - 1 else total_size - chunk_size * (chunk_count - 1)
+    if len(data) != expected_size:
+        cur.close()
+        raise HttpError(400, f'Chunk {index} must be {expected_size} bytes')
+    
+    store.put_part(upload_id, index, data)
+    cur.execute(
+        "INSERT INTO t_p79487843_youtube_analog_devel.upload_chunks (upload_id, chunk_index, size, sha256) VALUES (%s, %s, %s, %s) "
+        "ON CONFLICT (upload_id, chunk_index) DO UPDATE SET size = EXCLUDED.size, sha256 = EXCLUDED.sha256, created_at = NOW()",
+        (upload_id, index, len(data), expected_sha.lower())
+    )
+    conn.commit()
+    cur.close()
+    
+    return response(200, {'upload_id': upload_id, 'index': index, 'size': len(data)})
+
+def complete_upload(request: Request) -> Dict[str, Any]:
+    user_id = request.require_user()
+    params = request.query
+    upload_id = params.get('upload_id')
+    try:
+        uuid.UUID(upload_id or '')
+    except ValueError:
+        raise HttpError(400, 'upload_id required')
+    
+    conn = request.db()
+    cur = conn.cursor()
+    # Row lock makes concurrent complete calls for the same upload run one after another
+    cur.execute(
+        "SELECT title, description, filename, chunk_count, sha256, status, stream_id FROM t_p79487843_youtube_analog_devel.uploads WHERE id = %s AND user_id = %s FOR UPDATE",
+        (upload_id, user_id)
+    )
+    upload = cur.fetchone()
+    if not upload:
+        cur.close()
+        raise HttpError(404, 'Upload not found')
+    
+    title, description, filename, chunk_count, expected_sha, status, stream_id = upload
+    if status == 'complete':
+        cur.close()
+        return response(200, {'video_id': stream_id, 'message': 'Video uploaded successfully'})
+    
+    cur.execute(
+        "SELECT chunk_index FROM t_p79487843_youtube_analog_devel.upload_chunks WHERE upload_id = %s",
+        (upload_id,)
+    )
+    received = {row[0] for row in cur.fetchall()}
+    missing = [i for i in range(chunk_count) if i not in received]
+    if missing:
+        cur.close()
+        raise HttpError(409, 'Upload is incomplete', missing=missing[:1000])
     
+    video_url, size, sha256 = store.assemble(upload_id, chunk_count, f'{upload_id}/{filename}')
+    if expected_sha and sha256 != expected_sha.lower():
+        cur.execute(
+            "UPDATE t_p79487843_youtube_analog_devel.uploads SET status = 'failed' WHERE id = %s",
+            (upload_id,)
+        )
+        conn.commit()
+        cur.close()
+        store.discard_object(upload_id)
+        store.discard_parts(upload_id)
+        raise HttpError(422, 'File checksum mismatch')
+    
+    cur.execute(
+        "INSERT INTO t_p79487843_youtube_analog_devel.streams (title, user_id, video_url, description, is_live, created_at) VALUES (%s, %s, %s, %s, FALSE, NOW()) RETURNING id",
+        (title, user_id, video_url, description)
+    )
+    video_id = cur.fetchone()[0]
+    job_id = enqueue(cur, video_id, video_url)
+    cur.execute(
+        "UPDATE t_p79487843_youtube_analog_devel.uploads SET status = 'complete', stream_id = %s, completed_at = NOW() WHERE id = %s",
+        (video_id, upload_id)
+    )
     conn.commit()
     cur.close()
-    conn.close()
-    
-    return {
-        'statusCode': 200,
-        'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-        'isBase64Encoded': False,
-        'body': json.dumps({
-            'video_id': video_id,
-            'message': 'Video uploaded successfully'
-        })
-    }
\ No newline at end of file
+    
+    store.discard_parts(upload_id)
+    
+    return response(200, {
+        'video_id': video_id,
+        'job_id': job_id,
+        'size': size,
+        'sha256': sha256,
+        'message': 'Video uploaded successfully'
+    })
+
+def upload_status(request: Request) -> Dict[str, Any]:
+    user_id = request.require_user()
+    params = request.query
+    upload_id = params.get('upload_id')
+    try:
+        uuid.UUID(upload_id or '')
+    except ValueError:
+        raise HttpError(400, 'upload_id required')
+    
+    conn = request.db()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT chunk_count, status, stream_id FROM t_p79487843_youtube_analog_devel.uploads WHERE id = %s AND user_id = %s",
+        (upload_id, user_id)
+    )
+    upload = cur.fetchone()
+    if not upload:
+        cur.close()
+        raise HttpError(404, 'Upload not found')
+    cur.execute(
+        "SELECT chunk_index FROM t_p79487843_youtube_analog_devel.upload_chunks WHERE upload_id = %s ORDER BY chunk_index",
+        (upload_id,)
+    )
+    received = [row[0] for row in cur.fetchall()]
+    cur.close()
+    
+    chunk_count, status, stream_id = upload
+    return response(200, {
+        'upload_id': upload_id,
+        'status': status,
+        'chunk_count': chunk_count,
+        'received': received,
+        'video_id': stream_id
+    })
+
+def job_status(request: Request) -> Dict[str, Any]:
+    user_id = request.require_user()
+    params = request.query
+    try:
+        video_id = int(params.get('video_id', ''))
+    except ValueError:
+        raise HttpError(400, 'video_id required')
+    
+    conn = request.db()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT j.id, j.kind, j.status, j.progress, j.attempts, j.error, j.result, j.updated_at "
+        "FROM t_p79487843_youtube_analog_devel.media_jobs j "
+        "JOIN t_p79487843_youtube_analog_devel.streams s ON s.id = j.stream_id "
+        "WHERE j.stream_id = %s AND s.user_id = %s ORDER BY j.id DESC",
+        (video_id, user_id)
+    )
+    rows = cur.fetchall()
+    cur.close()
+    
+    return response(200, {
+        'video_id': video_id,
+        'jobs': [
+            {'job_id': job_id, 'kind': kind, 'status': status, 'progress': progress, 'attempts': attempts,
+             'error': error, 'result': result, 'updated_at': updated_at.isoformat() if updated_at else None}
+            for job_id, kind, status, progress, attempts, error, result, updated_at in rows
+        ]
+    })
+
+# (method, action) -> token buckets: Limit(scope, tokens per second, burst); other routes are not limited
+LIMITS = {
+    ('POST', ''): (Limit('user', 0.2, 10),),
+    ('POST', 'init'): (Limit('user', 0.2, 10),),
+    ('PUT', 'chunk'): (Limit('user', 20, 100),),
+    ('POST', 'complete'): (Limit('user', 0.5, 10),),
+}
+
+# Unknown actions keep answering 400 as before the router; no action registers a hosted video_url
+router = Router({
+    ('POST', ''): create_video,
+    ('POST', 'init'): init_upload,
+    ('PUT', 'chunk'): put_chunk,
+    ('POST', 'complete'): complete_upload,
+    ('GET', 'status'): upload_status,
+    ('GET', 'jobs'): job_status,
+}, allow_methods='GET, POST, PUT, OPTIONS', allow_headers='Content-Type, Authorization, X-User-Id, X-Chunk-Sha256',
+   unknown_action=(400, 'Invalid action'), limits=LIMITS)
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return router.dispatch(event, context)
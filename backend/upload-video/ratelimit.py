@@ -0,0 +1,203 @@
+"""
+Business: Лимиты запросов token bucket по пользователю и IP для каждого маршрута и ограничение одновременных тяжёлых запросов
+Args: RATE_LIMIT_STORE (memory - в процессе, postgres - общие для всех инстансов, off) и RATE_LIMIT_SCALE из окружения
+Returns: Limit для таблицы лимитов в index.py, Limiter.check() и ConcurrencyCap для Router.dispatch
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+STORE = os.environ.get('RATE_LIMIT_STORE', 'memory')
+# Множитель скорости и запаса всех лимитов: поднять их на время нагрузочного теста или миграции без правки кода
+SCALE = float(os.environ.get('RATE_LIMIT_SCALE', '1'))
+MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', '100000'))
+SHED_RETRY_AFTER = 1
+SWEEP_INTERVAL_SECONDS = 60
+SWEEP_AFTER_SECONDS = 3600
+
+
+class Limit(NamedTuple):
+    # scope: 'user' - по id из токена (без токена - по IP), 'ip' - всегда по IP
+    scope: str
+    rate: float
+    burst: int
+
+
+# (ключ ведра, токенов в секунду, запас) - все лимиты одного запроса
+Bucket = Tuple[str, float, int]
+
+
+class MemoryStore:
+    # key -> (токены, время пересчёта) в порядке последнего обращения. При переполнении выбрасывается
+    # самое давнее ведро - O(1) на запрос; к этому времени оно почти всегда уже снова полное
+    def __init__(self, max_keys: int = MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: 'OrderedDict[str, Tuple[float, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, buckets: Sequence[Bucket], request: Any) -> float:
+        # 0 - токены выданы из всех вёдер, иначе через сколько секунд появится недостающий;
+        # при отказе не списывается ни одно ведро
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            wait = 0.0
+            for key, rate, burst in buckets:
+                tokens, updated = self._buckets.get(key, (burst, now))
+                tokens = min(burst, tokens + (now - updated) * rate)
+                levels.append(tokens)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+            for (key, _, _), tokens in zip(buckets, levels):
+                self._buckets[key] = (tokens if wait else tokens - 1, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        return {'store': 'memory', 'keys': len(self._buckets)}
+
+
+class PostgresStore:
+    # Одна строка на ключ в rate_limit_buckets (V0018), пересчёт и списание одним upsert.
+    # Стоит запроса к primary на соединении, которое обработчику записи всё равно понадобится
+    TAKE = """
+        WITH bucket AS (
+            INSERT INTO t_p79487843_youtube_analog_devel.rate_limit_buckets AS b (key, tokens, updated_at)
+            VALUES (%(key)s, %(burst)s - 1, clock_timestamp())
+            ON CONFLICT (key) DO UPDATE SET
+                tokens = LEAST(%(burst)s, b.tokens + extract(epoch FROM clock_timestamp() - b.updated_at) * %(rate)s) - 1,
+                updated_at = clock_timestamp()
+            WHERE LEAST(%(burst)s, b.tokens + extract(epoch FROM clock_timestamp() - b.updated_at) * %(rate)s) >= 1
+            RETURNING tokens
+        )
+        SELECT EXISTS (SELECT 1 FROM bucket),
+               (SELECT LEAST(%(burst)s, tokens + extract(epoch FROM clock_timestamp() - updated_at) * %(rate)s)
+                FROM t_p79487843_youtube_analog_devel.rate_limit_buckets WHERE key = %(key)s)
+    """
+
+    # Несколько лимитов: сначала блокируем существующие вёдра и проверяем все, списываем только если
+    # хватает везде. Отсутствующее ведро - полное, его проверять не нужно
+    PEEK = """
+        SELECT b.key, LEAST(r.burst, b.tokens + extract(epoch FROM clock_timestamp() - b.updated_at) * r.rate), r.rate
+        FROM t_p79487843_youtube_analog_devel.rate_limit_buckets b
+        JOIN unnest(%s::text[], %s::float8[], %s::int[]) AS r(key, rate, burst) ON r.key = b.key
+        ORDER BY b.key
+        FOR UPDATE OF b
+    """
+
+    def __init__(self):
+        self._last_sweep = time.monotonic()
+
+    def take(self, buckets: Sequence[Bucket], request: Any) -> float:
+        conn = request.primary()
+        cur = conn.cursor()
+        if len(buckets) > 1:
+            keys, rates, bursts = (list(column) for column in zip(*buckets))
+            cur.execute(self.PEEK, (keys, rates, bursts))
+            short = [(1 - float(tokens)) / float(rate) for _, tokens, rate in cur.fetchall() if tokens < 1]
+            if short:
+                cur.close()
+                conn.commit()
+                return max(short)
+        wait = 0.0
+        for key, rate, burst in buckets:
+            wait = max(wait, self._take(cur, key, rate, burst))
+        self._sweep(cur)
+        cur.close()
+        # Блокировку строк вёдер не держим до конца обработчика
+        conn.commit()
+        return wait
+
+    def _take(self, cur, key: str, rate: float, burst: int) -> float:
+        cur.execute(self.TAKE, {'key': key, 'rate': rate, 'burst': burst})
+        allowed, tokens = cur.fetchone()
+        if allowed:
+            return 0.0
+        return (1 - float(tokens or 0)) / rate
+
+    def _sweep(self, cur) -> None:
+        # Вёдра, не тронутые дольше SWEEP_AFTER_SECONDS, давно полные - удаляем, чтобы таблица не росла по числу IP
+        if time.monotonic() - self._last_sweep >= SWEEP_INTERVAL_SECONDS:
+            self._last_sweep = time.monotonic()
+            cur.execute(
+                "DELETE FROM t_p79487843_youtube_analog_devel.rate_limit_buckets WHERE updated_at < clock_timestamp() - %s",
+                (timedelta(seconds=SWEEP_AFTER_SECONDS),)
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        return {'store': 'postgres'}
+
+
+STORES: Dict[str, Callable[[], Any]] = {'memory': MemoryStore, 'postgres': PostgresStore}
+
+
+class Limiter:
+    def __init__(self, limits: Dict[Tuple[str, str], Tuple[Limit, ...]], store: str = STORE, scale: float = SCALE):
+        self.limits = limits
+        self.scale = scale
+        self.store = STORES[store]() if store != 'off' and limits else None
+        self._rejected: Dict[str, int] = {}
+
+    def check(self, request: Any, key: Tuple[str, str]) -> Optional[int]:
+        # None - пропустить, иначе Retry-After в секундах
+        if self.store is None:
+            return None
+        limits = self.limits.get(key)
+        if not limits:
+            return None
+        buckets: List[Bucket] = []
+        for limit in limits:
+            user_id = request.user_id if limit.scope == 'user' else None
+            subject = f'u{user_id}' if user_id else f'ip{request.client_ip}'
+            buckets.append((f'{key[0]} {key[1]}:{limit.scope}:{subject}', limit.rate * self.scale,
+                            max(1, int(limit.burst * self.scale))))
+        wait = self.store.take(buckets, request)
+        if wait:
+            name = f'{key[0]} {key[1]}'
+            self._rejected[name] = self._rejected.get(name, 0) + 1
+            return max(1, math.ceil(wait))
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        if self.store is None:
+            return {'store': 'off'}
+        return {**self.store.stats(), 'rejected': dict(self._rejected)}
+
+
+class ConcurrencyCap:
+    # Не больше N одновременных запросов маршрута в инстансе; лишние получают 429 сразу,
+    # до соединения с БД, а не встают в очередь пула
+    def __init__(self, caps: Dict[Tuple[str, str], int]):
+        self.caps = caps
+        self._active: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+        self._shed = 0
+
+    def acquire(self, key: Tuple[str, str]) -> bool:
+        cap = self.caps.get(key)
+        if cap is None:
+            return True
+        with self._lock:
+            active = self._active.get(key, 0)
+            if active >= cap:
+                self._shed += 1
+                return False
+            self._active[key] = active + 1
+        return True
+
+    def release(self, key: Tuple[str, str]) -> None:
+        if key not in self.caps:
+            return
+        with self._lock:
+            self._active[key] -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'active': {f'{m} {a}': n for (m, a), n in self._active.items() if n}, 'shed': self._shed}
@@ -0,0 +1,85 @@
+'''
+Business: Local filesystem stand-in for the object store that receives uploaded video chunks
+Args: UPLOAD_STORAGE_DIR, UPLOAD_PUBLIC_URL and UPLOAD_REMOTE_HOSTS env vars
+Returns: LocalObjectStore with put_part / assemble / discard operations and checked object paths for the transcoder
+'''
+
+import hashlib
+import os
+import shutil
+from typing import FrozenSet, Tuple
+from urllib.parse import urlsplit
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class LocalObjectStore:
+    def __init__(self, root: str, public_url: str, remote_hosts: FrozenSet[str] = frozenset()):
+        self.root = root
+        self.public_url = public_url.rstrip('/')
+        self.remote_hosts = remote_hosts
+
+    def _parts_dir(self, upload_id: str) -> str:
+        return os.path.join(self.root, 'parts', upload_id)
+
+    def put_part(self, upload_id: str, index: int, data: bytes) -> None:
+        parts_dir = self._parts_dir(upload_id)
+        os.makedirs(parts_dir, exist_ok=True)
+        final_path = os.path.join(parts_dir, f'{index:06d}.part')
+        tmp_path = final_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        # Rename is atomic, so a retried chunk never leaves a half-written part behind
+        os.replace(tmp_path, final_path)
+
+    def assemble(self, upload_id: str, chunk_count: int, key: str) -> Tuple[str, int, str]:
+        dest_path = self.object_path(key)
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        with open(dest_path + '.tmp', 'wb') as out:
+            for index in range(chunk_count):
+                with open(os.path.join(self._parts_dir(upload_id), f'{index:06d}.part'), 'rb') as part:
+                    while True:
+                        buf = part.read(COPY_BUFFER_SIZE)
+                        if not buf:
+                            break
+                        digest.update(buf)
+                        out.write(buf)
+                        size += len(buf)
+        os.replace(dest_path + '.tmp', dest_path)
+        return self.object_url(key), size, digest.hexdigest()
+
+    def object_path(self, key: str) -> str:
+        return os.path.join(self.root, 'videos', key)
+
+    def object_url(self, key: str) -> str:
+        return f'{self.public_url}/videos/{key}'
+
+    def source_for(self, url: str) -> str:
+        # Objects from this store are read from disk, http(s) URLs only from allow-listed hosts;
+        # anything else (file://, concat:, internal hosts) never reaches ffmpeg
+        if url.startswith(self.public_url + '/'):
+            videos = os.path.realpath(os.path.join(self.root, 'videos'))
+            path = os.path.realpath(os.path.join(self.root, url[len(self.public_url) + 1:]))
+            if not path.startswith(videos + os.sep):
+                raise ValueError('video_url points outside the object store')
+            return path
+        parts = urlsplit(url)
+        if parts.scheme in ('http', 'https') and (parts.hostname or '').lower() in self.remote_hosts:
+            return url
+        raise ValueError('video_url must be an uploaded object or an allowed http(s) host')
+
+    def discard_parts(self, upload_id: str) -> None:
+        shutil.rmtree(self._parts_dir(upload_id), ignore_errors=True)
+
+    def discard_object(self, upload_id: str) -> None:
+        # Assembled objects live under videos/<upload_id>/, so a rejected upload leaves nothing behind
+        shutil.rmtree(os.path.join(self.root, 'videos', upload_id), ignore_errors=True)
+
+
+store = LocalObjectStore(
+    root=os.environ.get('UPLOAD_STORAGE_DIR', '/tmp/video-storage'),
+    public_url=os.environ.get('UPLOAD_PUBLIC_URL', 'file:///tmp/video-storage'),
+    remote_hosts=frozenset(h.strip().lower() for h in os.environ.get('UPLOAD_REMOTE_HOSTS', '').split(',') if h.strip()),
+)
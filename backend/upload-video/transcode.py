@@ -0,0 +1,273 @@
+'''
+Business: Background media jobs for uploaded videos: probe duration, build an HLS rendition ladder, cut a thumbnail
+Args: run as `python transcode.py --workers N`; DATABASE_URL, FFMPEG_BIN, FFPROBE_BIN, JOB_LEASE_SECONDS, FFMPEG_TIMEOUT_SECONDS env vars
+Returns: updates media_jobs status/progress and fills streams.duration, thumbnail_url, hls_url
+'''
+
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import psycopg2
+
+from db import PoolExhausted, connection
+from storage import store
+
+FFMPEG_BIN = os.environ.get('FFMPEG_BIN', 'ffmpeg')
+FFPROBE_BIN = os.environ.get('FFPROBE_BIN', 'ffprobe')
+LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', '120'))
+IDLE_SLEEP_SECONDS = 2
+RETRY_BACKOFF_SECONDS = 30
+# The lease is renewed several times per LEASE_SECONDS so one slow or failed beat does not lose the job
+HEARTBEAT_SECONDS = max(LEASE_SECONDS / 4, 1)
+DB_BACKOFF_MAX_SECONDS = 60
+DB_ERRORS = (psycopg2.Error, PoolExhausted)
+FFMPEG_TIMEOUT_SECONDS = int(os.environ.get('FFMPEG_TIMEOUT_SECONDS', '3600'))
+PROBE_TIMEOUT_SECONDS = 60
+# Inputs are local store files or allow-listed http(s) URLs; no concat:, data:, subfile: or other readers
+PROTOCOL_WHITELIST = ['-protocol_whitelist', 'file,http,https,tcp,tls']
+
+# (name, height, video bitrate, audio bitrate); rungs taller than the source are skipped
+RENDITION_LADDER = [
+    ('1080p', 1080, '5000k', '192k'),
+    ('720p', 720, '2800k', '128k'),
+    ('480p', 480, '1400k', '128k'),
+    ('360p', 360, '800k', '96k'),
+]
+
+def enqueue(cur, stream_id: int, source: str) -> int:
+    cur.execute(
+        "INSERT INTO t_p79487843_youtube_analog_devel.media_jobs (stream_id, source) VALUES (%s, %s) RETURNING id",
+        (stream_id, source)
+    )
+    return cur.fetchone()[0]
+
+def claim(worker_id: str) -> Optional[Tuple[int, int, str, int, int]]:
+    with connection() as conn:
+        cur = conn.cursor()
+        # A running job whose lease has expired belonged to a crashed worker and is taken over
+        cur.execute(
+            """
+            UPDATE t_p79487843_youtube_analog_devel.media_jobs
+            SET status = 'running', attempts = attempts + 1, locked_by = %s,
+                locked_until = NOW() + make_interval(secs => %s), updated_at = NOW()
+            WHERE id = (
+                SELECT id FROM t_p79487843_youtube_analog_devel.media_jobs
+                WHERE (status = 'queued' AND run_after <= NOW())
+                   OR (status = 'running' AND locked_until < NOW())
+                ORDER BY id
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING id, stream_id, source, attempts, max_attempts
+            """,
+            (worker_id, LEASE_SECONDS)
+        )
+        job = cur.fetchone()
+        conn.commit()
+        cur.close()
+    return job
+
+def heartbeat(job_id: int, worker_id: str, progress: float) -> bool:
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "UPDATE t_p79487843_youtube_analog_devel.media_jobs SET progress = %s, locked_until = NOW() + make_interval(secs => %s), updated_at = NOW() WHERE id = %s AND locked_by = %s",
+            (round(progress, 3), LEASE_SECONDS, job_id, worker_id)
+        )
+        owned = cur.rowcount == 1
+        conn.commit()
+        cur.close()
+    return owned
+
+class Lease:
+    # Renews locked_until from a timer thread for as long as the job runs: probe, every rung, the thumbnail
+    # and inputs without a duration all keep the job, not only ffmpeg progress lines
+    def __init__(self, job_id: int, worker_id: str):
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.progress = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'lease-{job_id}', daemon=True)
+
+    def __enter__(self) -> 'Lease':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(HEARTBEAT_SECONDS):
+            try:
+                if not heartbeat(self.job_id, self.worker_id, self.progress):
+                    # Another worker took the job over; finish/fail will not touch it either
+                    return
+            except DB_ERRORS:
+                # A missed beat is harmless while the next one lands before the lease runs out
+                continue
+
+def finish(job_id: int, stream_id: int, worker_id: str, result: Dict[str, Any]) -> bool:
+    # Only the lease holder may close the job: after an expired lease another worker owns it
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "UPDATE t_p79487843_youtube_analog_devel.media_jobs SET status = 'done', progress = 1, result = %s, locked_by = NULL, locked_until = NULL, updated_at = NOW() WHERE id = %s AND locked_by = %s RETURNING id",
+            (json.dumps(result), job_id, worker_id)
+        )
+        owned = cur.fetchone() is not None
+        if owned:
+            cur.execute(
+                "UPDATE t_p79487843_youtube_analog_devel.streams SET duration = %s, thumbnail_url = %s, hls_url = %s WHERE id = %s",
+                (result['duration'], result['thumbnail_url'], result['hls_url'], stream_id)
+            )
+        conn.commit()
+        cur.close()
+    return owned
+
+def fail(job_id: int, worker_id: str, attempts: int, max_attempts: int, error: str) -> None:
+    with connection() as conn:
+        cur = conn.cursor()
+        if attempts >= max_attempts:
+            cur.execute(
+                "UPDATE t_p79487843_youtube_analog_devel.media_jobs SET status = 'failed', error = %s, locked_by = NULL, locked_until = NULL, updated_at = NOW() WHERE id = %s AND locked_by = %s",
+                (error[-2000:], job_id, worker_id)
+            )
+        else:
+            cur.execute(
+                "UPDATE t_p79487843_youtube_analog_devel.media_jobs SET status = 'queued', error = %s, locked_by = NULL, locked_until = NULL, run_after = NOW() + make_interval(secs => %s), updated_at = NOW() WHERE id = %s AND locked_by = %s",
+                (error[-2000:], RETRY_BACKOFF_SECONDS * attempts, job_id, worker_id)
+            )
+        conn.commit()
+        cur.close()
+
+def probe(source: str) -> Tuple[float, int]:
+    out = subprocess.run(
+        [FFPROBE_BIN, '-v', 'error', *PROTOCOL_WHITELIST, '-select_streams', 'v:0',
+         '-show_entries', 'stream=height:format=duration', '-of', 'json', source],
+        check=True, capture_output=True, text=True, timeout=PROBE_TIMEOUT_SECONDS
+    ).stdout
+    info = json.loads(out)
+    height = int((info.get('streams') or [{}])[0].get('height') or 0)
+    return float(info['format']['duration']), height
+
+def run_ffmpeg(args: List[str], duration: float, on_progress) -> None:
+    proc = subprocess.Popen(
+        [FFMPEG_BIN, '-hide_banner', '-loglevel', 'error', '-y', '-progress', 'pipe:1', '-nostats',
+         *PROTOCOL_WHITELIST, *args],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    # A stalled input or a hung encoder must not hold the job forever while heartbeats keep the lease alive
+    killer = threading.Timer(FFMPEG_TIMEOUT_SECONDS, proc.kill)
+    killer.start()
+    try:
+        for line in proc.stdout:
+            if line.startswith('out_time_us=') and duration > 0:
+                value = line.split('=', 1)[1].strip()
+                if value.isdigit():
+                    on_progress(min(int(value) / 1e6 / duration, 1.0))
+        stderr = proc.stderr.read()
+        returncode = proc.wait()
+    finally:
+        timed_out = killer.finished.is_set()
+        killer.cancel()
+    if returncode != 0:
+        if timed_out:
+            raise RuntimeError(f'ffmpeg timed out after {FFMPEG_TIMEOUT_SECONDS}s')
+        raise RuntimeError(f'ffmpeg exited with {returncode}: {stderr}')
+
+def transcode(stream_id: int, source_url: str, lease: Lease) -> Dict[str, Any]:
+    source = store.source_for(source_url)
+    duration, height = probe(source)
+    rungs = [r for r in RENDITION_LADDER if not height or r[1] <= height] or RENDITION_LADDER[-1:]
+
+    key = f'{stream_id}/hls'
+    out_dir = store.object_path(key)
+    os.makedirs(out_dir, exist_ok=True)
+
+    def report(done_steps: int, fraction: float) -> None:
+        # Lease sends the latest value with its next beat
+        lease.progress = (done_steps + fraction) / (len(rungs) + 1)
+
+    for step, (name, rung_height, v_bitrate, a_bitrate) in enumerate(rungs):
+        run_ffmpeg([
+            '-i', source, '-vf', f'scale=-2:{rung_height}',
+            '-c:v', 'libx264', '-preset', 'veryfast', '-b:v', v_bitrate, '-maxrate', v_bitrate,
+            '-bufsize', v_bitrate, '-g', '48', '-keyint_min', '48', '-sc_threshold', '0',
+            '-c:a', 'aac', '-b:a', a_bitrate,
+            '-hls_time', '6', '-hls_playlist_type', 'vod',
+            '-hls_segment_filename', os.path.join(out_dir, f'{name}_%05d.ts'),
+            os.path.join(out_dir, f'{name}.m3u8'),
+        ], duration, lambda fraction, step=step: report(step, fraction))
+
+    with open(os.path.join(out_dir, 'master.m3u8'), 'w') as master:
+        master.write('#EXTM3U\n#EXT-X-VERSION:3\n')
+        for name, rung_height, v_bitrate, a_bitrate in rungs:
+            bandwidth = (int(v_bitrate[:-1]) + int(a_bitrate[:-1])) * 1000
+            master.write(f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={rung_height * 16 // 9}x{rung_height}\n{name}.m3u8\n')
+
+    thumb_key = f'{stream_id}/thumbnail.jpg'
+    run_ffmpeg([
+        '-ss', str(duration * 0.1), '-i', source, '-frames:v', '1', '-vf', 'scale=-2:360',
+        store.object_path(thumb_key),
+    ], 0, lambda fraction: None)
+
+    return {
+        'duration': int(round(duration)),
+        'thumbnail_url': store.object_url(thumb_key),
+        'hls_url': store.object_url(f'{key}/master.m3u8'),
+        'renditions': [name for name, *_ in rungs],
+    }
+
+def work(worker_index: int) -> None:
+    worker_id = f'{socket.gethostname()}:{os.getpid()}:{worker_index}'
+    backoff = IDLE_SLEEP_SECONDS
+    while True:
+        try:
+            job = claim(worker_id)
+            if not job:
+                time.sleep(IDLE_SLEEP_SECONDS)
+                continue
+            job_id, stream_id, source, attempts, max_attempts = job
+            if attempts > max_attempts:
+                fail(job_id, worker_id, attempts, max_attempts, 'Lease expired too many times')
+                continue
+            result, error = None, ''
+            with Lease(job_id, worker_id) as lease:
+                try:
+                    result = transcode(stream_id, source, lease)
+                except Exception as e:
+                    error = str(e)
+            if result is None:
+                fail(job_id, worker_id, attempts, max_attempts, error)
+            else:
+                finish(job_id, stream_id, worker_id, result)
+            backoff = IDLE_SLEEP_SECONDS
+        except DB_ERRORS:
+            # Database down or pool exhausted: the worker stays up and retries; a job it was holding
+            # goes back to the queue once its lease expires
+            time.sleep(backoff)
+            backoff = min(backoff * 2, DB_BACKOFF_MAX_SECONDS)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Run media job workers')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    # Every worker process opens its own DB connections; nothing is shared across the fork
+    ctx = multiprocessing.get_context('spawn')
+    workers = [ctx.Process(target=work, args=(i,), daemon=True) for i in range(args.workers)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+'''
+Business: Compare peak memory of the admin get_videos listing before and after the server-side cursor
+Args: DATABASE_URL env, --rows rows to seed into streams (default 1M)
+Returns: prints peak RSS per variant (the paged listing walks all pages); each variant runs in its own process so RSS peaks do not mix
+'''
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import uuid
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'api'))
+
+
+def seed(rows: int):
+    tag = uuid.uuid4().hex[:8]
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO users (username, display_name, email) VALUES (%s, %s, %s) RETURNING id",
+        (f'bench_{tag}', 'Bench', f'bench_{tag}@example.com')
+    )
+    owner_id = cur.fetchone()[0]
+    cur.execute("""
+        INSERT INTO streams (user_id, title, view_count, like_count)
+        SELECT %s, 'Bench video ' || g, g %% 100000, g %% 1000
+        FROM generate_series(1, %s) g
+    """, (owner_id, rows))
+    conn.commit()
+    cur.close()
+    conn.close()
+    return owner_id
+
+
+def cleanup(owner_id: int) -> None:
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    cur.execute("DELETE FROM streams WHERE user_id = %s", (owner_id,))
+    cur.execute("DELETE FROM users WHERE id = %s", (owner_id,))
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def run_variant(variant: str) -> None:
+    started = time.perf_counter()
+    if variant == 'before':
+        from psycopg2.extras import RealDictCursor
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute("SELECT id as stream_id, title, user_id, view_count, like_count FROM streams ORDER BY id ASC")
+        videos = cur.fetchall()
+        body_size = len(json.dumps({'videos': [dict(v) for v in videos]}, default=str))
+        cur.close()
+        conn.close()
+    else:
+        import index
+        # The listing is paged; walk every page so the export covers the same rows as 'before'
+        params = {'action': 'get_videos', 'limit': '10000'}
+        if variant == 'after_ndjson':
+            params['format'] = 'ndjson'
+        body_size = 0
+        while True:
+            result = index.handler({'httpMethod': 'GET', 'queryStringParameters': params}, None)
+            body_size += len(result['body'])
+            next_after_id = result['headers'].get('X-Next-After-Id')
+            if not next_after_id:
+                break
+            params['after_id'] = next_after_id
+    print(json.dumps({
+        'variant': variant,
+        'seconds': round(time.perf_counter() - started, 2),
+        'body_mb': round(body_size / 2 ** 20, 1),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--variant', choices=['before', 'after', 'after_ndjson'])
+    args = parser.parse_args()
+
+    if args.variant:
+        run_variant(args.variant)
+        return
+
+    owner_id = seed(args.rows)
+    try:
+        for variant in ('before', 'after', 'after_ndjson'):
+            subprocess.run([sys.executable, __file__, '--variant', variant], check=True)
+    finally:
+        cleanup(owner_id)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+'''
+Business: Measure login throughput through the scrypt pool and the per-request cost of token auth
+Args: --threads concurrent login callers (default 16), --logins per caller (default 8), --requests for the verify loop
+Returns: prints KDF ms per hash, logins/sec, and µs per request for Request.user_id with X-User-Id vs a bearer token
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('SESSION_SECRET', 'auth-bench')
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'api'))
+
+import passwords  # noqa: E402
+import session  # noqa: E402
+from router import Request  # noqa: E402
+
+
+def resolve_us(headers, requests: int) -> float:
+    event = {'httpMethod': 'POST', 'queryStringParameters': {'action': 'like'}, 'headers': headers}
+    started = time.perf_counter()
+    for _ in range(requests):
+        Request(event).user_id
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--logins', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=100_000)
+    args = parser.parse_args()
+
+    stored = passwords.hash_password('correct horse')
+    started = time.perf_counter()
+    assert passwords.verify_password('correct horse', stored)
+    kdf_ms = (time.perf_counter() - started) * 1000
+
+    def logins(_):
+        for _ in range(args.logins):
+            assert passwords.verify_password('correct horse', stored)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as callers:
+        list(callers.map(logins, range(args.threads)))
+    elapsed = time.perf_counter() - started
+
+    # Legacy header path: parse an int. Token path: HMAC + base64 + json + revocation lookup
+    session.TRUST_USER_HEADER = True
+    header_us = resolve_us({'X-User-Id': '42'}, args.requests)
+    token = session.issue(42)['token']
+    token_us = resolve_us({'Authorization': f'Bearer {token}'}, args.requests)
+
+    print(json.dumps({
+        'scrypt': {'n': passwords.SCRYPT_N, 'r': passwords.SCRYPT_R, 'p': passwords.SCRYPT_P},
+        'kdf_workers': passwords.HASH_WORKERS,
+        'kdf_ms': round(kdf_ms, 2),
+        'logins': args.threads * args.logins,
+        'logins_per_sec': round(args.threads * args.logins / elapsed, 1),
+        'user_header_us': round(header_us, 2),
+        'bearer_token_us': round(token_us, 2),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
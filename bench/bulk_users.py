@@ -0,0 +1,86 @@
+'''
+Business: Compare per-row registration INSERTs with the COPY-based bulk user import
+Args: DATABASE_URL env, --users rows for the import (default 1M), --sample rows for the per-row path, --format csv|ndjson
+Returns: prints rows/sec for both paths, the projected per-row time for --users, and the import phase timings
+'''
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'api'))
+
+import passwords  # noqa: E402
+from users_import import import_users  # noqa: E402
+
+
+def write_source(path: str, tag: str, users: int, fmt: str, password_hash: str) -> None:
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            f.write('username,email,display_name,password\n')
+            for i in range(users):
+                f.write(f'{tag}_{i},{tag}_{i}@example.com,Import user {i},{password_hash}\n')
+        else:
+            for i in range(users):
+                f.write(json.dumps({
+                    'username': f'{tag}_{i}', 'email': f'{tag}_{i}@example.com',
+                    'display_name': f'Import user {i}', 'password': password_hash,
+                }) + '\n')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--sample', type=int, default=2000)
+    parser.add_argument('--format', choices=('csv', 'ndjson'), default='csv')
+    args = parser.parse_args()
+
+    tag = f'imp{uuid.uuid4().hex[:6]}'
+    # Exported rows carry hashes already; hashing a million passwords is a KDF benchmark, not an import one
+    password_hash = passwords.hash_password('imported')
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    try:
+        # The registration statement, one round-trip and one commit per user
+        started = time.perf_counter()
+        for i in range(args.sample):
+            cur.execute("""
+                INSERT INTO users (username, email, password, display_name, avatar_url, bio, subscriber_count, is_verified)
+                VALUES (%s, %s, %s, %s, %s, %s, 0, false)
+                RETURNING id, username, email, display_name, avatar_url, is_verified, subscriber_count
+            """, (f'{tag}r_{i}', f'{tag}r_{i}@example.com', password_hash, f'Row user {i}', None, ''))
+            cur.fetchone()
+            conn.commit()
+        per_row = args.sample / (time.perf_counter() - started)
+
+        path = os.path.join(tempfile.mkdtemp(prefix='bulk-users-'), f'users.{args.format}')
+        write_source(path, tag, args.users, args.format, password_hash)
+        started = time.perf_counter()
+        with open(path, newline='', encoding='utf-8') as source:
+            phases = import_users(conn, source, args.format)
+        bulk = args.users / (time.perf_counter() - started)
+        os.unlink(path)
+    finally:
+        conn.rollback()
+        cur.execute("DELETE FROM users WHERE username LIKE %s", (f'{tag}%',))
+        conn.commit()
+        conn.close()
+
+    print(json.dumps({
+        'users': args.users,
+        'per_row_rows_per_sec': round(per_row),
+        'per_row_projected_min': round(args.users / per_row / 60, 1),
+        'bulk_rows_per_sec': round(bulk),
+        'bulk_seconds': round(args.users / bulk, 1),
+        'import': phases,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
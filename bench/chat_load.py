@@ -0,0 +1,127 @@
+'''
+Business: Load-test live chat fan-out: many SSE viewers on one stream and a pool of senders posting messages
+Args: --url server base URL, --stream live stream id, --viewers (default 50000), --senders, --rate msgs/sec, --seconds;
+      SESSION_SECRET env matching the server, senders post with signed session tokens
+Returns: prints accepted/limited sends, delivered messages per second and fan-out latency percentiles (send -> viewer)
+'''
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import time
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'realtime'))
+
+import session  # noqa: E402
+
+
+async def viewer(host: str, port: int, stream_id: int, latencies, stats, stop: asyncio.Event) -> None:
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        stats['connect_errors'] += 1
+        return
+    writer.write(f'GET /events?streams={stream_id} HTTP/1.1\r\nHost: {host}\r\n\r\n'.encode())
+    await writer.drain()
+    stats['connected'] += 1
+    chat_event = False
+    try:
+        while not stop.is_set():
+            line = await reader.readline()
+            if not line:
+                break
+            if line.startswith(b'event: chat'):
+                chat_event = True
+                continue
+            if chat_event and line.startswith(b'data: '):
+                now = time.time()
+                for message in json.loads(line[6:]):
+                    latencies.append(now - message['at'])
+                stats['delivered'] += 1
+                chat_event = False
+    finally:
+        writer.close()
+
+
+async def send(host: str, port: int, stream_id: int, token: str, text: str, stats) -> None:
+    body = json.dumps({'text': text}).encode()
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write((
+        f'POST /chat/send?stream_id={stream_id} HTTP/1.1\r\nHost: {host}\r\nAuthorization: Bearer {token}\r\n'
+        f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n'
+    ).encode() + body)
+    await writer.drain()
+    status = (await reader.readline()).split()[1]
+    await reader.read()
+    writer.close()
+    stats[{b'200': 'accepted', b'429': 'rate_limited'}.get(status, 'send_errors')] += 1
+
+
+async def sender(host: str, port: int, stream_id: int, senders: int, rate: float, seconds: float, stats) -> None:
+    # Round-robin over distinct user ids so the per-user limit is not what the benchmark measures
+    tokens = [session.issue(1_000_000 + i)['token'] for i in range(senders)]
+    deadline = time.time() + seconds
+    i = 0
+    while time.time() < deadline:
+        asyncio.create_task(send(host, port, stream_id, tokens[i % senders], f'message {i}', stats))
+        i += 1
+        await asyncio.sleep(1 / rate)
+
+
+def percentile(values, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+async def main_async(args) -> None:
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    latencies = []
+    stats = {'connected': 0, 'connect_errors': 0, 'delivered': 0, 'accepted': 0, 'rate_limited': 0, 'send_errors': 0}
+    stop = asyncio.Event()
+    tasks = [asyncio.create_task(viewer(host, port, args.stream, latencies, stats, stop)) for _ in range(args.viewers)]
+    while stats['connected'] + stats['connect_errors'] < args.viewers:
+        await asyncio.sleep(0.2)
+
+    started = time.time()
+    await sender(host, port, args.stream, args.senders, args.rate, args.seconds, stats)
+    await asyncio.sleep(3)
+    elapsed = time.time() - started
+    stop.set()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    print(json.dumps({
+        **stats,
+        'sent_per_sec': round((stats['accepted'] + stats['rate_limited']) / args.seconds, 1),
+        'messages_received': len(latencies),
+        'messages_received_per_sec': round(len(latencies) / elapsed, 1),
+        'fanout_latency_ms': {p: round(percentile(latencies, q) * 1000, 1)
+                              for p, q in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99), ('max', 1.0))},
+    }, indent=2))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--url', default='http://127.0.0.1:8080')
+    parser.add_argument('--stream', type=int, required=True)
+    parser.add_argument('--viewers', type=int, default=50000)
+    parser.add_argument('--senders', type=int, default=500)
+    parser.add_argument('--rate', type=float, default=50)
+    parser.add_argument('--seconds', type=float, default=30)
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (max(soft, min(hard, args.viewers + args.senders + 1024)), hard))
+    asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+'''
+Business: Measure how many likes per second a single hot stream can take
+Args: DATABASE_URL env, --likes total likes, --threads concurrent writers
+Returns: prints likes/sec for per-request UPDATE (before) and the buffered counter (after)
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+
+os.environ.setdefault('DB_POOL_MAX_SIZE', '16')
+os.environ.setdefault('SESSION_SECRET', 'counters-bench')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'api'))
+
+import index  # noqa: E402
+import session  # noqa: E402
+from counters import counters  # noqa: E402
+from db import connection  # noqa: E402
+
+
+def seed(likes: int):
+    tag = uuid.uuid4().hex[:8]
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO users (username, display_name, email) VALUES (%s, %s, %s) RETURNING id",
+        (f'bench_{tag}', 'Bench', f'bench_{tag}@example.com')
+    )
+    owner_id = cur.fetchone()[0]
+    cur.execute("INSERT INTO streams (user_id, title) VALUES (%s, 'hot') RETURNING id", (owner_id,))
+    stream_ids = [cur.fetchone()[0]]
+    cur.execute("INSERT INTO streams (user_id, title) VALUES (%s, 'hot') RETURNING id", (owner_id,))
+    stream_ids.append(cur.fetchone()[0])
+    cur.execute("""
+        INSERT INTO users (username, display_name, email)
+        SELECT 'bench_' || %s || '_' || g, 'Bench', 'bench_' || %s || '_' || g || '@example.com'
+        FROM generate_series(1, %s) g
+        RETURNING id
+    """, (tag, tag, likes))
+    user_ids = [row[0] for row in cur.fetchall()]
+    conn.commit()
+    cur.close()
+    conn.close()
+    return owner_id, stream_ids, user_ids
+
+
+def cleanup(owner_id, stream_ids, user_ids) -> None:
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    cur.execute("DELETE FROM like_keys WHERE stream_id = ANY(%s)", (stream_ids,))
+    cur.execute("DELETE FROM likes WHERE stream_id = ANY(%s)", (stream_ids,))
+    cur.execute("DELETE FROM streams WHERE id = ANY(%s)", (stream_ids,))
+    cur.execute("DELETE FROM users WHERE id = ANY(%s)", (user_ids + [owner_id],))
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def like_before(user_id: int, stream_id: int) -> None:
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            WITH liked AS (
+                INSERT INTO like_keys (stream_id, user_id) VALUES (%s, %s)
+                ON CONFLICT (stream_id, user_id) DO NOTHING
+                RETURNING stream_id, user_id
+            )
+            INSERT INTO likes (stream_id, user_id) SELECT stream_id, user_id FROM liked
+        """, (stream_id, user_id))
+        cur.execute("UPDATE streams SET like_count = like_count + 1 WHERE id = %s", (stream_id,))
+        conn.commit()
+        cur.close()
+
+
+def like_after(user_id: int, stream_id: int) -> None:
+    response = index.handler({
+        'httpMethod': 'POST',
+        'queryStringParameters': {'action': 'like'},
+        'headers': {'Authorization': f'Bearer {session.issue(user_id)["token"]}'},
+        'body': json.dumps({'stream_id': stream_id}),
+    }, None)
+    assert response['statusCode'] == 200, response
+
+
+def run(fn, user_ids, stream_id: int, threads: int) -> float:
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda uid: fn(uid, stream_id), user_ids))
+    return len(user_ids) / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--likes', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=int(os.environ['DB_POOL_MAX_SIZE']))
+    args = parser.parse_args()
+
+    owner_id, stream_ids, user_ids = seed(args.likes)
+    try:
+        before = run(like_before, user_ids, stream_ids[0], args.threads)
+        after = run(like_after, user_ids, stream_ids[1], args.threads)
+        with connection() as conn:
+            counters.flush(conn)
+            cur = conn.cursor()
+            cur.execute("SELECT id, like_count FROM streams WHERE id = ANY(%s) ORDER BY id", (stream_ids,))
+            counts = cur.fetchall()
+            cur.close()
+    finally:
+        cleanup(owner_id, stream_ids, user_ids)
+
+    print(json.dumps({
+        'likes': args.likes,
+        'threads': args.threads,
+        'before_likes_per_sec': round(before, 1),
+        'after_likes_per_sec': round(after, 1),
+        'final_like_counts': [c for _, c in counts],
+        'counters': counters.stats(),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
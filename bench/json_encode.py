@@ -0,0 +1,97 @@
+'''
+Business: Measure response serialization: RealDictRow + json.dumps(default=str) against RowEncoder on tuple rows
+Args: --feed-rows rows on a feed page (default 100), --dump-rows rows in the admin dump (default 100k), --repeat
+Returns: prints ms per encode for both paths, the speedup, and which JSON backend RowEncoder used (orjson or stdlib)
+'''
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from psycopg2.extras import RealDictRow
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'api'))
+
+import jsonstream  # noqa: E402
+from admin import ADMIN_VIDEOS  # noqa: E402
+from catalog import STREAM_CARD, STREAM_CARD_FIELDS  # noqa: E402
+
+
+def stream_rows(count: int):
+    rng = random.Random(7)
+    now = datetime(2024, 5, 1, 12, 0, 0)
+    for i in range(count):
+        created_at = now - timedelta(seconds=rng.randrange(30 * 86400), microseconds=rng.randrange(10 ** 6))
+        yield (
+            i + 1, rng.randrange(1, 5000), f'Стрим номер {i}', 'Описание ' * 8, 'Игры', f'https://cdn.example.com/t/{i}.jpg',
+            f'https://cdn.example.com/v/{i}.mp4', rng.randrange(7200), rng.random() < 0.1, rng.randrange(10 ** 6),
+            rng.randrange(10 ** 4), created_at, created_at, f'user{i}', f'Канал {i}', None, rng.random() < 0.05,
+            rng.randrange(10 ** 5),
+        )
+
+
+def timed(fn, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def encode_rows_per_row(rows, columns, key):
+    # The previous admin encoder: one json.dumps per row through a dict copy and default=str
+    yield '{' + json.dumps(key) + ': ['
+    first = True
+    for row in rows:
+        if first:
+            first = False
+        else:
+            yield ', '
+        yield json.dumps(dict(zip(columns, row)), default=str)
+    yield ']}'
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--feed-rows', type=int, default=100)
+    parser.add_argument('--dump-rows', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    feed_tuples = list(stream_rows(args.feed_rows))
+    feed_dict_rows = [RealDictRow(zip(STREAM_CARD_FIELDS, row)) for row in feed_tuples]
+    feed_before = timed(lambda: json.dumps([dict(s) for s in feed_dict_rows], default=str), args.repeat * 50)
+    feed_after = timed(lambda: STREAM_CARD.encode(feed_tuples), args.repeat * 50)
+
+    dump_tuples = [(row[0], row[2], row[1], row[9], row[10]) for row in stream_rows(args.dump_rows)]
+    dump_before = timed(lambda: ''.join(encode_rows_per_row(dump_tuples, ADMIN_VIDEOS.columns, 'videos')), args.repeat)
+    dump_after = timed(lambda: ''.join(ADMIN_VIDEOS.encode_chunks(dump_tuples, key='videos')), args.repeat)
+
+    # Both paths must describe the same data
+    assert json.loads(''.join(ADMIN_VIDEOS.encode_chunks(dump_tuples, key='videos'))) == \
+        json.loads(''.join(encode_rows_per_row(dump_tuples, ADMIN_VIDEOS.columns, 'videos')))
+
+    print(json.dumps({
+        'backend': 'orjson' if jsonstream.orjson is not None else 'json',
+        'feed_page': {
+            'rows': args.feed_rows,
+            'before_ms': round(feed_before, 3),
+            'after_ms': round(feed_after, 3),
+            'speedup': round(feed_before / feed_after, 2),
+        },
+        'admin_dump': {
+            'rows': args.dump_rows,
+            'before_ms': round(dump_before, 1),
+            'after_ms': round(dump_after, 1),
+            'speedup': round(dump_before / dump_after, 2),
+        },
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
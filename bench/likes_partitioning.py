@@ -0,0 +1,269 @@
+'''
+Business: Compare the flat likes table with the V0019 layout (like_keys by stream hash + likes by month and stream hash)
+Args: DATABASE_URL env, --rows likes to load (default 100M), --months of history, --streams, --samples single-row likes
+Returns: prints per layout: load time, like insert latency, delete-by-stream, purge batches, VACUUM, sizes and old-month removal
+'''
+
+import argparse
+import json
+import os
+import statistics
+import time
+import uuid
+from datetime import date
+from typing import Any, Callable, Dict, List
+
+import psycopg2
+
+PURGE_BATCH = 1000
+KEY_PARTITIONS = 16
+MONTH_PARTITIONS = 8
+
+# Both layouts live in a throwaway schema; no FKs to users/streams so the load measures the table alone
+FLAT = '''
+    CREATE TABLE {s}.likes (
+        id BIGSERIAL PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        stream_id INTEGER NOT NULL,
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (user_id, stream_id)
+    );
+    CREATE INDEX ON {s}.likes (stream_id);
+'''
+
+PARTITIONED = '''
+    CREATE TABLE {s}.like_keys (
+        stream_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        PRIMARY KEY (stream_id, user_id)
+    ) PARTITION BY HASH (stream_id);
+    CREATE INDEX ON {s}.like_keys (user_id, stream_id);
+    CREATE TABLE {s}.likes (
+        stream_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    ) PARTITION BY RANGE (created_at);
+    CREATE TABLE {s}.likes_default PARTITION OF {s}.likes DEFAULT;
+    CREATE INDEX ON {s}.likes (stream_id, created_at) INCLUDE (user_id);
+    CREATE INDEX ON {s}.likes (user_id, stream_id);
+'''
+
+# Rows are spread evenly over the history, ending at the start of the current month
+SOURCE = '''
+    SELECT (g / %(streams)s)::int + 1 AS user_id, (g %% %(streams)s)::int + 1 AS stream_id,
+           %(end)s::timestamp - make_interval(secs => (g::float8 / %(rows)s) * %(span)s) AS created_at
+    FROM generate_series(0, %(rows)s - 1) g
+'''
+
+
+def month_start(back: int) -> date:
+    today = date.today()
+    index = today.year * 12 + today.month - 1 - back
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def timed(fn: Callable[[], Any]) -> float:
+    started = time.perf_counter()
+    fn()
+    return round(time.perf_counter() - started, 2)
+
+
+def run(cur, sql: str, params=None) -> None:
+    cur.execute(sql, params)
+
+
+def vacuum(conn, cur, tables: str) -> None:
+    # VACUUM refuses to run inside a transaction block
+    conn.commit()
+    conn.autocommit = True
+    try:
+        cur.execute(f'VACUUM {tables}')
+    finally:
+        conn.autocommit = False
+
+
+def month_partitions(cur, s: str, months: int) -> List[str]:
+    names = []
+    for back in range(months, -2, -1):
+        start = month_start(back)
+        name = f'likes_{start:%Y_%m}'
+        cur.execute(f'''
+            CREATE TABLE {s}.{name} PARTITION OF {s}.likes
+            FOR VALUES FROM ('{start}') TO ('{month_start(back - 1)}') PARTITION BY HASH (stream_id)
+        ''')
+        for i in range(MONTH_PARTITIONS):
+            cur.execute(f'CREATE TABLE {s}.{name}_h{i} PARTITION OF {s}.{name} '
+                        f'FOR VALUES WITH (MODULUS {MONTH_PARTITIONS}, REMAINDER {i})')
+        names.append(name)
+    return names
+
+
+def sizes(cur, s: str, table: str) -> Dict[str, int]:
+    # pg_partition_tree covers a plain table too (it is its own only member)
+    cur.execute('''
+        SELECT coalesce(sum(pg_table_size(relid)), 0), coalesce(sum(pg_indexes_size(relid)), 0)
+        FROM pg_partition_tree(%s::regclass)
+    ''', (f'{s}.{table}',))
+    heap, indexes = cur.fetchone()
+    return {'table_mb': round(heap / 2 ** 20), 'indexes_mb': round(indexes / 2 ** 20)}
+
+
+def latency(conn, cur, sql: str, params: List[tuple]) -> Dict[str, float]:
+    samples = []
+    for args in params:
+        started = time.perf_counter()
+        cur.execute(sql, args)
+        conn.commit()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        'p50_ms': round(statistics.median(samples), 3),
+        'p99_ms': round(samples[int(len(samples) * 0.99) - 1], 3),
+    }
+
+
+def purge(conn, cur, sql: str, users: List[int]) -> Dict[str, Any]:
+    # Same loop as purge.py: one batch per transaction until a user has nothing left
+    batches = 0
+    started = time.perf_counter()
+    for user_id in users:
+        while True:
+            cur.execute(sql, (user_id, PURGE_BATCH))
+            deleted = len(cur.fetchall())
+            conn.commit()
+            batches += 1
+            if deleted < PURGE_BATCH:
+                break
+    return {'seconds': round(time.perf_counter() - started, 2), 'batches': batches}
+
+
+def bench_flat(conn, cur, s: str, args, params: Dict[str, Any], fresh: List[tuple],
+               streams: List[int], users: List[int]) -> Dict[str, Any]:
+    run(cur, FLAT.format(s=s))
+    conn.commit()
+    report: Dict[str, Any] = {}
+    report['load_seconds'] = timed(lambda: run(cur, f'INSERT INTO {s}.likes (user_id, stream_id, created_at) {SOURCE}', params))
+    conn.commit()
+    run(cur, f'ANALYZE {s}.likes')
+    conn.commit()
+    report['size_after_load'] = sizes(cur, s, 'likes')
+    report['like_insert'] = latency(conn, cur, f'''
+        INSERT INTO {s}.likes (user_id, stream_id) VALUES (%s, %s)
+        ON CONFLICT (user_id, stream_id) DO NOTHING RETURNING id
+    ''', fresh)
+    report['delete_by_stream_seconds'] = timed(
+        lambda: run(cur, f'DELETE FROM {s}.likes WHERE stream_id = ANY(%s)', (streams,)))
+    conn.commit()
+    report['purge_by_user'] = purge(conn, cur, f'''
+        DELETE FROM {s}.likes WHERE id IN (SELECT id FROM {s}.likes WHERE user_id = %s LIMIT %s)
+        RETURNING stream_id
+    ''', users)
+    report['drop_old_months_seconds'] = timed(
+        lambda: run(cur, f'DELETE FROM {s}.likes WHERE created_at < %s', (params['cutoff'],)))
+    conn.commit()
+    report['vacuum_seconds'] = timed(lambda: vacuum(conn, cur, f'{s}.likes'))
+    report['size_after_maintenance'] = sizes(cur, s, 'likes')
+    return report
+
+
+def bench_partitioned(conn, cur, s: str, args, params: Dict[str, Any], fresh: List[tuple],
+                      streams: List[int], users: List[int]) -> Dict[str, Any]:
+    run(cur, PARTITIONED.format(s=s))
+    for i in range(KEY_PARTITIONS):
+        run(cur, f'CREATE TABLE {s}.like_keys_h{i} PARTITION OF {s}.like_keys '
+                 f'FOR VALUES WITH (MODULUS {KEY_PARTITIONS}, REMAINDER {i})')
+    months = month_partitions(cur, s, args.months)
+    conn.commit()
+    report: Dict[str, Any] = {}
+
+    def load() -> None:
+        run(cur, f'INSERT INTO {s}.like_keys (user_id, stream_id) SELECT user_id, stream_id FROM ({SOURCE}) src', params)
+        run(cur, f'INSERT INTO {s}.likes (user_id, stream_id, created_at) {SOURCE}', params)
+        conn.commit()
+
+    report['load_seconds'] = timed(load)
+    run(cur, f'ANALYZE {s}.like_keys; ANALYZE {s}.likes')
+    conn.commit()
+    report['size_after_load'] = {'like_keys': sizes(cur, s, 'like_keys'), 'likes': sizes(cur, s, 'likes')}
+    report['like_insert'] = latency(conn, cur, f'''
+        WITH liked AS (
+            INSERT INTO {s}.like_keys (stream_id, user_id) VALUES (%s, %s)
+            ON CONFLICT (stream_id, user_id) DO NOTHING
+            RETURNING stream_id, user_id
+        )
+        INSERT INTO {s}.likes (stream_id, user_id) SELECT stream_id, user_id FROM liked RETURNING stream_id
+    ''', [(stream, user) for user, stream in fresh])
+
+    def delete_streams() -> None:
+        run(cur, f'DELETE FROM {s}.like_keys WHERE stream_id = ANY(%s)', (streams,))
+        run(cur, f'DELETE FROM {s}.likes WHERE stream_id = ANY(%s)', (streams,))
+        conn.commit()
+
+    report['delete_by_stream_seconds'] = timed(delete_streams)
+    report['purge_by_user'] = purge(conn, cur, f'''
+        WITH keys AS (
+            DELETE FROM {s}.like_keys WHERE (stream_id, user_id) IN (
+                SELECT stream_id, user_id FROM {s}.like_keys WHERE user_id = %s LIMIT %s)
+            RETURNING stream_id, user_id
+        ), events AS (
+            DELETE FROM {s}.likes l USING keys k WHERE l.user_id = k.user_id AND l.stream_id = k.stream_id
+        )
+        SELECT stream_id FROM keys
+    ''', users)
+
+    # What likes_archive.py does to months past the cutoff, minus the COPY to a file
+    def drop_months() -> None:
+        for name in months:
+            if name < f'likes_{params["cutoff"]:%Y_%m}':
+                run(cur, f'ALTER TABLE {s}.likes DETACH PARTITION {s}.{name}')
+                run(cur, f'DROP TABLE {s}.{name}')
+        conn.commit()
+
+    report['drop_old_months_seconds'] = timed(drop_months)
+    report['vacuum_seconds'] = timed(lambda: vacuum(conn, cur, f'{s}.like_keys, {s}.likes'))
+    report['size_after_maintenance'] = {'like_keys': sizes(cur, s, 'like_keys'), 'likes': sizes(cur, s, 'likes')}
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100_000_000)
+    parser.add_argument('--months', type=int, default=12)
+    parser.add_argument('--streams', type=int, default=100_000)
+    parser.add_argument('--samples', type=int, default=2000)
+    parser.add_argument('--layout', choices=('flat', 'partitioned', 'both'), default='both')
+    args = parser.parse_args()
+
+    # History covers the last --months full months; both layouts then drop everything older than two of them
+    end = month_start(0)
+    params = {'rows': args.rows, 'streams': args.streams, 'end': end,
+              'span': (end - month_start(args.months)).total_seconds(), 'cutoff': month_start(args.months - 2)}
+    users = args.rows // args.streams + 1
+    # New pairs past the loaded users so every sample is a real insert, not an ON CONFLICT no-op
+    fresh = [(users + 1 + i, i % args.streams + 1) for i in range(args.samples)]
+    streams = list(range(1, 11))
+    purge_users = list(range(1, 11))
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    report: Dict[str, Any] = {'rows': args.rows, 'months': args.months, 'streams': args.streams}
+    layouts = {'flat': bench_flat, 'partitioned': bench_partitioned}
+    for name, fn in layouts.items():
+        if args.layout not in (name, 'both'):
+            continue
+        schema = f'likes_bench_{name}_{uuid.uuid4().hex[:6]}'
+        cur = conn.cursor()
+        cur.execute(f'CREATE SCHEMA {schema}')
+        conn.commit()
+        try:
+            report[name] = fn(conn, cur, schema, args, params, fresh, streams, purge_users)
+        finally:
+            conn.rollback()
+            cur.execute(f'DROP SCHEMA {schema} CASCADE')
+            conn.commit()
+            cur.close()
+    conn.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+'''
+Business: Load-test the realtime push server with many concurrent SSE watchers on one node
+Args: DATABASE_URL env, --url server base URL, --watchers (default 10000), --streams watched ids, --rate notifies/sec, --seconds
+Returns: prints connected watchers, delivered diffs and end-to-end latency percentiles (NOTIFY -> client)
+'''
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import time
+from urllib.parse import urlsplit
+
+import psycopg2
+
+
+async def watcher(host: str, port: int, streams, latencies, stats, stop: asyncio.Event) -> None:
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        stats['connect_errors'] += 1
+        return
+    writer.write(f'GET /events?streams={",".join(map(str, streams))} HTTP/1.1\r\nHost: {host}\r\n\r\n'.encode())
+    await writer.drain()
+    stats['connected'] += 1
+    try:
+        while not stop.is_set():
+            line = await reader.readline()
+            if not line:
+                break
+            if not line.startswith(b'data: '):
+                continue
+            now = time.time()
+            for fields in json.loads(line[6:]).values():
+                if 't' in fields:
+                    latencies.append(now - fields['t'])
+            stats['messages'] += 1
+    finally:
+        writer.close()
+
+
+def publish(rate: float, seconds: float, stream_ids) -> int:
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn.autocommit = True
+    cur = conn.cursor()
+    sent = 0
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        stream_id = random.choice(stream_ids)
+        cur.execute("SELECT pg_notify('stream_counters', %s)", (json.dumps({
+            'stream_id': stream_id, 'like_count': sent, 't': time.time()
+        }),))
+        sent += 1
+        time.sleep(1 / rate)
+    cur.close()
+    conn.close()
+    return sent
+
+
+def percentile(values, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+async def main_async(args) -> None:
+    url = urlsplit(args.url)
+    stream_ids = list(range(1, args.streams + 1))
+    latencies, stats = [], {'connected': 0, 'connect_errors': 0, 'messages': 0}
+    stop = asyncio.Event()
+    tasks = [
+        asyncio.create_task(watcher(url.hostname, url.port or 80, random.sample(stream_ids, min(3, len(stream_ids))),
+                                    latencies, stats, stop))
+        for _ in range(args.watchers)
+    ]
+    while stats['connected'] + stats['connect_errors'] < args.watchers:
+        await asyncio.sleep(0.2)
+    sent = await asyncio.get_running_loop().run_in_executor(None, publish, args.rate, args.seconds, stream_ids)
+    await asyncio.sleep(3)
+    stop.set()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    print(json.dumps({
+        **stats,
+        'notifies_sent': sent,
+        'diffs_delivered': len(latencies),
+        'latency_ms': {p: round(percentile(latencies, q) * 1000, 1)
+                       for p, q in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99), ('max', 1.0))},
+    }, indent=2))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--url', default='http://127.0.0.1:8080')
+    parser.add_argument('--watchers', type=int, default=10000)
+    parser.add_argument('--streams', type=int, default=500)
+    parser.add_argument('--rate', type=float, default=200)
+    parser.add_argument('--seconds', type=float, default=30)
+    args = parser.parse_args()
+
+    # Each watcher holds a socket; raise the soft fd limit as far as the hard limit allows
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (max(soft, min(hard, args.watchers + 1024)), hard))
+    asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+'''
+Business: Check read-replica routing end to end against two local Postgres instances
+Args: DATABASE_URL (primary) and DATABASE_REPLICA_URLS env, both with the schema applied; --reads per step, --window
+Returns: prints which pool served each step: plain reads, reads right after an own write, another client, login, after the window
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+
+# Two instances are enough: a streaming replica of the primary, or a second server restored from a dump
+# (then it is not in recovery and reports zero lag). The window is shortened so the script finishes quickly
+os.environ.setdefault('DB_READ_YOUR_WRITES_SECONDS', '2')
+os.environ.setdefault('RATE_LIMIT_STORE', 'off')
+os.environ.setdefault('SESSION_SECRET', 'replica-routing')
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'api'))
+
+import db  # noqa: E402
+import index  # noqa: E402
+
+
+def call(method: str, action: str, ip: str, body=None) -> int:
+    return index.handler({
+        'httpMethod': method,
+        'queryStringParameters': {'action': action},
+        'headers': {},
+        'body': json.dumps(body) if body is not None else '',
+        'requestContext': {'identity': {'sourceIp': ip}},
+    }, None)['statusCode']
+
+
+def checkouts() -> dict:
+    replicas = db.get_replicas()
+    return {
+        'primary': db.get_pool().stats()['checkouts'],
+        'replica': sum(r['pool']['checkouts'] for r in replicas.stats()['replicas']),
+    }
+
+
+def step(name: str, fn) -> dict:
+    before = checkouts()
+    statuses = fn()
+    after = checkouts()
+    return {'step': name, 'statuses': sorted(set(statuses)), **{k: after[k] - before[k] for k in after}}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--reads', type=int, default=20)
+    parser.add_argument('--window', type=float, default=float(os.environ['DB_READ_YOUR_WRITES_SECONDS']))
+    args = parser.parse_args()
+
+    if db.get_replicas() is None:
+        sys.exit('DATABASE_REPLICA_URLS is not set')
+    username = f'replica_{uuid.uuid4().hex[:8]}'
+    reads = lambda ip: [call('GET', 'users', ip) for _ in range(args.reads)]  # noqa: E731
+
+    report = [
+        step('reads', lambda: reads('10.0.0.1')),
+        step('register', lambda: [call('POST', 'register', '10.0.0.1', {
+            'username': username, 'email': f'{username}@example.com', 'password': 'replica1', 'display_name': 'Replica',
+        })]),
+        step('reads_after_own_write', lambda: reads('10.0.0.1')),
+        step('reads_other_client', lambda: reads('10.0.0.2')),
+        step('login_other_client', lambda: [call('POST', 'login', '10.0.0.2', {'username': username, 'password': 'replica1'})]),
+    ]
+    time.sleep(args.window)
+    report.append(step('reads_after_window', lambda: reads('10.0.0.1')))
+
+    with db.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM users WHERE username = %s", (username,))
+        conn.commit()
+        cur.close()
+
+    print(json.dumps({'steps': report, 'replicas': db.get_replicas().stats()}, indent=2, default=str))
+
+
+if __name__ == '__main__':
+    main()
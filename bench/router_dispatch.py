@@ -0,0 +1,86 @@
+'''
+Business: Microbenchmark of request dispatch and cold-start import time for each cloud function
+Args: --calls dispatches per case, --runs cold starts per function (each in a fresh interpreter)
+Returns: prints µs per dispatch for a stub route, an unmatched action and a validation error, plus import times in ms
+'''
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Benchmarks measure the handlers, not the token buckets that would start answering 429
+os.environ.setdefault('RATE_LIMIT_STORE', 'off')
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+FUNCTIONS = ('api', 'streaming', 'upload-video')
+API_ROUTE_MODULES = ('catalog', 'social', 'auth', 'analytics', 'admin')
+
+COLD_START = '''
+import sys, time, json
+started = time.perf_counter()
+import index
+handler_ms = (time.perf_counter() - started) * 1000
+modules = {}
+for name in sys.argv[1:]:
+    started = time.perf_counter()
+    __import__(name)
+    modules[name] = (time.perf_counter() - started) * 1000
+print(json.dumps({'index': handler_ms, 'modules': modules}))
+'''
+
+
+def cold_start(function: str, runs: int, modules=()) -> dict:
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', COLD_START, *modules], cwd=os.path.join(BACKEND, function),
+                             check=True, capture_output=True, text=True).stdout
+        samples.append(json.loads(out))
+    return {
+        'index_ms': round(statistics.median(s['index'] for s in samples), 2),
+        'route_modules_ms': {name: round(statistics.median(s['modules'][name] for s in samples), 2) for name in modules},
+    }
+
+
+def per_call_us(fn, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=100000)
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.join(BACKEND, 'api'))
+    from router import Router, response  # noqa: E402
+    import index  # noqa: E402
+
+    stub = Router({**index.ROUTES, ('GET', 'ping'): lambda request: response(200, {'ok': True})},
+                  allow_methods='GET, POST, PUT, DELETE, OPTIONS')
+    ping = {'httpMethod': 'GET', 'queryStringParameters': {'action': 'ping'}}
+    unmatched = {'httpMethod': 'GET', 'queryStringParameters': {'action': 'nope'}}
+    invalid = {'httpMethod': 'GET', 'queryStringParameters': {'action': 'search'}}
+
+    print(json.dumps({
+        'dispatch_us': {
+            'stub_route': round(per_call_us(lambda: stub.dispatch(ping, None), args.calls), 2),
+            'unmatched_action': round(per_call_us(lambda: index.handler(unmatched, None), args.calls), 2),
+            'validation_error': round(per_call_us(lambda: index.handler(invalid, None), args.calls), 2),
+            'preflight': round(per_call_us(lambda: index.handler({'httpMethod': 'OPTIONS'}, None), args.calls), 2),
+        },
+        'cold_start': {
+            function: cold_start(function, args.runs, API_ROUTE_MODULES if function == 'api' else ())
+            for function in FUNCTIONS
+        },
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+'''
+Business: Seed a local Postgres with a reproducible social graph for benchmarks: users, streams, power-law likes and subscriptions
+Args: DATABASE_URL env, --users, --streams, --likes, --subscriptions, --seed, --zipf skew; --cleanup TAG removes a previous seed
+Returns: prints the seed tag and row counts; seed() returns the generated ids for the workload harness
+'''
+
+import argparse
+import io
+import itertools
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Set, Tuple
+
+import psycopg2
+
+CATEGORIES = ('Игры', 'Музыка', 'Образование', 'Спорт', 'Технологии', 'Развлечения')
+HISTORY_DAYS = 30
+
+
+def zipf_weights(n: int, skew: float) -> List[float]:
+    # Cumulative weights for rank 1..n, p(rank) ~ 1 / rank^skew: a few channels and streams take most of the traffic
+    return list(itertools.accumulate(1.0 / (rank ** skew) for rank in range(1, n + 1)))
+
+
+def power_law_pairs(rng: random.Random, actors: int, targets: int, count: int, skew: float,
+                    exclude_self: bool = False) -> Set[Tuple[int, int]]:
+    # Actors are uniform, targets follow the power law; pairs are unique like the UNIQUE constraints
+    count = min(count, actors * targets - (min(actors, targets) if exclude_self else 0))
+    weights = zipf_weights(targets, skew)
+    pairs: Set[Tuple[int, int]] = set()
+    while len(pairs) < count:
+        batch = count - len(pairs)
+        for actor, target in zip(
+            (rng.randrange(actors) for _ in range(batch)),
+            rng.choices(range(targets), cum_weights=weights, k=batch),
+        ):
+            if not (exclude_self and actor == target):
+                pairs.add((actor, target))
+    return pairs
+
+
+def copy_rows(cur, table: str, columns: Tuple[str, ...], rows) -> None:
+    buf = io.StringIO()
+    for row in rows:
+        buf.write('\t'.join(str(value) for value in row))
+        buf.write('\n')
+    buf.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buf)
+
+
+def seed(conn, users: int, streams: int, likes: int, subscriptions: int, seed_value: int = 42,
+         skew: float = 1.1) -> Dict[str, Any]:
+    rng = random.Random(seed_value)
+    tag = f'load{seed_value}_{uuid.uuid4().hex[:6]}'
+    now = datetime.now().replace(microsecond=0)
+
+    def at() -> str:
+        return (now - timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400))).isoformat()
+
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO users (username, display_name, email)
+        SELECT %s || '_' || g, 'Load user ' || g, %s || '_' || g || '@example.com'
+        FROM generate_series(1, %s) g
+        RETURNING id
+    """, (tag, tag, users))
+    user_ids = sorted(row[0] for row in cur.fetchall())
+
+    # Channels are ranked too: rank 0 uploads the most and gathers the most subscribers
+    channel_weights = zipf_weights(users, skew)
+    owners = rng.choices(user_ids, cum_weights=channel_weights, k=streams)
+    copy_rows(cur, 'streams', ('user_id', 'title', 'category', 'view_count', 'created_at'), (
+        (owner, f'{tag} stream {i}', rng.choice(CATEGORIES), rng.randrange(100000), at())
+        for i, owner in enumerate(owners)
+    ))
+    cur.execute("SELECT id FROM streams WHERE user_id = ANY(%s) ORDER BY id", (user_ids,))
+    stream_ids = [row[0] for row in cur.fetchall()]
+
+    copy_rows(cur, 'subscriptions', ('subscriber_id', 'channel_id', 'created_at'), (
+        (user_ids[subscriber], user_ids[channel], at())
+        for subscriber, channel in power_law_pairs(rng, users, users, subscriptions, skew, exclude_self=True)
+    ))
+    # Likes are a key (like_keys, one per pair) plus a timestamped event in the month-partitioned log
+    liked = [(user_ids[user], stream_ids[stream], at())
+             for user, stream in power_law_pairs(rng, users, len(stream_ids), likes, skew)]
+    copy_rows(cur, 'like_keys', ('user_id', 'stream_id'), ((user, stream) for user, stream, _ in liked))
+    copy_rows(cur, 'likes', ('user_id', 'stream_id', 'created_at'), liked)
+
+    # The app keeps these through the counters buffer; COPY bypasses it, so recount once
+    cur.execute("""
+        UPDATE users u SET subscriber_count = s.total
+        FROM (SELECT channel_id, count(*) AS total FROM subscriptions WHERE channel_id = ANY(%s) GROUP BY 1) s
+        WHERE u.id = s.channel_id
+    """, (user_ids,))
+    cur.execute("""
+        UPDATE streams st SET like_count = l.total
+        FROM (SELECT stream_id, count(*) AS total FROM likes WHERE stream_id = ANY(%s) GROUP BY 1) l
+        WHERE st.id = l.stream_id
+    """, (stream_ids,))
+    conn.commit()
+    cur.close()
+
+    return {'tag': tag, 'user_ids': user_ids, 'stream_ids': stream_ids, 'skew': skew}
+
+
+def cleanup(conn, tag: str) -> int:
+    cur = conn.cursor()
+    cur.execute("SELECT array_agg(id) FROM users WHERE username LIKE %s", (f'{tag}\\_%',))
+    user_ids = cur.fetchone()[0] or []
+    cur.execute("SELECT array_agg(id) FROM streams WHERE user_id = ANY(%s)", (user_ids,))
+    stream_ids = cur.fetchone()[0] or []
+    cur.execute("DELETE FROM like_keys WHERE user_id = ANY(%s) OR stream_id = ANY(%s)", (user_ids, stream_ids))
+    cur.execute("DELETE FROM likes WHERE user_id = ANY(%s) OR stream_id = ANY(%s)", (user_ids, stream_ids))
+    cur.execute("DELETE FROM subscriptions WHERE subscriber_id = ANY(%s) OR channel_id = ANY(%s)", (user_ids, user_ids))
+    cur.execute("DELETE FROM channel_stats_hourly WHERE channel_id = ANY(%s)", (user_ids,))
+    cur.execute("DELETE FROM uploads WHERE user_id = ANY(%s)", (user_ids,))
+    cur.execute("DELETE FROM streams WHERE user_id = ANY(%s)", (user_ids,))
+    cur.execute("DELETE FROM users WHERE id = ANY(%s)", (user_ids,))
+    conn.commit()
+    cur.close()
+    return len(user_ids)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--streams', type=int, default=50000)
+    parser.add_argument('--likes', type=int, default=500000)
+    parser.add_argument('--subscriptions', type=int, default=200000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--zipf', type=float, default=1.1)
+    parser.add_argument('--cleanup', metavar='TAG')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    if args.cleanup:
+        print(json.dumps({'tag': args.cleanup, 'users_deleted': cleanup(conn, args.cleanup)}))
+        conn.close()
+        return
+
+    started = time.perf_counter()
+    seeded = seed(conn, args.users, args.streams, args.likes, args.subscriptions, args.seed, args.zipf)
+    conn.close()
+    print(json.dumps({
+        'tag': seeded['tag'],
+        'users': len(seeded['user_ids']),
+        'streams': len(seeded['stream_ids']),
+        'seconds': round(time.perf_counter() - started, 2),
+    }, indent=2))
+    print(f'cleanup: python {sys.argv[0]} --cleanup {seeded["tag"]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+'''
+Business: Measure chunked upload throughput and peak RSS of the upload-video function
+Args: DATABASE_URL env, --size-gb file size, --chunk-mb chunk size, --user-id uploader
+Returns: prints MB/s for chunk ingest and assembly plus peak RSS of the process
+'''
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('UPLOAD_STORAGE_DIR', tempfile.mkdtemp(prefix='upload-bench-'))
+os.environ.setdefault('SESSION_SECRET', 'upload-bench')
+# Benchmarks measure the handlers, not the token buckets that would start answering 429
+os.environ.setdefault('RATE_LIMIT_STORE', 'off')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'upload-video'))
+
+import index  # noqa: E402
+import session  # noqa: E402
+
+
+def call(method: str, params, user_id: int, body: str = '', headers=None):
+    response = index.handler({
+        'httpMethod': method,
+        'queryStringParameters': params,
+        'headers': {'Authorization': f"Bearer {session.issue(user_id)['token']}", **(headers or {})},
+        'body': body,
+    }, None)
+    payload = json.loads(response['body'])
+    assert response['statusCode'] == 200, payload
+    return payload
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size-gb', type=float, default=2)
+    parser.add_argument('--chunk-mb', type=int, default=8)
+    parser.add_argument('--user-id', type=int, default=1)
+    args = parser.parse_args()
+
+    chunk_size = args.chunk_mb * 1024 * 1024
+    total_size = int(args.size_gb * 1024 ** 3)
+    # One random block reused for every chunk: the generator itself must not dominate RSS
+    block = os.urandom(chunk_size)
+
+    init = call('POST', {'action': 'init'}, args.user_id, json.dumps({
+        'title': 'Upload benchmark', 'filename': 'bench.bin',
+        'total_size': total_size, 'chunk_size': chunk_size,
+    }))
+    upload_id = init['upload_id']
+
+    started = time.perf_counter()
+    for i in range(init['chunk_count']):
+        data = block[:min(chunk_size, total_size - i * chunk_size)]
+        call('PUT', {'action': 'chunk', 'upload_id': upload_id, 'index': str(i)}, args.user_id,
+             base64.b64encode(data).decode(), {'X-Chunk-Sha256': hashlib.sha256(data).hexdigest()})
+    ingest_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    done = call('POST', {'action': 'complete', 'upload_id': upload_id}, args.user_id)
+    complete_seconds = time.perf_counter() - started
+
+    size_mb = total_size / 2 ** 20
+    print(json.dumps({
+        'size_mb': round(size_mb),
+        'chunk_mb': args.chunk_mb,
+        'ingest_mb_per_sec': round(size_mb / ingest_seconds, 1),
+        'complete_mb_per_sec': round(size_mb / complete_seconds, 1),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'video_id': done['video_id'],
+        'storage_dir': os.environ['UPLOAD_STORAGE_DIR'],
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
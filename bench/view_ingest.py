@@ -0,0 +1,96 @@
+'''
+Business: Measure view-event ingest throughput (dedup + COPY into staging) and rollup cost
+Args: DATABASE_URL env, --events total events, --batch events per request, --viewers distinct sessions, --streams
+Returns: prints events/sec for the handler path and for dedup alone, plus rollup timing and counted views
+'''
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'api'))
+
+import index  # noqa: E402
+from db import connection  # noqa: E402
+from views import ViewIngest, views  # noqa: E402
+
+
+def make_batches(events: int, batch: int, viewers: int, stream_ids):
+    rng = random.Random(42)
+    batches = []
+    for start in range(0, events, batch):
+        batches.append([
+            {
+                'stream_id': rng.choice(stream_ids),
+                'type': 'view' if rng.random() < 0.2 else 'heartbeat',
+                'session_id': f'bench-{rng.randrange(viewers)}',
+                'watch_seconds': 10,
+                'position': rng.randrange(3600),
+            }
+            for _ in range(min(batch, events - start))
+        ])
+    return batches
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--events', type=int, default=200000)
+    parser.add_argument('--batch', type=int, default=1000)
+    parser.add_argument('--viewers', type=int, default=20000)
+    parser.add_argument('--streams', type=int, default=50)
+    args = parser.parse_args()
+
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM streams ORDER BY id LIMIT %s", (args.streams,))
+        stream_ids = [row[0] for row in cur.fetchall()]
+        cur.close()
+    if not stream_ids:
+        sys.exit('no streams to send views to')
+    batches = make_batches(args.events, args.batch, args.viewers, stream_ids)
+
+    # Dedup and parsing alone, without the database round trip
+    dedup = ViewIngest()
+    started = time.perf_counter()
+    for batch in batches:
+        for stream_id, viewer, _, _ in dedup.parse(batch, None):
+            if viewer:
+                dedup._first_in_window(viewer, stream_id)
+    dedup_rate = args.events / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for batch in batches:
+        response = index.handler({
+            'httpMethod': 'POST',
+            'queryStringParameters': {'action': 'view'},
+            'body': json.dumps({'events': batch}),
+        }, None)
+        assert response['statusCode'] == 202, response
+    ingest_rate = args.events / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    rolled = 0
+    with connection() as conn:
+        while True:
+            moved = views.rollup(conn)
+            rolled += moved
+            if not moved:
+                break
+    rollup_seconds = time.perf_counter() - started
+
+    print(json.dumps({
+        'events': args.events,
+        'batch': args.batch,
+        'dedup_events_per_sec': round(dedup_rate, 1),
+        'ingest_events_per_sec': round(ingest_rate, 1),
+        'rows_rolled_up': rolled,
+        'rollup_seconds': round(rollup_seconds, 3),
+        'views': views.stats(),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,330 @@
+'''
+Business: Replay a mixed workload against the api, streaming and upload-video handlers in-process and keep JSON baselines
+Args: DATABASE_URL env, --mix, --concurrency, --requests, --warmup, seed sizes (--users, --streams, --likes, --subscriptions), --seed;
+      --save writes bench/baselines/<mix>-c<concurrency>.json, --compare fails on p95/throughput regressions past --tolerance
+Returns: prints throughput and p50/p95/p99 latency per action; exit code 1 when --compare finds a regression
+'''
+
+import argparse
+import base64
+import hashlib
+import importlib
+import importlib.util
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import psycopg2
+
+os.environ.setdefault('UPLOAD_STORAGE_DIR', tempfile.mkdtemp(prefix='workload-bench-'))
+os.environ.setdefault('SESSION_SECRET', 'workload-bench')
+# Benchmarks measure the handlers, not the token buckets that would start answering 429
+os.environ.setdefault('RATE_LIMIT_STORE', 'off')
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(BENCH_DIR, '..', 'backend')
+BASELINE_DIR = os.path.join(BENCH_DIR, 'baselines')
+sys.path.insert(0, BENCH_DIR)
+
+from seed import cleanup, seed, zipf_weights  # noqa: E402
+
+# Vendored modules every function ships its own copy of; they share names, so each function is
+# imported with its directory first on sys.path and these are dropped from sys.modules afterwards
+SHARED_MODULES = ('index', 'db', 'ratelimit', 'router', 'session', 'tracing')
+
+UPLOAD_SIZE = 512 * 1024
+UPLOAD_CHUNK = 256 * 1024
+
+# action -> weight; an action name is also the key in the report
+MIXES = {
+    'mixed': {
+        'feed': 30, 'streams': 20, 'trending': 10, 'search': 5, 'channel_stats': 5,
+        'like': 15, 'subscribe': 5, 'live': 4, 'viewer_heartbeat': 3, 'upload': 1, 'admin_users': 2,
+    },
+    'read': {'feed': 40, 'streams': 30, 'trending': 15, 'search': 10, 'channel_stats': 5},
+    'write': {'like': 60, 'subscribe': 25, 'viewer_heartbeat': 10, 'upload': 5},
+}
+
+SEARCH_TERMS = ('игр', 'музык', 'stream', 'спорт', 'load')
+
+
+def load_function(name: str) -> Callable[[Dict[str, Any], Any], Dict[str, Any]]:
+    path = os.path.join(BACKEND_DIR, name)
+    for module in list(sys.modules):
+        if module in SHARED_MODULES:
+            del sys.modules[module]
+    sys.path.insert(0, path)
+    try:
+        index = importlib.import_module('index')
+        # Lazy api routes import their module while this function's router is still the one in sys.modules
+        for key in index.router.routes:
+            index.router.resolve(key)
+    finally:
+        sys.path.remove(path)
+        for module in SHARED_MODULES:
+            sys.modules.pop(module, None)
+    return index.handler
+
+
+def issue_tokens(user_ids: List[int]) -> Dict[int, str]:
+    # Any function's copy signs with the same SESSION_SECRET; the api one is loaded under its own name
+    spec = importlib.util.spec_from_file_location('bench_session', os.path.join(BACKEND_DIR, 'api', 'session.py'))
+    session = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(session)
+    return {user_id: session.issue(user_id)['token'] for user_id in user_ids}
+
+
+class Workload:
+    def __init__(self, seeded: Dict[str, Any]):
+        self.user_ids: List[int] = seeded['user_ids']
+        self.stream_ids: List[int] = seeded['stream_ids']
+        self.user_weights = zipf_weights(len(self.user_ids), seeded['skew'])
+        self.stream_weights = zipf_weights(len(self.stream_ids), seeded['skew'])
+        self.api = load_function('api')
+        self.streaming = load_function('streaming')
+        self.upload = load_function('upload-video')
+        self.tokens = issue_tokens(self.user_ids)
+        self.upload_data = os.urandom(UPLOAD_SIZE)
+        self.upload_chunks = [
+            self.upload_data[i:i + UPLOAD_CHUNK] for i in range(0, UPLOAD_SIZE, UPLOAD_CHUNK)
+        ]
+
+    def hot_user(self, rng: random.Random) -> int:
+        return rng.choices(self.user_ids, cum_weights=self.user_weights)[0]
+
+    def hot_stream(self, rng: random.Random) -> int:
+        return rng.choices(self.stream_ids, cum_weights=self.stream_weights)[0]
+
+    def any_user(self, rng: random.Random) -> int:
+        return rng.choice(self.user_ids)
+
+    def run(self, action: str, rng: random.Random) -> int:
+        # Returns the worst status of the calls an action makes
+        return getattr(self, f'do_{action}')(rng)
+
+    def call(self, handler, method: str, params: Dict[str, str], body: Any = None, user_id: Optional[int] = None,
+             headers: Optional[Dict[str, str]] = None, raw_body: Optional[str] = None) -> Dict[str, Any]:
+        auth = {'Authorization': f'Bearer {self.tokens[user_id]}'} if user_id else {}
+        return handler({
+            'httpMethod': method,
+            'queryStringParameters': params,
+            'headers': {**auth, **(headers or {})},
+            'body': raw_body if raw_body is not None else (json.dumps(body) if body is not None else ''),
+        }, None)
+
+    def do_feed(self, rng: random.Random) -> int:
+        return self.call(self.api, 'GET', {'action': 'feed', 'user_id': str(self.any_user(rng))})['statusCode']
+
+    def do_streams(self, rng: random.Random) -> int:
+        return self.call(self.api, 'GET', {'action': 'streams', 'limit': '20'})['statusCode']
+
+    def do_trending(self, rng: random.Random) -> int:
+        return self.call(self.api, 'GET', {'action': 'trending'})['statusCode']
+
+    def do_search(self, rng: random.Random) -> int:
+        return self.call(self.api, 'GET', {'action': 'search', 'q': rng.choice(SEARCH_TERMS)})['statusCode']
+
+    def do_channel_stats(self, rng: random.Random) -> int:
+        return self.call(self.api, 'GET', {'action': 'channel_stats', 'user_id': str(self.hot_user(rng))})['statusCode']
+
+    def do_like(self, rng: random.Random) -> int:
+        return self.call(self.api, 'POST', {'action': 'like'}, {'stream_id': self.hot_stream(rng)},
+                         user_id=self.any_user(rng))['statusCode']
+
+    def do_subscribe(self, rng: random.Random) -> int:
+        subscriber, channel = self.any_user(rng), self.hot_user(rng)
+        if subscriber == channel:
+            return 200
+        return self.call(self.api, 'POST', {'action': 'subscribe'}, {'channel_id': channel},
+                         user_id=subscriber)['statusCode']
+
+    def do_admin_users(self, rng: random.Random) -> int:
+        after_id = rng.choice(self.user_ids)
+        return self.call(self.api, 'GET', {'action': 'get_users', 'after_id': str(after_id), 'limit': '500'})['statusCode']
+
+    def do_live(self, rng: random.Random) -> int:
+        return self.call(self.streaming, 'GET', {'action': 'live'})['statusCode']
+
+    def do_viewer_heartbeat(self, rng: random.Random) -> int:
+        return self.call(self.streaming, 'POST', {'action': 'viewer_heartbeat', 'stream_id': str(self.hot_stream(rng))},
+                         {'session_id': f'load-{rng.randrange(100000)}'})['statusCode']
+
+    def do_upload(self, rng: random.Random) -> int:
+        user_id = self.any_user(rng)
+        init = self.call(self.upload, 'POST', {'action': 'init'}, {
+            'filename': 'load.mp4', 'total_size': UPLOAD_SIZE, 'chunk_size': UPLOAD_CHUNK, 'title': 'Load upload',
+        }, user_id)
+        if init['statusCode'] != 200:
+            return init['statusCode']
+        upload_id = json.loads(init['body'])['upload_id']
+        for i, chunk in enumerate(self.upload_chunks):
+            put = self.call(self.upload, 'PUT', {'action': 'chunk', 'upload_id': upload_id, 'index': str(i)},
+                            user_id=user_id, headers={'X-Chunk-Sha256': hashlib.sha256(chunk).hexdigest()},
+                            raw_body=base64.b64encode(chunk).decode())
+            if put['statusCode'] != 200:
+                return put['statusCode']
+        return self.call(self.upload, 'POST', {'action': 'complete', 'upload_id': upload_id},
+                         user_id=user_id)['statusCode']
+
+
+def percentile(values: List[float], p: float) -> float:
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def replay(workload: Workload, mix: Dict[str, int], concurrency: int, requests: int,
+           seed_value: int) -> Tuple[Dict[str, List[Tuple[float, int]]], float]:
+    actions = list(mix)
+    weights = [mix[a] for a in actions]
+    samples: Dict[str, List[Tuple[float, int]]] = {a: [] for a in actions}
+    lock = threading.Lock()
+    remaining = [requests]
+
+    def worker(n: int) -> None:
+        rng = random.Random(seed_value * 1000 + n)
+        local: List[Tuple[str, float, int]] = []
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+            action = rng.choices(actions, weights)[0]
+            started = time.perf_counter()
+            try:
+                status = workload.run(action, rng)
+            except Exception:
+                status = 599
+            local.append((action, time.perf_counter() - started, status))
+        with lock:
+            for action, elapsed, status in local:
+                samples[action].append((elapsed, status))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    return samples, time.perf_counter() - started
+
+
+def summarize(samples: Dict[str, List[Tuple[float, int]]], elapsed: float) -> Dict[str, Any]:
+    actions = {}
+    for action, results in sorted(samples.items()):
+        if not results:
+            continue
+        latencies = sorted(elapsed_s * 1000 for elapsed_s, _ in results)
+        actions[action] = {
+            'count': len(results),
+            'errors': sum(status >= 400 for _, status in results),
+            'rps': round(len(results) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 0.5), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'max_ms': round(latencies[-1], 2),
+        }
+    total = sum(a['count'] for a in actions.values())
+    return {
+        'total': {'count': total, 'errors': sum(a['errors'] for a in actions.values()),
+                  'rps': round(total / elapsed, 1), 'seconds': round(elapsed, 2)},
+        'actions': actions,
+    }
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    regressions = []
+    for action, base in baseline['actions'].items():
+        current = result['actions'].get(action)
+        if current is None:
+            continue
+        if current['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(f'{action}: p95 {base["p95_ms"]} -> {current["p95_ms"]} ms')
+        if current['rps'] < base['rps'] * (1 - tolerance):
+            regressions.append(f'{action}: {base["rps"]} -> {current["rps"]} req/s')
+        if current['errors'] > base['errors']:
+            regressions.append(f'{action}: errors {base["errors"]} -> {current["errors"]}')
+    return regressions
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def print_table(result: Dict[str, Any]) -> None:
+    print(f'{"action":<18}{"count":>8}{"errors":>8}{"req/s":>10}{"p50":>10}{"p95":>10}{"p99":>10}{"max":>10}')
+    for action, row in result['actions'].items():
+        print(f'{action:<18}{row["count"]:>8}{row["errors"]:>8}{row["rps"]:>10}'
+              f'{row["p50_ms"]:>10}{row["p95_ms"]:>10}{row["p99_ms"]:>10}{row["max_ms"]:>10}')
+    total = result['total']
+    print(f'{"total":<18}{total["count"]:>8}{total["errors"]:>8}{total["rps"]:>10}   in {total["seconds"]}s')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--mix', choices=sorted(MIXES), default='mixed')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--warmup', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--streams', type=int, default=20000)
+    parser.add_argument('--likes', type=int, default=200000)
+    parser.add_argument('--subscriptions', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--zipf', type=float, default=1.1)
+    parser.add_argument('--save', action='store_true')
+    parser.add_argument('--compare', metavar='BASELINE')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--keep', action='store_true', help='leave the seeded rows in place')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(args.concurrency))
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    seeded = seed(conn, args.users, args.streams, args.likes, args.subscriptions, args.seed, args.zipf)
+    try:
+        workload = Workload(seeded)
+        mix = MIXES[args.mix]
+        # Warmup fills pools and caches and is not reported
+        replay(workload, mix, args.concurrency, args.warmup, args.seed + 1)
+        samples, elapsed = replay(workload, mix, args.concurrency, args.requests, args.seed)
+    finally:
+        if not args.keep:
+            cleanup(conn, seeded['tag'])
+        conn.close()
+
+    result = {
+        'mix': args.mix,
+        'concurrency': args.concurrency,
+        'config': {key: getattr(args, key) for key in ('requests', 'users', 'streams', 'likes', 'subscriptions', 'seed', 'zipf')},
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        **summarize(samples, elapsed),
+    }
+    print_table(result)
+
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f'{args.mix}-c{args.concurrency}.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        print(f'baseline saved to {path}')
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,9 @@
+-- Индексы под keyset-пагинацию ленты: ORDER BY created_at DESC, id DESC
+CREATE INDEX IF NOT EXISTS idx_streams_created_id
+    ON t_p79487843_youtube_analog_devel.streams (created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_streams_category_created_id
+    ON t_p79487843_youtube_analog_devel.streams (category, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_streams_is_live_created_id
+    ON t_p79487843_youtube_analog_devel.streams (is_live, created_at DESC, id DESC);
@@ -0,0 +1,54 @@
+-- Полнотекстовый поиск по стримам и каналам + триграммы для автодополнения
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE t_p79487843_youtube_analog_devel.streams
+ADD COLUMN IF NOT EXISTS search_tsv tsvector;
+
+ALTER TABLE t_p79487843_youtube_analog_devel.users
+ADD COLUMN IF NOT EXISTS search_tsv tsvector;
+
+CREATE OR REPLACE FUNCTION t_p79487843_youtube_analog_devel.streams_search_tsv_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_tsv :=
+        setweight(to_tsvector('russian', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(NEW.description, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION t_p79487843_youtube_analog_devel.users_search_tsv_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_tsv :=
+        setweight(to_tsvector('simple', coalesce(NEW.username, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(NEW.display_name, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(NEW.bio, '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_streams_search_tsv ON t_p79487843_youtube_analog_devel.streams;
+CREATE TRIGGER trg_streams_search_tsv
+    BEFORE INSERT OR UPDATE OF title, description ON t_p79487843_youtube_analog_devel.streams
+    FOR EACH ROW EXECUTE FUNCTION t_p79487843_youtube_analog_devel.streams_search_tsv_update();
+
+DROP TRIGGER IF EXISTS trg_users_search_tsv ON t_p79487843_youtube_analog_devel.users;
+CREATE TRIGGER trg_users_search_tsv
+    BEFORE INSERT OR UPDATE OF username, display_name, bio ON t_p79487843_youtube_analog_devel.users
+    FOR EACH ROW EXECUTE FUNCTION t_p79487843_youtube_analog_devel.users_search_tsv_update();
+
+-- Заполняем уже существующие строки (триггер срабатывает на UPDATE OF title / username)
+UPDATE t_p79487843_youtube_analog_devel.streams SET title = title WHERE search_tsv IS NULL;
+UPDATE t_p79487843_youtube_analog_devel.users SET username = username WHERE search_tsv IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_streams_search_tsv
+    ON t_p79487843_youtube_analog_devel.streams USING GIN (search_tsv);
+CREATE INDEX IF NOT EXISTS idx_users_search_tsv
+    ON t_p79487843_youtube_analog_devel.users USING GIN (search_tsv);
+
+-- Префиксное автодополнение: ILIKE 'prefix%' обслуживается триграммным GIN-индексом
+CREATE INDEX IF NOT EXISTS idx_streams_title_trgm
+    ON t_p79487843_youtube_analog_devel.streams USING GIN (lower(title) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_users_username_trgm
+    ON t_p79487843_youtube_analog_devel.users USING GIN (lower(username) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_users_display_name_trgm
+    ON t_p79487843_youtube_analog_devel.users USING GIN (lower(display_name) gin_trgm_ops);
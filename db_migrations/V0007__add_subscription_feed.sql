@@ -0,0 +1,71 @@
+-- Лента подписок: гибридный fan-out.
+-- Каналы с числом подписчиков ниже порога раскладываются в feed_items при записи (триггеры ниже),
+-- крупные каналы подмешиваются при чтении прямо из streams.
+CREATE TABLE IF NOT EXISTS t_p79487843_youtube_analog_devel.feed_items (
+    user_id INTEGER NOT NULL REFERENCES t_p79487843_youtube_analog_devel.users(id) ON DELETE CASCADE,
+    stream_id INTEGER NOT NULL REFERENCES t_p79487843_youtube_analog_devel.streams(id) ON DELETE CASCADE,
+    created_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (user_id, created_at, stream_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_feed_items_stream
+    ON t_p79487843_youtube_analog_devel.feed_items (stream_id);
+
+-- Чтение ленты крупных каналов: последние стримы канала по индексу
+CREATE INDEX IF NOT EXISTS idx_streams_user_created_id
+    ON t_p79487843_youtube_analog_devel.streams (user_id, created_at DESC, id DESC);
+
+CREATE OR REPLACE FUNCTION t_p79487843_youtube_analog_devel.feed_fanout_threshold() RETURNS integer AS $$
+    SELECT 10000
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Новый стрим/видео небольшого канала сразу попадает в ленты всех подписчиков
+CREATE OR REPLACE FUNCTION t_p79487843_youtube_analog_devel.feed_fanout_stream() RETURNS trigger AS $$
+BEGIN
+    IF (SELECT subscriber_count FROM t_p79487843_youtube_analog_devel.users WHERE id = NEW.user_id)
+            < t_p79487843_youtube_analog_devel.feed_fanout_threshold() THEN
+        INSERT INTO t_p79487843_youtube_analog_devel.feed_items (user_id, stream_id, created_at)
+        SELECT sub.subscriber_id, NEW.id, coalesce(NEW.created_at, CURRENT_TIMESTAMP)
+        FROM t_p79487843_youtube_analog_devel.subscriptions sub
+        WHERE sub.channel_id = NEW.user_id
+        ON CONFLICT DO NOTHING;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+-- Новая подписка на небольшой канал подтягивает его последние ролики в ленту
+CREATE OR REPLACE FUNCTION t_p79487843_youtube_analog_devel.feed_backfill_subscription() RETURNS trigger AS $$
+BEGIN
+    IF (SELECT subscriber_count FROM t_p79487843_youtube_analog_devel.users WHERE id = NEW.channel_id)
+            < t_p79487843_youtube_analog_devel.feed_fanout_threshold() THEN
+        INSERT INTO t_p79487843_youtube_analog_devel.feed_items (user_id, stream_id, created_at)
+        SELECT NEW.subscriber_id, s.id, coalesce(s.created_at, CURRENT_TIMESTAMP)
+        FROM t_p79487843_youtube_analog_devel.streams s
+        WHERE s.user_id = NEW.channel_id
+        ORDER BY s.created_at DESC, s.id DESC
+        LIMIT 50
+        ON CONFLICT DO NOTHING;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_streams_feed_fanout ON t_p79487843_youtube_analog_devel.streams;
+CREATE TRIGGER trg_streams_feed_fanout
+    AFTER INSERT ON t_p79487843_youtube_analog_devel.streams
+    FOR EACH ROW EXECUTE FUNCTION t_p79487843_youtube_analog_devel.feed_fanout_stream();
+
+DROP TRIGGER IF EXISTS trg_subscriptions_feed_backfill ON t_p79487843_youtube_analog_devel.subscriptions;
+CREATE TRIGGER trg_subscriptions_feed_backfill
+    AFTER INSERT ON t_p79487843_youtube_analog_devel.subscriptions
+    FOR EACH ROW EXECUTE FUNCTION t_p79487843_youtube_analog_devel.feed_backfill_subscription();
+
+-- Заполняем ленты по уже существующим подпискам
+INSERT INTO t_p79487843_youtube_analog_devel.feed_items (user_id, stream_id, created_at)
+SELECT sub.subscriber_id, s.id, coalesce(s.created_at, CURRENT_TIMESTAMP)
+FROM t_p79487843_youtube_analog_devel.subscriptions sub
+JOIN t_p79487843_youtube_analog_devel.users c ON c.id = sub.channel_id
+JOIN t_p79487843_youtube_analog_devel.streams s ON s.user_id = sub.channel_id
+WHERE c.subscriber_count < t_p79487843_youtube_analog_devel.feed_fanout_threshold()
+ON CONFLICT DO NOTHING;
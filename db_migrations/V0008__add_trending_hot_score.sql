@@ -0,0 +1,36 @@
+-- Трендовый рейтинг: hot_score хранится в индексируемой колонке.
+-- Свежесть учитывается сдвигом по времени публикации (а не затуханием старых очков),
+-- поэтому пересчитывать нужно только строки, у которых поменялись счётчики или статус эфира.
+CREATE OR REPLACE FUNCTION t_p79487843_youtube_analog_devel.hot_score(
+    view_count integer, like_count integer, created_at timestamp, is_live boolean
+) RETURNS double precision AS $$
+    SELECT log(greatest(coalesce(view_count, 0) / 10.0 + coalesce(like_count, 0), 1))
+         + extract(epoch from coalesce(created_at, timestamp '2024-01-01')) / 45000.0
+         + CASE WHEN is_live THEN 2 ELSE 0 END
+$$ LANGUAGE sql IMMUTABLE;
+
+ALTER TABLE t_p79487843_youtube_analog_devel.streams
+ADD COLUMN IF NOT EXISTS hot_score double precision;
+
+CREATE OR REPLACE FUNCTION t_p79487843_youtube_analog_devel.streams_hot_score_update() RETURNS trigger AS $$
+BEGIN
+    NEW.hot_score := t_p79487843_youtube_analog_devel.hot_score(
+        NEW.view_count, NEW.like_count, NEW.created_at, NEW.is_live
+    );
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_streams_hot_score ON t_p79487843_youtube_analog_devel.streams;
+CREATE TRIGGER trg_streams_hot_score
+    BEFORE INSERT OR UPDATE OF view_count, like_count, is_live, created_at ON t_p79487843_youtube_analog_devel.streams
+    FOR EACH ROW EXECUTE FUNCTION t_p79487843_youtube_analog_devel.streams_hot_score_update();
+
+UPDATE t_p79487843_youtube_analog_devel.streams
+SET hot_score = t_p79487843_youtube_analog_devel.hot_score(view_count, like_count, created_at, is_live)
+WHERE hot_score IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_streams_hot_score
+    ON t_p79487843_youtube_analog_devel.streams (hot_score DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_streams_category_hot_score
+    ON t_p79487843_youtube_analog_devel.streams (category, hot_score DESC, id DESC);
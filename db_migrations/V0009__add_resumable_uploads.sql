@@ -0,0 +1,28 @@
+-- Сессии возобновляемой загрузки видео по частям
+CREATE TABLE IF NOT EXISTS t_p79487843_youtube_analog_devel.uploads (
+    id UUID PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES t_p79487843_youtube_analog_devel.users(id),
+    title VARCHAR(255) NOT NULL,
+    description TEXT,
+    filename TEXT NOT NULL,
+    total_size BIGINT NOT NULL,
+    chunk_size INTEGER NOT NULL,
+    chunk_count INTEGER NOT NULL,
+    sha256 TEXT,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    stream_id INTEGER REFERENCES t_p79487843_youtube_analog_devel.streams(id) ON DELETE SET NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    completed_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS t_p79487843_youtube_analog_devel.upload_chunks (
+    upload_id UUID NOT NULL REFERENCES t_p79487843_youtube_analog_devel.uploads(id) ON DELETE CASCADE,
+    chunk_index INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (upload_id, chunk_index)
+);
+
+CREATE INDEX IF NOT EXISTS idx_uploads_user_status
+    ON t_p79487843_youtube_analog_devel.uploads (user_id, status);
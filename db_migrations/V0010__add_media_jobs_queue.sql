@@ -0,0 +1,30 @@
+-- Очередь фоновых задач обработки видео (длительность, HLS, превью).
+-- Воркеры забирают задачи через SELECT ... FOR UPDATE SKIP LOCKED и держат аренду locked_until;
+-- задача упавшего воркера возвращается в работу, когда аренда истекает.
+CREATE TABLE IF NOT EXISTS t_p79487843_youtube_analog_devel.media_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    stream_id INTEGER NOT NULL REFERENCES t_p79487843_youtube_analog_devel.streams(id) ON DELETE CASCADE,
+    kind VARCHAR(20) NOT NULL DEFAULT 'transcode',
+    source TEXT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    progress REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    locked_by TEXT,
+    locked_until TIMESTAMP,
+    run_after TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    error TEXT,
+    result JSONB,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_media_jobs_runnable
+    ON t_p79487843_youtube_analog_devel.media_jobs (id)
+    WHERE status IN ('queued', 'running');
+
+CREATE INDEX IF NOT EXISTS idx_media_jobs_stream
+    ON t_p79487843_youtube_analog_devel.media_jobs (stream_id);
+
+ALTER TABLE t_p79487843_youtube_analog_devel.streams
+ADD COLUMN IF NOT EXISTS hls_url TEXT;
@@ -0,0 +1,61 @@
+-- Реестр прямых эфиров: heartbeat стримера по stream_key, авто-истечение по TTL,
+-- счётчик зрителей и события смены статуса эфира
+ALTER TABLE t_p79487843_youtube_analog_devel.streams
+ADD COLUMN IF NOT EXISTS last_heartbeat_at TIMESTAMP;
+
+UPDATE t_p79487843_youtube_analog_devel.streams
+SET last_heartbeat_at = CURRENT_TIMESTAMP
+WHERE is_live AND last_heartbeat_at IS NULL;
+
+-- Частичный индекс: размер пропорционален числу идущих эфиров, а не всей таблице
+CREATE INDEX IF NOT EXISTS idx_streams_live_now
+    ON t_p79487843_youtube_analog_devel.streams (last_heartbeat_at DESC)
+    WHERE is_live;
+
+-- Булев индекс с низкой селективностью больше не нужен: его заменяют idx_streams_live_now
+-- и idx_streams_is_live_created_id
+DROP INDEX IF EXISTS t_p79487843_youtube_analog_devel.idx_streams_is_live;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_streams_stream_key
+    ON t_p79487843_youtube_analog_devel.streams (stream_key)
+    WHERE stream_key IS NOT NULL;
+
+-- Зрители эфира: частые upsert'ы, восстанавливать после сбоя нечего, поэтому UNLOGGED
+CREATE UNLOGGED TABLE IF NOT EXISTS t_p79487843_youtube_analog_devel.live_viewers (
+    stream_id INTEGER NOT NULL,
+    session_id VARCHAR(64) NOT NULL,
+    last_seen TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (stream_id, session_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_live_viewers_last_seen
+    ON t_p79487843_youtube_analog_devel.live_viewers (last_seen);
+
+-- Журнал смен статуса эфира: клиенты читают его по курсору id вместо опроса ленты
+CREATE TABLE IF NOT EXISTS t_p79487843_youtube_analog_devel.live_events (
+    id BIGSERIAL PRIMARY KEY,
+    stream_id INTEGER NOT NULL,
+    is_live BOOLEAN NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION t_p79487843_youtube_analog_devel.streams_live_event() RETURNS trigger AS $$
+DECLARE
+    event_id BIGINT;
+BEGIN
+    INSERT INTO t_p79487843_youtube_analog_devel.live_events (stream_id, is_live)
+    VALUES (NEW.id, NEW.is_live)
+    RETURNING id INTO event_id;
+    PERFORM pg_notify('stream_status', json_build_object(
+        'id', event_id, 'stream_id', NEW.id, 'is_live', NEW.is_live
+    )::text);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_streams_live_event ON t_p79487843_youtube_analog_devel.streams;
+CREATE TRIGGER trg_streams_live_event
+    AFTER UPDATE OF is_live ON t_p79487843_youtube_analog_devel.streams
+    FOR EACH ROW
+    WHEN (OLD.is_live IS DISTINCT FROM NEW.is_live)
+    EXECUTE FUNCTION t_p79487843_youtube_analog_devel.streams_live_event();
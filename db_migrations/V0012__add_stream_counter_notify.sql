@@ -0,0 +1,17 @@
+-- Изменения счётчиков стрима уходят в общий канал NOTIFY, из которого realtime-сервер
+-- раздаёт диффы подписанным клиентам вместо того, чтобы каждый клиент опрашивал ленту
+CREATE OR REPLACE FUNCTION t_p79487843_youtube_analog_devel.streams_counter_notify() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('stream_counters', json_build_object(
+        'stream_id', NEW.id, 'like_count', NEW.like_count, 'view_count', NEW.view_count
+    )::text);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_streams_counter_notify ON t_p79487843_youtube_analog_devel.streams;
+CREATE TRIGGER trg_streams_counter_notify
+    AFTER UPDATE OF like_count, view_count ON t_p79487843_youtube_analog_devel.streams
+    FOR EACH ROW
+    WHEN (OLD.like_count IS DISTINCT FROM NEW.like_count OR OLD.view_count IS DISTINCT FROM NEW.view_count)
+    EXECUTE FUNCTION t_p79487843_youtube_analog_devel.streams_counter_notify();
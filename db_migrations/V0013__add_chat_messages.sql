@@ -0,0 +1,28 @@
+-- Чат прямых эфиров: durable-хранилище, партиционированное по месяцам.
+-- Свежая история живёт в кольцевом буфере realtime-сервера, сюда сообщения пишутся пачками.
+CREATE TABLE IF NOT EXISTS t_p79487843_youtube_analog_devel.chat_messages (
+    id BIGINT NOT NULL,
+    stream_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    body VARCHAR(500) NOT NULL,
+    created_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (stream_id, created_at, id)
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE IF NOT EXISTS t_p79487843_youtube_analog_devel.chat_messages_default
+    PARTITION OF t_p79487843_youtube_analog_devel.chat_messages DEFAULT;
+
+-- Партиции на текущий и следующие месяцы; новые создаёт chat.ensure_partitions() на старте сервера
+DO $$
+DECLARE
+    month_start DATE;
+BEGIN
+    FOR i IN 0..2 LOOP
+        month_start := (date_trunc('month', CURRENT_DATE) + make_interval(months => i))::date;
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS t_p79487843_youtube_analog_devel.chat_messages_%s PARTITION OF t_p79487843_youtube_analog_devel.chat_messages FOR VALUES FROM (%L) TO (%L)',
+            to_char(month_start, 'YYYYMM'), month_start, (month_start + INTERVAL '1 month')::date
+        );
+    END LOOP;
+END
+$$;
@@ -0,0 +1,23 @@
+-- События просмотра: сырые события пишутся COPY-пачками в UNLOGGED-стейджинг
+-- (потеря хвоста при сбое допустима), rollup переносит их в view_count и почасовую аналитику
+CREATE UNLOGGED TABLE IF NOT EXISTS t_p79487843_youtube_analog_devel.view_events_staging (
+    id BIGSERIAL PRIMARY KEY,
+    stream_id INTEGER NOT NULL,
+    is_view BOOLEAN NOT NULL,
+    watch_seconds REAL NOT NULL DEFAULT 0,
+    position REAL NOT NULL DEFAULT 0,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Почасовые агрегаты по стриму: одна строка на (stream_id, час), обновляется upsert'ом из rollup
+CREATE TABLE IF NOT EXISTS t_p79487843_youtube_analog_devel.stream_views_hourly (
+    stream_id INTEGER NOT NULL,
+    hour TIMESTAMP NOT NULL,
+    views INTEGER NOT NULL DEFAULT 0,
+    heartbeats INTEGER NOT NULL DEFAULT 0,
+    watch_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (stream_id, hour)
+);
+
+CREATE INDEX IF NOT EXISTS idx_stream_views_hourly_hour
+    ON t_p79487843_youtube_analog_devel.stream_views_hourly (hour);
@@ -0,0 +1,99 @@
+-- Аналитика канала: почасовые агрегаты, которые поддерживаются инкрементально триггерами.
+-- Запрос за период читает по строке на час из PK-индекса, а не сканирует likes/subscriptions
+CREATE TABLE IF NOT EXISTS t_p79487843_youtube_analog_devel.channel_stats_hourly (
+    channel_id INTEGER NOT NULL,
+    hour TIMESTAMP NOT NULL,
+    views INTEGER NOT NULL DEFAULT 0,
+    likes INTEGER NOT NULL DEFAULT 0,
+    new_subscribers INTEGER NOT NULL DEFAULT 0,
+    watch_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (channel_id, hour)
+);
+
+-- Лайки и подписки: statement-триггер с transition table, одна агрегированная запись на пачку
+CREATE OR REPLACE FUNCTION t_p79487843_youtube_analog_devel.channel_stats_likes() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO t_p79487843_youtube_analog_devel.channel_stats_hourly AS c (channel_id, hour, likes)
+    SELECT s.user_id, date_trunc('hour', coalesce(n.created_at, CURRENT_TIMESTAMP)), count(*)
+    FROM new_likes n
+    JOIN t_p79487843_youtube_analog_devel.streams s ON s.id = n.stream_id
+    WHERE s.user_id IS NOT NULL
+    GROUP BY 1, 2
+    ON CONFLICT (channel_id, hour) DO UPDATE SET likes = c.likes + EXCLUDED.likes;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_likes_channel_stats ON t_p79487843_youtube_analog_devel.likes;
+CREATE TRIGGER trg_likes_channel_stats
+    AFTER INSERT ON t_p79487843_youtube_analog_devel.likes
+    REFERENCING NEW TABLE AS new_likes
+    FOR EACH STATEMENT EXECUTE FUNCTION t_p79487843_youtube_analog_devel.channel_stats_likes();
+
+CREATE OR REPLACE FUNCTION t_p79487843_youtube_analog_devel.channel_stats_subscriptions() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO t_p79487843_youtube_analog_devel.channel_stats_hourly AS c (channel_id, hour, new_subscribers)
+    SELECT n.channel_id, date_trunc('hour', coalesce(n.created_at, CURRENT_TIMESTAMP)), count(*)
+    FROM new_subscriptions n
+    WHERE n.channel_id IS NOT NULL
+    GROUP BY 1, 2
+    ON CONFLICT (channel_id, hour) DO UPDATE SET new_subscribers = c.new_subscribers + EXCLUDED.new_subscribers;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_subscriptions_channel_stats ON t_p79487843_youtube_analog_devel.subscriptions;
+CREATE TRIGGER trg_subscriptions_channel_stats
+    AFTER INSERT ON t_p79487843_youtube_analog_devel.subscriptions
+    REFERENCING NEW TABLE AS new_subscriptions
+    FOR EACH STATEMENT EXECUTE FUNCTION t_p79487843_youtube_analog_devel.channel_stats_subscriptions();
+
+-- Просмотры и время просмотра приходят из rollup событий: переносим прирост почасовой строки стрима на канал
+CREATE OR REPLACE FUNCTION t_p79487843_youtube_analog_devel.channel_stats_views() RETURNS trigger AS $$
+DECLARE
+    delta_views INTEGER := NEW.views;
+    delta_watch DOUBLE PRECISION := NEW.watch_seconds;
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        delta_views := NEW.views - OLD.views;
+        delta_watch := NEW.watch_seconds - OLD.watch_seconds;
+    END IF;
+    INSERT INTO t_p79487843_youtube_analog_devel.channel_stats_hourly AS c (channel_id, hour, views, watch_seconds)
+    SELECT s.user_id, NEW.hour, delta_views, delta_watch
+    FROM t_p79487843_youtube_analog_devel.streams s
+    WHERE s.id = NEW.stream_id AND s.user_id IS NOT NULL
+    ON CONFLICT (channel_id, hour) DO UPDATE SET
+        views = c.views + EXCLUDED.views,
+        watch_seconds = c.watch_seconds + EXCLUDED.watch_seconds;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_stream_views_hourly_channel_stats ON t_p79487843_youtube_analog_devel.stream_views_hourly;
+CREATE TRIGGER trg_stream_views_hourly_channel_stats
+    AFTER INSERT OR UPDATE ON t_p79487843_youtube_analog_devel.stream_views_hourly
+    FOR EACH ROW EXECUTE FUNCTION t_p79487843_youtube_analog_devel.channel_stats_views();
+
+-- Разовое заполнение по накопленной истории
+INSERT INTO t_p79487843_youtube_analog_devel.channel_stats_hourly AS c (channel_id, hour, likes)
+SELECT s.user_id, date_trunc('hour', l.created_at), count(*)
+FROM t_p79487843_youtube_analog_devel.likes l
+JOIN t_p79487843_youtube_analog_devel.streams s ON s.id = l.stream_id
+WHERE s.user_id IS NOT NULL AND l.created_at IS NOT NULL
+GROUP BY 1, 2
+ON CONFLICT (channel_id, hour) DO UPDATE SET likes = EXCLUDED.likes;
+
+INSERT INTO t_p79487843_youtube_analog_devel.channel_stats_hourly AS c (channel_id, hour, new_subscribers)
+SELECT sub.channel_id, date_trunc('hour', sub.created_at), count(*)
+FROM t_p79487843_youtube_analog_devel.subscriptions sub
+WHERE sub.channel_id IS NOT NULL AND sub.created_at IS NOT NULL
+GROUP BY 1, 2
+ON CONFLICT (channel_id, hour) DO UPDATE SET new_subscribers = EXCLUDED.new_subscribers;
+
+INSERT INTO t_p79487843_youtube_analog_devel.channel_stats_hourly AS c (channel_id, hour, views, watch_seconds)
+SELECT s.user_id, v.hour, sum(v.views), sum(v.watch_seconds)
+FROM t_p79487843_youtube_analog_devel.stream_views_hourly v
+JOIN t_p79487843_youtube_analog_devel.streams s ON s.id = v.stream_id
+WHERE s.user_id IS NOT NULL
+GROUP BY 1, 2
+ON CONFLICT (channel_id, hour) DO UPDATE SET views = EXCLUDED.views, watch_seconds = EXCLUDED.watch_seconds;
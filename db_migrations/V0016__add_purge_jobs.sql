@@ -0,0 +1,30 @@
+-- Фоновое каскадное удаление: пользователь со всеми данными, все пользователи, все видео.
+-- Удаление идёт пачками с коммитом после каждой, шаг и число удалённых строк сохраняются в задаче,
+-- поэтому упавший воркер продолжает с того же шага. Аренда locked_until - как у media_jobs.
+CREATE TABLE IF NOT EXISTS t_p79487843_youtube_analog_devel.purge_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    kind VARCHAR(20) NOT NULL,
+    -- user: id пользователя; users/videos: максимальный id на момент постановки, новее не трогаем
+    target_id INTEGER NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    step INTEGER NOT NULL DEFAULT 0,
+    deleted JSONB NOT NULL DEFAULT '{}'::jsonb,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    locked_by TEXT,
+    locked_until TIMESTAMP,
+    run_after TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_purge_jobs_runnable
+    ON t_p79487843_youtube_analog_devel.purge_jobs (id)
+    WHERE status IN ('queued', 'running');
+
+-- Повторный запрос на удаление того же пользователя возвращает уже идущую задачу
+CREATE UNIQUE INDEX IF NOT EXISTS idx_purge_jobs_active_target
+    ON t_p79487843_youtube_analog_devel.purge_jobs (kind, target_id)
+    WHERE status IN ('queued', 'running');
@@ -0,0 +1,12 @@
+-- Отозванные токены сессии (выход). Токены проверяются по подписи без БД, а эту таблицу
+-- каждый инстанс функций раз в несколько секунд досчитывает по id в кэш в памяти.
+CREATE TABLE IF NOT EXISTS t_p79487843_youtube_analog_devel.revoked_tokens (
+    id BIGSERIAL PRIMARY KEY,
+    jti VARCHAR(32) NOT NULL UNIQUE,
+    user_id INTEGER NOT NULL,
+    expires_at TIMESTAMP NOT NULL,
+    revoked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Пароль хранится как scrypt$N$r$p$соль$хеш; старые открытые пароли перехешируются при входе
+ALTER TABLE t_p79487843_youtube_analog_devel.users ADD COLUMN IF NOT EXISTS password TEXT;
@@ -0,0 +1,10 @@
+-- Общие для всех инстансов функций вёдра token bucket (RATE_LIMIT_STORE=postgres).
+-- UNLOGGED: счётчики лимитов не стоят записи в WAL, после сбоя вёдра просто начинаются полными.
+CREATE UNLOGGED TABLE IF NOT EXISTS t_p79487843_youtube_analog_devel.rate_limit_buckets (
+    key TEXT PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_rate_limit_buckets_updated
+    ON t_p79487843_youtube_analog_devel.rate_limit_buckets (updated_at);
@@ -0,0 +1,114 @@
+-- Лайки делятся на две таблицы:
+--   like_keys - «кто что лайкнул», уникальность (stream_id, user_id), HASH по stream_id;
+--   likes     - журнал лайков по времени: RANGE по месяцу created_at, внутри месяца HASH по stream_id.
+-- Уникальный индекс секционированной таблицы обязан содержать ключ секционирования, поэтому
+-- «один лайк на пару» держит like_keys, а журнал можно резать по месяцам и выгружать старые в архив
+-- (likes_archive.py) без VACUUM и раздувания индексов одной огромной таблицы.
+
+CREATE TABLE IF NOT EXISTS t_p79487843_youtube_analog_devel.like_keys (
+    stream_id INTEGER NOT NULL REFERENCES t_p79487843_youtube_analog_devel.streams(id),
+    user_id INTEGER NOT NULL REFERENCES t_p79487843_youtube_analog_devel.users(id),
+    PRIMARY KEY (stream_id, user_id)
+) PARTITION BY HASH (stream_id);
+
+DO $$
+BEGIN
+    FOR i IN 0..15 LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS t_p79487843_youtube_analog_devel.%I '
+            'PARTITION OF t_p79487843_youtube_analog_devel.like_keys FOR VALUES WITH (MODULUS 16, REMAINDER %s)',
+            'like_keys_h' || i, i
+        );
+    END LOOP;
+END
+$$;
+
+-- Удаление пользователя (purge) ищет его лайки по user_id, не заходя в кучу
+CREATE INDEX IF NOT EXISTS idx_like_keys_user
+    ON t_p79487843_youtube_analog_devel.like_keys (user_id, stream_id);
+
+ALTER TABLE t_p79487843_youtube_analog_devel.likes RENAME TO likes_unpartitioned;
+
+CREATE TABLE t_p79487843_youtube_analog_devel.likes (
+    stream_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+) PARTITION BY RANGE (created_at);
+
+-- Строки вне созданных месяцев (например, из будущего) не теряются, а попадают сюда
+CREATE TABLE t_p79487843_youtube_analog_devel.likes_default
+    PARTITION OF t_p79487843_youtube_analog_devel.likes DEFAULT;
+
+-- Покрывающие индексы: лайки стрима за период - по (stream_id, created_at) с отсечением секций
+-- по хешу stream_id и по месяцу; удаление лайков пользователя - по (user_id, stream_id)
+CREATE INDEX IF NOT EXISTS idx_likes_stream_created
+    ON t_p79487843_youtube_analog_devel.likes (stream_id, created_at) INCLUDE (user_id);
+CREATE INDEX IF NOT EXISTS idx_likes_user_stream
+    ON t_p79487843_youtube_analog_devel.likes (user_id, stream_id);
+
+-- Месяц = секция RANGE из hash_partitions секций HASH по stream_id. Вызывается миграцией на весь
+-- диапазон истории и likes_archive.py на месяцы вперёд; существующие месяцы пропускаются
+CREATE OR REPLACE FUNCTION t_p79487843_youtube_analog_devel.ensure_likes_partitions(
+    from_month DATE, to_month DATE, hash_partitions INTEGER DEFAULT 8
+) RETURNS INTEGER AS $$
+DECLARE
+    month DATE := date_trunc('month', from_month);
+    name TEXT;
+    created INTEGER := 0;
+BEGIN
+    WHILE month <= to_month LOOP
+        name := 'likes_' || to_char(month, 'YYYY_MM');
+        IF to_regclass('t_p79487843_youtube_analog_devel.' || name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE t_p79487843_youtube_analog_devel.%I PARTITION OF t_p79487843_youtube_analog_devel.likes '
+                'FOR VALUES FROM (%L) TO (%L) PARTITION BY HASH (stream_id)',
+                name, month, month + INTERVAL '1 month'
+            );
+            FOR i IN 0..hash_partitions - 1 LOOP
+                EXECUTE format(
+                    'CREATE TABLE t_p79487843_youtube_analog_devel.%I PARTITION OF t_p79487843_youtube_analog_devel.%I '
+                    'FOR VALUES WITH (MODULUS %s, REMAINDER %s)',
+                    name || '_h' || i, name, hash_partitions, i
+                );
+            END LOOP;
+            created := created + 1;
+        END IF;
+        month := month + INTERVAL '1 month';
+    END LOOP;
+    RETURN created;
+END
+$$ LANGUAGE plpgsql;
+
+SELECT t_p79487843_youtube_analog_devel.ensure_likes_partitions(
+    coalesce((SELECT min(created_at) FROM t_p79487843_youtube_analog_devel.likes_unpartitioned), CURRENT_DATE)::date,
+    (CURRENT_DATE + INTERVAL '3 months')::date
+);
+
+INSERT INTO t_p79487843_youtube_analog_devel.like_keys (stream_id, user_id)
+SELECT stream_id, user_id FROM t_p79487843_youtube_analog_devel.likes_unpartitioned
+WHERE stream_id IS NOT NULL AND user_id IS NOT NULL
+ON CONFLICT DO NOTHING;
+
+INSERT INTO t_p79487843_youtube_analog_devel.likes (stream_id, user_id, created_at)
+SELECT stream_id, user_id, coalesce(created_at, CURRENT_TIMESTAMP)
+FROM t_p79487843_youtube_analog_devel.likes_unpartitioned
+WHERE stream_id IS NOT NULL AND user_id IS NOT NULL;
+
+-- Триггер аналитики канала (V0015) переезжает на новую таблицу: transition table
+-- секционированной таблицы собирает строки из всех секций
+DROP TABLE t_p79487843_youtube_analog_devel.likes_unpartitioned;
+
+CREATE TRIGGER trg_likes_channel_stats
+    AFTER INSERT ON t_p79487843_youtube_analog_devel.likes
+    REFERENCING NEW TABLE AS new_likes
+    FOR EACH STATEMENT EXECUTE FUNCTION t_p79487843_youtube_analog_devel.channel_stats_likes();
+
+-- Выгруженные в архив месяцы: файл, число строк и контрольная сумма для восстановления
+CREATE TABLE IF NOT EXISTS t_p79487843_youtube_analog_devel.likes_archives (
+    partition_name TEXT PRIMARY KEY,
+    month DATE NOT NULL,
+    path TEXT NOT NULL,
+    row_count BIGINT NOT NULL,
+    sha256 TEXT NOT NULL,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,4 @@
+-- Кэш отзывов досинхронизируется по revoked_at с окном перекрытия, а не по id:
+-- BIGSERIAL выдаётся до коммита, и меньший id может стать видимым позже большего
+CREATE INDEX IF NOT EXISTS idx_revoked_tokens_revoked_at
+    ON t_p79487843_youtube_analog_devel.revoked_tokens (revoked_at);
@@ -0,0 +1,53 @@
+-- ensure_likes_partitions (V0019) падал, если в likes_default уже лежали строки создаваемого месяца:
+-- CREATE TABLE ... PARTITION OF перепроверяет DEFAULT и отказывает. Теперь месяц собирается отдельной
+-- таблицей, строки переносятся в неё из likes_default и только потом она подключается через ATTACH.
+-- Перенос идёт мимо likes, поэтому триггер аналитики канала не считает эти лайки второй раз.
+CREATE OR REPLACE FUNCTION t_p79487843_youtube_analog_devel.ensure_likes_partitions(
+    from_month DATE, to_month DATE, hash_partitions INTEGER DEFAULT 8
+) RETURNS INTEGER AS $$
+DECLARE
+    month DATE := date_trunc('month', from_month);
+    name TEXT;
+    moved BIGINT;
+    created INTEGER := 0;
+BEGIN
+    WHILE month <= to_month LOOP
+        name := 'likes_' || to_char(month, 'YYYY_MM');
+        IF to_regclass('t_p79487843_youtube_analog_devel.' || name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE t_p79487843_youtube_analog_devel.%I '
+                '(LIKE t_p79487843_youtube_analog_devel.likes INCLUDING DEFAULTS) PARTITION BY HASH (stream_id)',
+                name
+            );
+            FOR i IN 0..hash_partitions - 1 LOOP
+                EXECUTE format(
+                    'CREATE TABLE t_p79487843_youtube_analog_devel.%I PARTITION OF t_p79487843_youtube_analog_devel.%I '
+                    'FOR VALUES WITH (MODULUS %s, REMAINDER %s)',
+                    name || '_h' || i, name, hash_partitions, i
+                );
+            END LOOP;
+            EXECUTE format(
+                'WITH moved AS ('
+                '    DELETE FROM t_p79487843_youtube_analog_devel.likes_default'
+                '    WHERE created_at >= %L AND created_at < %L'
+                '    RETURNING stream_id, user_id, created_at'
+                ') INSERT INTO t_p79487843_youtube_analog_devel.%I (stream_id, user_id, created_at) '
+                'SELECT stream_id, user_id, created_at FROM moved',
+                month, month + INTERVAL '1 month', name
+            );
+            GET DIAGNOSTICS moved = ROW_COUNT;
+            IF moved > 0 THEN
+                RAISE NOTICE '%: moved % rows out of likes_default', name, moved;
+            END IF;
+            EXECUTE format(
+                'ALTER TABLE t_p79487843_youtube_analog_devel.likes ATTACH PARTITION t_p79487843_youtube_analog_devel.%I '
+                'FOR VALUES FROM (%L) TO (%L)',
+                name, month, month + INTERVAL '1 month'
+            );
+            created := created + 1;
+        END IF;
+        month := month + INTERVAL '1 month';
+    END LOOP;
+    RETURN created;
+END
+$$ LANGUAGE plpgsql;
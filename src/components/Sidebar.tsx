@@ -64,7 +64,13 @@ export default function Sidebar({ sidebarOpen, setSidebarOpen, users }: SidebarP
     setLoading(false);
   };
 
-  const handleLogout = () => {
+  const handleLogout = async () => {
+    if (currentUser?.token) {
+      await fetch('https://functions.poehali.dev/18a29ac1-33e9-4589-bad5-77fc1d3286a7/?action=logout', {
+        method: 'POST',
+        headers: { 'Authorization': `Bearer ${currentUser.token}` }
+      }).catch(() => {});
+    }
     localStorage.removeItem('user');
     setCurrentUser(null);
     window.location.reload();
@@ -5,6 +5,8 @@ import { Alert, AlertDescription } from '@/components/ui/alert';
 import Icon from '@/components/ui/icon';
 
 const API_URL = 'https://functions.poehali.dev/18a29ac1-33e9-4589-bad5-77fc1d3286a7';
+// Realtime-сервер отдаёт выгрузку потоком NDJSON; без него - постранично из API
+const REALTIME_URL = import.meta.env.VITE_REALTIME_URL as string | undefined;
 
 interface User {
   id: number;
@@ -30,24 +32,67 @@ export default function Admin() {
   const [message, setMessage] = useState('');
   const [messageType, setMessageType] = useState<'success' | 'error'>('success');
 
-  const loadData = async () => {
-    try {
-      const [usersRes, videosRes] = await Promise.all([
-        fetch(`${API_URL}?action=get_users`),
-        fetch(`${API_URL}?action=get_videos`)
-      ]);
+  const authHeaders = (): Record<string, string> => {
+    const userString = localStorage.getItem('user');
+    const token = userString ? JSON.parse(userString).token : null;
+    return token ? { 'Authorization': `Bearer ${token}` } : {};
+  };
 
-      if (usersRes.ok) {
-        const usersData = await usersRes.json();
-        setUsers(usersData.users || []);
+  // Поток NDJSON: строки разбираются по мере прихода; обрыв соединения до конца потока - ошибка, а не короткий список
+  const streamAll = async <T,>(table: string): Promise<T[]> => {
+    const res = await fetch(`${REALTIME_URL}/admin/export?table=${table}`, { headers: authHeaders() });
+    if (!res.ok || !res.body) {
+      throw new Error(`выгрузка ${table}: HTTP ${res.status}`);
+    }
+    const items: T[] = [];
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let tail = '';
+    for (;;) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      tail += decoder.decode(value, { stream: true });
+      const lines = tail.split('\n');
+      tail = lines.pop() ?? '';
+      for (const line of lines) {
+        if (line) items.push(JSON.parse(line));
       }
+    }
+    if (tail.trim()) items.push(JSON.parse(tail));
+    return items;
+  };
 
-      if (videosRes.ok) {
-        const videosData = await videosRes.json();
-        setVideos(videosData.videos || []);
+  // Выгрузка постраничная: следующая страница начинается с X-Next-After-Id, пока сервер его присылает
+  const pageAll = async <T,>(action: string, key: string): Promise<T[]> => {
+    const items: T[] = [];
+    let afterId: string | null = '0';
+    while (afterId) {
+      const res = await fetch(`${API_URL}?action=${action}&after_id=${afterId}`);
+      if (!res.ok) {
+        throw new Error(`${action}: HTTP ${res.status}`);
       }
+      const data = await res.json();
+      items.push(...(data[key] || []));
+      afterId = res.headers.get('X-Next-After-Id');
+    }
+    return items;
+  };
+
+  const loadAll = <T,>(action: string, key: string): Promise<T[]> =>
+    REALTIME_URL ? streamAll<T>(key) : pageAll<T>(action, key);
+
+  const loadData = async () => {
+    try {
+      const [usersList, videosList] = await Promise.all([
+        loadAll<User>('get_users', 'users'),
+        loadAll<Video>('get_videos', 'videos')
+      ]);
+      setUsers(usersList);
+      setVideos(videosList);
     } catch (err) {
       console.error('Ошибка загрузки данных:', err);
+      setMessage(`Не удалось загрузить полный список (${err instanceof Error ? err.message : err}). Обновите страницу`);
+      setMessageType('error');
     }
   };
 
@@ -67,7 +112,7 @@ export default function Admin() {
       const data = await res.json();
 
       if (res.ok) {
-        setMessage('Пользователь удален');
+        setMessage(res.status === 202 ? `Удаление пользователя продолжается в фоне (задача #${data.job_id})` : 'Пользователь удален');
         setMessageType('success');
         loadData();
       } else {
@@ -120,7 +165,9 @@ export default function Admin() {
       const data = await res.json();
 
       if (res.ok) {
-        setMessage(`Удалено пользователей: ${data.deleted_count}`);
+        setMessage(res.status === 202
+          ? `Очистка продолжается в фоне (задача #${data.job_id}), удалено пользователей: ${data.deleted_count}`
+          : `Удалено пользователей: ${data.deleted_count}`);
         setMessageType('success');
         loadData();
       } else {
@@ -146,7 +193,9 @@ export default function Admin() {
       const data = await res.json();
 
       if (res.ok) {
-        setMessage(`Удалено видео: ${data.deleted_count}`);
+        setMessage(res.status === 202
+          ? `Очистка продолжается в фоне (задача #${data.job_id}), удалено видео: ${data.deleted_count}`
+          : `Удалено видео: ${data.deleted_count}`);
         setMessageType('success');
         loadData();
       } else {
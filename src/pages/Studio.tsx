@@ -12,12 +12,28 @@ import { toast } from '@/components/ui/use-toast';
 
 const UPLOAD_API = 'https://functions.poehali.dev/57bb62f3-e128-42b9-b0de-f6c7593eb90c';
 const STREAMING_API = 'https://functions.poehali.dev/af4093ad-3609-4ffe-98f6-0511a52bf036';
+// Файл уходит частями: init -> chunk (base64 + SHA-256 части) -> complete, сбойная часть переотправляется
+const CHUNK_SIZE = 1024 * 1024;
+const CHUNK_RETRIES = 3;
+
+const toHex = (buf: ArrayBuffer) =>
+  Array.from(new Uint8Array(buf), (b) => b.toString(16).padStart(2, '0')).join('');
+
+const toBase64 = (buf: ArrayBuffer) => {
+  const bytes = new Uint8Array(buf);
+  let binary = '';
+  for (let i = 0; i < bytes.length; i += 0x8000) {
+    binary += String.fromCharCode(...bytes.subarray(i, i + 0x8000));
+  }
+  return btoa(binary);
+};
 
 export default function Studio() {
   const navigate = useNavigate();
   const fileInputRef = useRef<HTMLInputElement>(null);
   
   const [uploading, setUploading] = useState(false);
+  const [uploadProgress, setUploadProgress] = useState(0);
   const [videoFile, setVideoFile] = useState<File | null>(null);
   const [videoTitle, setVideoTitle] = useState('');
   const [videoDescription, setVideoDescription] = useState('');
@@ -52,23 +68,50 @@ export default function Studio() {
     }
 
     setUploading(true);
-    
+    setUploadProgress(0);
+    const auth = { 'Authorization': `Bearer ${user.token}` };
+
     try {
-      const response = await fetch(UPLOAD_API, {
+      const initResponse = await fetch(`${UPLOAD_API}?action=init`, {
         method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'X-User-Id': user.id.toString()
-        },
+        headers: { ...auth, 'Content-Type': 'application/json' },
         body: JSON.stringify({
           title: videoTitle,
           description: videoDescription,
-          video_url: videoPreview,
-          thumbnail_url: videoPreview,
-          duration: 0
+          filename: videoFile.name,
+          total_size: videoFile.size,
+          chunk_size: CHUNK_SIZE
         })
       });
+      const init = await initResponse.json();
+      if (!initResponse.ok) {
+        alert(`Ошибка: ${init.error}`);
+        return;
+      }
+
+      for (let index = 0; index < init.chunk_count; index++) {
+        const chunk = await videoFile.slice(index * CHUNK_SIZE, (index + 1) * CHUNK_SIZE).arrayBuffer();
+        const sha256 = toHex(await crypto.subtle.digest('SHA-256', chunk));
+        const body = toBase64(chunk);
+        for (let attempt = 1; ; attempt++) {
+          const chunkResponse = await fetch(
+            `${UPLOAD_API}?action=chunk&upload_id=${init.upload_id}&index=${index}`,
+            { method: 'PUT', headers: { ...auth, 'Content-Type': 'text/plain', 'X-Chunk-Sha256': sha256 }, body }
+          ).catch(() => null);
+          if (chunkResponse?.ok) break;
+          if (attempt >= CHUNK_RETRIES) {
+            const error = chunkResponse ? (await chunkResponse.json()).error : 'сеть недоступна';
+            alert(`Ошибка загрузки части ${index + 1}: ${error}`);
+            return;
+          }
+        }
+        setUploadProgress(Math.round(((index + 1) / init.chunk_count) * 100));
+      }
 
+      const response = await fetch(`${UPLOAD_API}?action=complete&upload_id=${init.upload_id}`, {
+        method: 'POST',
+        headers: auth
+      });
       const data = await response.json();
       
       if (response.ok) {
@@ -103,7 +146,7 @@ export default function Studio() {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
-          'X-User-Id': user.id.toString()
+          'Authorization': `Bearer ${user.token}`
         },
         body: JSON.stringify({
           title: streamTitle,
@@ -256,7 +299,7 @@ export default function Studio() {
                   {uploading ? (
                     <>
                       <Icon name="Loader2" size={18} className="mr-2 animate-spin" />
-                      Загрузка...
+                      Загрузка... {uploadProgress}%
                     </>
                   ) : (
                     <>
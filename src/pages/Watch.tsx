@@ -55,14 +55,20 @@ export default function Watch() {
     const user = JSON.parse(userString);
     
     try {
-      await fetch(`${API_URL}?action=like`, {
+      const response = await fetch(`${API_URL}?action=like`, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: {
+          'Content-Type': 'application/json',
+          'Authorization': `Bearer ${user.token}`
+        },
         body: JSON.stringify({
-          user_id: user.id,
           stream_id: parseInt(videoId || '0')
         })
       });
+      if (response.status === 401) {
+        alert('Сессия истекла, войдите снова');
+        return;
+      }
       setLiked(!liked);
       if (disliked) setDisliked(false);
       if (video) {